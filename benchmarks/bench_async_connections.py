@@ -0,0 +1,112 @@
+'''
+Holds many idle client connections open against server.py and against
+async_server.py while sending requests on new connections, and prints
+how long the requests took and the number of threads the server process
+peaked at.
+
+Usage: python3 benchmarks/bench_async_connections.py [idle connections] [requests]
+'''
+import asyncio
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+URL_RE = re.compile(r' \* Running on http://([^:]+):(\d+)/')
+
+
+def start(script):
+    '''
+    Start a server script, returning the process, host and port
+    '''
+    server = subprocess.Popen([sys.executable, os.path.join(SRC, script)],
+                              stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    match = URL_RE.match(server.stderr.readline().decode())
+    return server, match.group(1), int(match.group(2))
+
+
+def threads_of(pid):
+    '''
+    Number of threads the process has now
+    '''
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('Threads:'):
+                return int(line.split()[1])
+    return 0
+
+
+async def request(host, port):
+    '''
+    Send one request on a new connection and read the whole response
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'GET /echo?data=bench HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n')
+    response = await reader.read()
+    writer.close()
+    assert response.endswith(b'{"data": "bench"}'), response
+
+
+async def load(host, port, connections, count):
+    '''
+    Open connections idle clients, then send count requests while they stay open.
+    Returns the seconds each request took
+    '''
+    idle = [await asyncio.open_connection(host, port) for _ in range(connections)]
+    # give the server time to take every connection in
+    await asyncio.sleep(1)
+    times = []
+    for _ in range(count):
+        begin = time.perf_counter()
+        await request(host, port)
+        times.append(time.perf_counter() - begin)
+    for _, writer in idle:
+        writer.close()
+    return times
+
+
+def run(script, connections, count):
+    '''
+    Median and worst request time and peak server threads for one server
+    '''
+    server, host, port = start(script)
+    peak = [0]
+    stop = threading.Event()
+
+    def watch():
+        while not stop.is_set():
+            peak[0] = max(peak[0], threads_of(server.pid))
+            time.sleep(0.01)
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    try:
+        times = asyncio.run(load(host, port, connections, count))
+    finally:
+        stop.set()
+        watcher.join()
+        server.send_signal(signal.SIGINT)
+        server.wait(5)
+    times.sort()
+    return times[len(times) // 2], times[-1], peak[0]
+
+
+def main():
+    '''
+    Print request times and thread counts for both servers
+    '''
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f'{connections} idle connections, {count} requests')
+    for script in ('server.py', 'async_server.py'):
+        median, worst, threads = run(script, connections, count)
+        print(f'{script:16} median {median * 1000:7.2f} ms  worst {worst * 1000:8.2f} ms  '
+              f'{threads:5} threads at peak')
+
+
+if __name__ == '__main__':
+    main()
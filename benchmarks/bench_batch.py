@@ -0,0 +1,75 @@
+'''
+Shows a channel the way a client does, its details, a page of messages
+and every member's profile, through the Flask app: one request per call,
+then all of them in one /batch request. Prints the time per view.
+
+Usage: python3 benchmarks/bench_batch.py [members] [views]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from auth import auth_register
+from channel import channel_join
+from channels import channels_create
+from message import message_send
+from other import clear
+from server import APP
+
+
+def timed(call, repeat):
+    '''
+    Milliseconds per call
+    '''
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - begin) * 1000 / repeat
+
+
+def main():
+    '''
+    Print the cost of a channel view made of separate requests and of one batch
+    '''
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    clear()
+    owner = auth_register("bench@gmail.com", "valid_password", "Bench", "Mark")
+    token = owner['token']
+    channel_id = channels_create(token, 'bench', True)['channel_id']
+    u_ids = [owner['u_id']]
+    for i in range(members - 1):
+        user = auth_register(f"bench{i}@gmail.com", "valid_password", "Bench", f"User{i}")
+        channel_join(user['token'], channel_id)
+        u_ids.append(user['u_id'])
+    for i in range(50):
+        message_send(token, channel_id, f'message {i}')
+
+    client = APP.test_client()
+
+    def separate():
+        client.get('/channel/details', query_string={'token': token, 'channel_id': channel_id})
+        client.get('/channel/messages', query_string={'token': token, 'channel_id': channel_id, 'start': 0})
+        for u_id in u_ids:
+            client.get('/user/profile', query_string={'token': token, 'u_id': u_id})
+
+    operations = [{'op': 'channel/details', 'args': {'channel_id': channel_id}},
+                  {'op': 'channel/messages', 'args': {'channel_id': channel_id, 'start': 0}}]
+    operations += [{'op': 'user/profile', 'args': {'u_id': u_id}} for u_id in u_ids]
+
+    def batched():
+        response = client.post('/batch', json={'token': token, 'operations': operations})
+        assert response.status_code == 200
+
+    print(f'{members} members, {len(operations)} calls per view, {count} views')
+    print(f'separate requests: {timed(separate, count):8.3f} ms')
+    print(f'one /batch:        {timed(batched, count):8.3f} ms')
+    clear()
+
+
+if __name__ == '__main__':
+    main()
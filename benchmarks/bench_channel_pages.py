@@ -0,0 +1,53 @@
+'''
+Measures channel_messages pages near the newest and the oldest end of
+channels of different lengths, by offset and by before_message_id.
+
+Usage: python3 benchmarks/bench_channel_pages.py
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from auth import auth_register
+from channels import channels_create
+from channel import channel_messages
+from message import message_send
+from other import clear
+
+SIZES = (1000, 10000, 100000)
+REPEAT = 200
+
+
+def timed(func):
+    '''
+    Microseconds per call of func
+    '''
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+def main():
+    '''
+    Print page times for each channel length
+    '''
+    print(f'{"messages":>10}{"newest":>10}{"oldest":>10}{"before id":>12}{"after id":>12}  (us per page)')
+    for size in SIZES:
+        clear()
+        token = auth_register('user@gmail.com', 'valid_password', 'First', 'Last')['token']
+        channel_id = channels_create(token, 'channel', True)['channel_id']
+        sent = [message_send(token, channel_id, f'message {i}')['message_id'] for i in range(size)]
+        newest = timed(lambda: channel_messages(token, channel_id, 0))
+        oldest = timed(lambda: channel_messages(token, channel_id, size - 50))
+        before = timed(lambda: channel_messages(token, channel_id, before_message_id=sent[50]))
+        after = timed(lambda: channel_messages(token, channel_id, after_message_id=sent[0]))
+        print(f'{size:10}{newest:10.1f}{oldest:10.1f}{before:12.1f}{after:12.1f}')
+    clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Sends messages from several threads at once, either all to one channel or
+each to its own channel, checks no message_id was handed out twice and
+prints the throughput and how often the locks had to be waited on.
+
+Usage: python3 benchmarks/bench_concurrent_sends.py [threads] [messages per thread]
+'''
+import os
+import sys
+import time
+from threading import Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from auth import auth_register
+from channels import channels_create
+from message import message_send
+from other import clear
+from concurrency import lock_stats
+
+
+def run(threads, per_thread, shared):
+    '''
+    Send per_thread messages from each thread, returning sends per second
+    '''
+    clear()
+    user = auth_register("bench@gmail.com", "valid_password", "Bench", "Mark")
+    channel_ids = [channels_create(user['token'], f'channel{i}', True)['channel_id']
+                   for i in range(1 if shared else threads)]
+    sent = []
+
+    def send(i):
+        channel_id = channel_ids[0 if shared else i]
+        for j in range(per_thread):
+            sent.append(message_send(user['token'], channel_id, f'message {j}')['message_id'])
+
+    workers = [Thread(target=send, args=(i,)) for i in range(threads)]
+    begin = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - begin
+    assert len(set(sent)) == threads * per_thread, 'duplicate message ids'
+    return threads * per_thread / elapsed
+
+
+def main():
+    '''
+    Print sends per second and lock contention for one shared channel and a channel per thread
+    '''
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    for shared in (True, False):
+        before = lock_stats()['channels']
+        rate = run(threads, per_thread, shared)
+        after = lock_stats()['channels']
+        waited = after['contended'] - before['contended']
+        wait_ms = after['wait_ms'] - before['wait_ms']
+        label = 'one channel' if shared else 'channel per thread'
+        print(f'{label:20} {rate:9.0f} sends/s  {waited:6} waits  {wait_ms:9.1f} ms waiting')
+    clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+Polls /channel/messages, /channel/details and /users/all through the Flask
+app with and without If-None-Match, and prints the time and bytes per
+request of a full response and of a 304.
+
+Usage: python3 benchmarks/bench_conditional_get.py [users] [polls]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from auth import auth_register
+from channel import channel_join
+from channels import channels_create
+from message import message_send
+from other import clear
+from server import APP
+
+
+def poll(client, path, args, count, etag=None):
+    '''
+    Microseconds and bytes per request of count GETs of path
+    '''
+    headers = {'If-None-Match': etag} if etag else {}
+    size = 0
+    begin = time.perf_counter()
+    for _ in range(count):
+        response = client.get(path, query_string=args, headers=headers)
+        size = len(response.data)
+    return (time.perf_counter() - begin) * 1e6 / count, size, response.status_code
+
+
+def main():
+    '''
+    Print the cost of full and not modified responses
+    '''
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    clear()
+    owner = auth_register("bench@gmail.com", "valid_password", "Bench", "Mark")
+    channel_id = channels_create(owner['token'], 'bench', True)['channel_id']
+    for i in range(users):
+        user = auth_register(f"bench{i}@gmail.com", "valid_password", "Bench", f"User{i}")
+        channel_join(user['token'], channel_id)
+    for i in range(50):
+        message_send(owner['token'], channel_id, f'message {i}')
+
+    client = APP.test_client()
+    print(f'{users} users in the channel, 50 messages, {count} polls each')
+    for path, args in (('/channel/messages', {'channel_id': channel_id, 'start': 0}),
+                       ('/channel/details', {'channel_id': channel_id}),
+                       ('/users/all', {})):
+        args = dict(args, token=owner['token'])
+        etag = client.get(path, query_string=args).headers['ETag']
+        full, full_size, _ = poll(client, path, args, count)
+        cached, cached_size, status = poll(client, path, args, count, etag)
+        assert status == 304
+        print(f'{path:18} 200: {full:8.1f} us {full_size:7} bytes   304: {cached:8.1f} us {cached_size:3} bytes')
+    clear()
+
+
+if __name__ == '__main__':
+    main()
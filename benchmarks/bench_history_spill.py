@@ -0,0 +1,91 @@
+'''
+Measures the memory held by one long channel history kept fully in memory
+against the same history with only a few segments resident, and the cost
+of reading a page that has to be read back from the spill file. Then sends
+to more channels in turn than have their newest segment in memory, and
+prints the time per send and how big the spill file gets.
+
+Usage: python3 benchmarks/bench_history_spill.py [messages] [resident segments]
+'''
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+import config
+import history
+from history import ChannelHistory
+from message_record import Message
+
+PAGE = 50
+
+
+def build(count):
+    '''
+    Fill a history, returning it and the bytes it holds
+    '''
+    tracemalloc.start()
+    messages = ChannelHistory()
+    for i in range(count):
+        messages.append(Message(i % 100, i, 1600000000 + i, f'message number {i} with some text'))
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return messages, held
+
+
+def page_time(messages, start):
+    '''
+    Microseconds to read a page of PAGE messages, newest first, from start
+    '''
+    begin = time.perf_counter()
+    for message in messages.page(start, PAGE):
+        message.to_dict()
+    return (time.perf_counter() - begin) * 1e6
+
+
+def round_robin(channels, count):
+    '''
+    Microseconds per message appended to channels in turn, and the spill file's size
+    '''
+    histories = [ChannelHistory() for _ in range(channels)]
+    begin = time.perf_counter()
+    for i in range(count):
+        histories[i % channels].append(Message(i % 100, i, 1600000000 + i, 'x' * 50))
+    return (time.perf_counter() - begin) * 1e6 / count, history._spill.size
+
+
+def main():
+    '''
+    Print memory held and page read times with and without a budget
+    '''
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    config.RESIDENT_SEGMENTS = 10 ** 9
+    _, unbounded = build(count)
+    history.clear()
+
+    config.RESIDENT_SEGMENTS = budget
+    messages, bounded = build(count)
+    newest = page_time(messages, 0)
+    oldest = page_time(messages, count - PAGE)
+    again = page_time(messages, count - PAGE)
+
+    print(f'{count} messages, segments of {config.HISTORY_SEGMENT_SIZE}')
+    print(f'all resident:             {unbounded / 1e6:8.1f} MB')
+    print(f'{budget} segments resident:     {bounded / 1e6:8.1f} MB')
+    print(f'newest page:              {newest:8.0f} us')
+    print(f'oldest page, spilled:     {oldest:8.0f} us')
+    print(f'oldest page, read back:   {again:8.0f} us')
+    history.clear()
+
+    send, spill_size = round_robin(budget * 5, count // 10)
+    print(f'sends to {budget * 5} channels in turn: {send:8.1f} us each, spill file {spill_size / 1e6:.1f} MB')
+    history.clear()
+
+
+if __name__ == '__main__':
+    main()
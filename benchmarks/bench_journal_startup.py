@@ -0,0 +1,100 @@
+'''
+Measures how long the server takes to load its data at startup, replaying
+the whole journal compared to loading a snapshot and replaying a short tail.
+
+Usage: python3 benchmarks/bench_journal_startup.py [users] [channels] [messages]
+'''
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+import config
+import persistence
+import session
+import store
+from auth import auth_register
+from channels import channels_create
+from channel import channel_join
+from message import message_send
+from other import clear
+
+# records written after the snapshot
+TAIL = 1000
+
+
+def populate(users, channels, messages):
+    '''
+    Fill data through the normal functions so every change is journaled
+    '''
+    tokens = [
+        auth_register(f'user{i}@gmail.com', 'valid_password', 'First', f'Last{i}')['token']
+        for i in range(users)
+    ]
+    channel_ids = [
+        channels_create(tokens[i % users], f'channel {i}', True)['channel_id']
+        for i in range(channels)
+    ]
+    for i, token in enumerate(tokens[1:], 1):
+        channel_join(token, channel_ids[i % channels])
+    for i in range(messages):
+        channel_id = channel_ids[i % channels]
+        message_send(tokens[0], channel_id, f'message number {i} in channel {channel_id}')
+    return tokens[0], channel_ids
+
+
+def timed_start():
+    '''
+    Seconds taken to load the saved data, starting from nothing in memory
+    '''
+    persistence.stop()
+    store.clear()
+    session.clear()
+    start = time.perf_counter()
+    persistence.start()
+    return time.perf_counter() - start
+
+
+def main():
+    '''
+    Print startup times for a full replay and for snapshot plus tail
+    '''
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    messages = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.JOURNAL_PATH = os.path.join(directory, 'flockr.journal')
+        config.JOURNAL_FSYNC = 'never'
+        config.SNAPSHOT_EVERY = 10 ** 9
+        clear()
+        persistence.start()
+
+        populate_start = time.perf_counter()
+        token, channel_ids = populate(users, channels, messages)
+        populate_time = time.perf_counter() - populate_start
+        persistence.stop()
+        journal_size = os.path.getsize(config.JOURNAL_PATH)
+
+        replay_time = timed_start()
+
+        persistence.snapshot()
+        for i in range(TAIL):
+            message_send(token, channel_ids[i % channels], f'tail message {i}')
+        persistence.stop()
+        snapshot_size = os.path.getsize(config.JOURNAL_PATH + '.snapshot')
+
+        snapshot_time = timed_start()
+        persistence.stop()
+
+    print(f'users {users}, channels {channels}, messages {messages}')
+    print(f'writing everything to the journal:   {populate_time:7.2f}s')
+    print(f'journal only ({journal_size / 1e6:.1f} MB):          {replay_time:7.2f}s to start')
+    print(f'snapshot ({snapshot_size / 1e6:.1f} MB) + {TAIL} record tail: {snapshot_time:7.2f}s to start')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+'''
+Measures startup from a binary snapshot, where channel histories are only
+loaded when first used, against loading every history straight away.
+
+Usage: python3 benchmarks/bench_lazy_startup.py [users] [channels] [messages]
+'''
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+import config
+import persistence
+import session
+import store
+from global_dic import data
+from auth import auth_register
+from channels import channels_create
+from channel import channel_messages
+from message import message_send
+from other import clear
+
+
+def main():
+    '''
+    Print the startup time, the cost of the first touch of a channel,
+    and the time to load every channel
+    '''
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    messages = int(sys.argv[3]) if len(sys.argv) > 3 else 500000
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.JOURNAL_PATH = os.path.join(directory, 'flockr.journal')
+        config.JOURNAL_FSYNC = 'never'
+        config.SNAPSHOT_EVERY = 10 ** 9
+        clear()
+        persistence.start()
+
+        tokens = [
+            auth_register(f'user{i}@gmail.com', 'valid_password', 'First', f'Last{i}')['token']
+            for i in range(users)
+        ]
+        channel_ids = [
+            channels_create(tokens[i % users], f'channel {i}', True)['channel_id']
+            for i in range(channels)
+        ]
+        for i in range(messages):
+            channel_id = channel_ids[i % channels]
+            message_send(tokens[channel_id % users], channel_id, f'message number {i}')
+        persistence.snapshot()
+        persistence.stop()
+        snapshot_size = os.path.getsize(config.JOURNAL_PATH + '.snapshot')
+
+        store.clear()
+        session.clear()
+        start = time.perf_counter()
+        persistence.start()
+        startup_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        channel_messages(tokens[0], channel_ids[0], 0)
+        first_touch = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for channel in data['channels']:
+            store.history(channel)
+        load_all = time.perf_counter() - start
+        persistence.stop()
+
+    print(f'users {users}, channels {channels}, messages {messages}, snapshot {snapshot_size / 1e6:.1f} MB')
+    print(f'startup with lazy histories:    {startup_time:7.2f}s')
+    print(f'first channel_messages call:    {first_touch * 1000:7.2f}ms')
+    print(f'loading every history after it: {load_all:7.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+'''
+Measures how much memory a channel history takes with the old dict
+messages compared to message_record.Message, and how much the search
+index takes for the same messages.
+
+Usage: python3 benchmarks/bench_message_memory.py [number of messages]
+'''
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from message_record import Message
+import search_index
+
+
+def dict_message(message_id, text):
+    '''
+    A message in the shape message_send used to store
+    '''
+    return {
+        'u_id': message_id % 50,
+        'message_id': message_id,
+        'time_created': 1600000000 + message_id,
+        'message': text,
+        'reacts': [{
+            'react_id': 1,
+            'u_ids': [],
+            'is_this_user_reacted': False
+        }],
+        'is_pinned': False
+    }
+
+
+def record_message(message_id, text):
+    '''
+    The same message as a Message record
+    '''
+    return Message(message_id % 50, message_id, 1600000000 + message_id, text)
+
+
+def measure(build, texts):
+    '''
+    Bytes allocated to hold one history built with build, not counting the texts
+    '''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    history = [build(message_id, text) for message_id, text in enumerate(texts)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del history
+    return after - before
+
+
+def measure_index(texts):
+    '''
+    Bytes allocated to index every text for search
+    '''
+    search_index.clear()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for message_id, text in enumerate(texts):
+        search_index.add_message(message_id, text)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    search_index.clear()
+    return after - before
+
+
+def main():
+    '''
+    Print bytes per message for both representations
+    '''
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    # texts are shared by both runs so only the message overhead is measured
+    texts = [f'message number {i}' for i in range(count)]
+
+    dict_bytes = measure(dict_message, texts)
+    record_bytes = measure(record_message, texts)
+    index_bytes = measure_index(texts)
+
+    print(f'messages:         {count}')
+    print(f'dict messages:    {dict_bytes / count:8.1f} bytes/message')
+    print(f'Message records:  {record_bytes / count:8.1f} bytes/message')
+    print(f'reduction:        {dict_bytes / record_bytes:8.2f}x')
+    print(f'search index:     {index_bytes / count:8.1f} bytes/message')
+
+
+if __name__ == '__main__':
+    main()
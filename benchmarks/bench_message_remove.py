@@ -0,0 +1,49 @@
+'''
+Measures message_remove as channels get longer, removing every other
+message from the oldest half of the channel like a bulk moderation pass.
+
+Usage: python3 benchmarks/bench_message_remove.py
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from auth import auth_register
+from channels import channels_create
+from channel import channel_messages
+from message import message_send, message_remove
+from other import clear
+
+SIZES = (10000, 100000, 300000)
+
+
+def main():
+    '''
+    Print microseconds per removal and per page afterwards for each channel length
+    '''
+    print(f'{"messages":>10}{"removals":>10}{"us/remove":>12}{"us/page":>10}')
+    for size in SIZES:
+        clear()
+        token = auth_register('user@gmail.com', 'valid_password', 'First', 'Last')['token']
+        channel_id = channels_create(token, 'channel', True)['channel_id']
+        sent = [message_send(token, channel_id, f'message {i}')['message_id'] for i in range(size)]
+        removing = sent[:size // 2:2]
+
+        start = time.perf_counter()
+        for message_id in removing:
+            message_remove(token, message_id)
+        per_remove = (time.perf_counter() - start) / len(removing) * 1e6
+
+        start = time.perf_counter()
+        for skip in range(0, size // 2, size // 200):
+            channel_messages(token, channel_id, skip)
+        per_page = (time.perf_counter() - start) / 100 * 1e6
+        print(f'{size:10}{len(removing):10}{per_remove:12.1f}{per_page:10.1f}')
+    clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+Schedules many delayed callbacks, first with a threading.Timer each as
+message_sendlater used to, then through the scheduler, and prints the
+threads and memory held while they wait and how late they ran.
+
+Usage: python3 benchmarks/bench_scheduler.py [jobs] [delay seconds]
+'''
+import os
+import sys
+import time
+import tracemalloc
+from threading import Event, Lock, Timer, active_count
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+import scheduler
+
+
+def run(jobs, delay, start_job):
+    '''
+    Schedule jobs callbacks delay seconds away with start_job(delay, callback, due),
+    returning the threads and bytes held while waiting and the worst lateness
+    '''
+    done = Event()
+    lock = Lock()
+    fired = [0, 0.0]
+
+    def callback(due):
+        with lock:
+            fired[0] += 1
+            fired[1] = max(fired[1], time.time() - due)
+            if fired[0] == jobs:
+                done.set()
+
+    tracemalloc.start()
+    for _ in range(jobs):
+        start_job(delay, callback, time.time() + delay)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    threads = active_count()
+    done.wait()
+    return threads, held, fired[1]
+
+
+def start_timer(delay, callback, due):
+    Timer(delay, callback, args=[due]).start()
+
+
+def start_scheduled(delay, callback, due):
+    scheduler.schedule(delay, callback, due)
+
+
+def main():
+    '''
+    Print threads, memory and lag for Timers and for the scheduler
+    '''
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    for label, start_job in (('threading.Timer', start_timer), ('scheduler', start_scheduled)):
+        threads, held, lag = run(jobs, delay, start_job)
+        print(f'{label:16} {threads:6} threads  {held / 1e6:7.1f} MB  {lag * 1000:8.1f} ms worst lag')
+
+
+if __name__ == '__main__':
+    main()
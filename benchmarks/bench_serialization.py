@@ -0,0 +1,71 @@
+'''
+Encodes pages of channel messages every way a response can be made and
+prints the time per page: the json module on fresh dicts (what jsonify
+did), each installed encoder on fresh dicts, and joining the messages'
+cached JSON. Then polls /channel/messages through the Flask app.
+
+Usage: python3 benchmarks/bench_serialization.py [messages] [page size]
+'''
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from auth import auth_register
+from channel import channel_messages, channel_messages_json
+from channels import channels_create
+from message import message_send, message_react
+from other import clear
+from server import APP
+import serialization
+
+
+def timed(call, repeat):
+    '''
+    Microseconds per call
+    '''
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - begin) * 1e6 / repeat
+
+
+def main():
+    '''
+    Print the cost of each way of encoding a page
+    '''
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    repeat = 500
+
+    clear()
+    user = auth_register("bench@gmail.com", "valid_password", "Bench", "Mark")
+    token = user['token']
+    channel_id = channels_create(token, 'bench', True)['channel_id']
+    for i in range(count):
+        sent = message_send(token, channel_id, f'message {i} ' + 'x' * 80)
+        if i % 3 == 0:
+            message_react(token, sent['message_id'], 1)
+
+    print(f'{count} messages, pages of {limit}, encoder {serialization.ENCODER}')
+    page = lambda: channel_messages(token, channel_id, 0, limit=limit)
+    print(f'{"json.dumps, as before":24} {timed(lambda: json.dumps(page()), repeat):8.1f} us')
+    for name in serialization.ENCODERS:
+        if serialization.pick_encoder(name) == name:
+            encode = serialization.ENCODERS[name]
+            print(f'{name + " encoder on dicts":24} {timed(lambda: encode(page()), repeat):8.1f} us')
+    cached = timed(lambda: channel_messages_json(token, channel_id, 0, limit=limit), repeat)
+    print(f'{"cached message JSON":24} {cached:8.1f} us')
+
+    client = APP.test_client()
+    args = {'token': token, 'channel_id': channel_id, 'start': 0, 'limit': limit}
+    polled = timed(lambda: client.get('/channel/messages', query_string=args), repeat)
+    print(f'{"GET /channel/messages":24} {polled:8.1f} us')
+    clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Runs a standup in every one of many channels at once, sending a few
+messages to each, and prints the cost of each standup call, how late the
+standups were posted and checks every channel got exactly its own summary.
+
+Usage: python3 benchmarks/bench_standups.py [channels] [messages per standup]
+'''
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from auth import auth_register
+from channel import channel_messages
+from channels import channels_create
+from other import clear
+from standup import standup_active, standup_send, standup_start
+import scheduler
+
+LENGTH = 3
+
+
+def timed(calls):
+    '''
+    Microseconds per call of calls, a list of no argument functions
+    '''
+    begin = time.perf_counter()
+    for call in calls:
+        call()
+    return (time.perf_counter() - begin) * 1e6 / max(1, len(calls))
+
+
+def main():
+    '''
+    Print per call costs, posting lag and check every summary
+    '''
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    per_standup = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    clear()
+    user = auth_register("bench@gmail.com", "valid_password", "Bench", "Mark")
+    token = user['token']
+    channel_ids = [channels_create(token, f'channel{i}', True)['channel_id'] for i in range(count)]
+
+    # standup_start prints its start and finish times
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = timed([lambda c=c: standup_start(token, c, LENGTH) for c in channel_ids])
+    send = timed([lambda c=c, j=j: standup_send(token, c, f'update {j}')
+                  for c in channel_ids for j in range(per_standup)])
+    active = timed([lambda c=c: standup_active(token, c) for c in channel_ids])
+
+    time.sleep(LENGTH + 1)
+    while scheduler.stats()['queue_depth'] or scheduler.stats()['running']:
+        time.sleep(0.1)
+    stats = scheduler.stats()
+
+    expected = ''.join(f'benchmark: update {j}\n' for j in range(per_standup))
+    for channel_id in channel_ids:
+        messages = channel_messages(token, channel_id, 0)['messages']
+        assert [message['message'] for message in messages] == [expected], channel_id
+
+    print(f'{count} channels with a standup each, {per_standup} messages per standup')
+    print(f'standup_start:   {start:8.1f} us')
+    print(f'standup_send:    {send:8.1f} us')
+    print(f'standup_active:  {active:8.1f} us')
+    print(f'worst posting lag: {stats["max_lag_ms"]:8.1f} ms')
+    clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+Compares the existing endpoints running purely in memory with the same
+endpoints writing every change through to the journal or to SQLite, and
+how long each backend takes to load the data back at startup.
+
+Usage: python3 benchmarks/bench_storage_backends.py [users] [channels] [messages]
+'''
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+import config
+import persistence
+import session
+import store
+from auth import auth_register
+from channels import channels_create, channels_list
+from channel import channel_join, channel_messages, channel_details
+from message import message_send, message_edit, message_react
+from other import clear, search
+
+
+def timed(label, results, func, calls):
+    '''
+    Run func(i) for i in range(calls) and store the microseconds per call
+    '''
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    results[label] = (time.perf_counter() - start) / calls * 1e6
+    return results[label]
+
+
+def run(users, channels, messages):
+    '''
+    Time each endpoint with whatever backend is configured. Returns {endpoint: us per call}
+    '''
+    clear()
+    persistence.start()
+    results = {}
+    tokens = []
+    timed('auth_register', results, lambda i: tokens.append(
+        auth_register(f'user{i}@gmail.com', 'valid_password', 'First', f'Last{i}')['token']), users)
+    channel_ids = []
+    timed('channels_create', results, lambda i: channel_ids.append(
+        channels_create(tokens[i % users], f'channel {i}', True)['channel_id']), channels)
+    timed('channel_join', results,
+          lambda i: channel_join(tokens[i + 1], channel_ids[(i + 1) % channels]), users - 1)
+    message_ids = []
+    timed('message_send', results, lambda i: message_ids.append(message_send(
+        tokens[0], channel_ids[i % channels], f'message number {i}')['message_id']), messages)
+    timed('message_edit', results,
+          lambda i: message_edit(tokens[0], message_ids[i], f'edited message {i}'), messages // 10)
+    timed('message_react', results,
+          lambda i: message_react(tokens[0], message_ids[i], 1), messages // 10)
+    timed('channel_messages', results,
+          lambda i: channel_messages(tokens[0], channel_ids[i % channels], 0), 1000)
+    timed('channel_details', results,
+          lambda i: channel_details(tokens[0], channel_ids[i % channels]), 1000)
+    timed('channels_list', results, lambda i: channels_list(tokens[i % users]), 1000)
+    timed('search', results, lambda i: search(tokens[0], f'number {i}'), 200)
+
+    persistence.stop()
+    store.clear()
+    session.clear()
+    start = time.perf_counter()
+    persistence.start()
+    results['startup (s)'] = time.perf_counter() - start
+    persistence.stop()
+    return results
+
+
+def main():
+    '''
+    Print a table of microseconds per call for each backend
+    '''
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    messages = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    config.JOURNAL_FSYNC = 'never'
+    config.SNAPSHOT_EVERY = 10 ** 9
+    table = {}
+    with tempfile.TemporaryDirectory() as directory:
+        table['memory'] = run(users, channels, messages)
+
+        config.JOURNAL_PATH = os.path.join(directory, 'flockr.journal')
+        table['journal'] = run(users, channels, messages)
+        config.JOURNAL_PATH = None
+
+        config.SQLITE_PATH = os.path.join(directory, 'flockr.db')
+        table['sqlite'] = run(users, channels, messages)
+        config.SQLITE_PATH = None
+    # nothing to load when everything is only in memory
+    table['memory']['startup (s)'] = 0.0
+
+    print(f'users {users}, channels {channels}, messages {messages}, microseconds per call')
+    print(f'{"":18}' + ''.join(f'{name:>12}' for name in table))
+    for endpoint in table['memory']:
+        print(f'{endpoint:18}' + ''.join(f'{table[name][endpoint]:12.1f}' for name in table))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''
+Registers many users and prints the cost of users_all building the list,
+returning the cached list, and returning one page of it. Then times
+/users/all responses through the Flask app: the whole list and one page,
+encoding the cached list as before, joining the cached JSON, and the
+whole GET.
+
+Usage: python3 benchmarks/bench_users_all.py [users] [page size]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from auth import auth_register
+from other import clear, users_all, users_all_json
+from serialization import json_response
+from server import APP
+from user import user_profile_setname
+
+
+def timed(call, repeat):
+    '''
+    Milliseconds per call
+    '''
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - begin) * 1000 / repeat
+
+
+def main():
+    '''
+    Print the cost of rebuilt, cached and paged directories
+    '''
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    clear()
+    token = auth_register("bench@gmail.com", "valid_password", "Bench", "Mark")['token']
+    for i in range(count):
+        auth_register(f"bench{i}@gmail.com", "valid_password", "Bench", f"User{i}")
+
+    def rebuilt():
+        # any profile change makes the next call build the list again
+        user_profile_setname(token, "Bench", "Mark")
+        users_all(token)
+
+    rename = timed(lambda: user_profile_setname(token, "Bench", "Mark"), 20)
+    build = timed(rebuilt, 20) - rename
+    cached = timed(lambda: users_all(token), 200)
+    middle = users_all(token, count // 2)['next_cursor']
+    page = timed(lambda: users_all(token, limit, middle), 2000)
+
+    print(f'{count + 1} users')
+    print(f'build the list:        {build:8.3f} ms')
+    print(f'cached, every user:    {cached:8.3f} ms')
+    print(f'cached, page of {limit:<5}  {page:8.3f} ms')
+
+    client = APP.test_client()
+    everyone = {'token': token}
+    one_page = {'token': token, 'limit': limit, 'cursor': middle}
+    for name, args, repeat in (('every user', everyone, 50), (f'page of {limit}', one_page, 2000)):
+        # the response users_all made before its JSON was cached
+        with APP.test_request_context():
+            encoded = timed(lambda: json_response(
+                users_all(token, args.get('limit'), args.get('cursor'))).get_data(), repeat)
+        joined = timed(lambda: users_all_json(token, args.get('limit'), args.get('cursor')), repeat)
+        served = timed(lambda: client.get('/users/all', query_string=args).get_data(), repeat)
+        print(f'{name:12} encoded each time: {encoded:7.3f} ms   cached JSON: {joined:7.3f} ms'
+              f'   GET /users/all: {served:7.3f} ms')
+    clear()
+
+
+if __name__ == '__main__':
+    main()
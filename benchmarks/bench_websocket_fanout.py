@@ -0,0 +1,101 @@
+'''
+Opens many WebSockets to async_server.py for the members of one channel,
+sends messages to the channel and prints how long it took until every
+socket had received every message, and the server's thread count.
+
+Usage: python3 benchmarks/bench_websocket_fanout.py [sockets] [messages]
+'''
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from bench_async_connections import start, threads_of
+
+
+async def open_socket(host, port, token):
+    '''
+    Connect to the event socket and read the handshake response
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET /channels/socket?token={token} HTTP/1.1\r\nHost: bench\r\nUpgrade: websocket\r\n'
+                 'Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                 'Sec-WebSocket-Version: 13\r\n\r\n'.encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 101'), head
+    return reader, writer
+
+
+async def receive(reader, count):
+    '''
+    Read frames until count send events have arrived
+    '''
+    seen = 0
+    while seen < count:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = int.from_bytes(await reader.readexactly(2), 'big')
+        elif length == 127:
+            length = int.from_bytes(await reader.readexactly(8), 'big')
+        payload = await reader.readexactly(length)
+        if first & 0x0F == 0x1 and json.loads(payload)['type'] == 'send':
+            seen += 1
+
+
+async def fan_out(host, port, url, count, messages):
+    '''
+    Seconds from the first message sent until every socket got every message
+    '''
+    owner = requests.post(url + 'auth/register', json={
+        'email': 'bench@gmail.com', 'password': 'valid_password', 'name_first': 'Bench', 'name_last': 'Mark'}).json()
+    channel = requests.post(url + 'channels/create', json={
+        'token': owner['token'], 'name': 'bench', 'is_public': True}).json()
+    sockets = [await open_socket(host, port, owner['token']) for _ in range(count)]
+    receivers = [asyncio.ensure_future(receive(reader, messages)) for reader, _ in sockets]
+    loop = asyncio.get_running_loop()
+    session = requests.Session()
+
+    def send_all():
+        for i in range(messages):
+            session.post(url + 'message/send', json={
+                'token': owner['token'], 'channel_id': channel['channel_id'], 'message': f'message {i}'})
+
+    begin = time.perf_counter()
+    await loop.run_in_executor(None, send_all)
+    sent = time.perf_counter() - begin
+    await asyncio.gather(*receivers)
+    delivered = time.perf_counter() - begin
+    for _, writer in sockets:
+        writer.close()
+    return sent, delivered
+
+
+def main():
+    '''
+    Print the delivery time and thread count
+    '''
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    server, host, port = start('async_server.py')
+    url = f'http://{host}:{port}/'
+    try:
+        sent, delivered = asyncio.run(fan_out(host, port, url, count, messages))
+        threads = threads_of(server.pid)
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait(5)
+    print(f'{count} sockets, {messages} messages, {count * messages} frames delivered')
+    print(f'sending took      {sent * 1000:9.1f} ms')
+    print(f'all delivered in  {delivered * 1000:9.1f} ms  ({count * messages / delivered:,.0f} frames/s)')
+    print(f'server threads    {threads:9}')
+
+
+if __name__ == '__main__':
+    main()
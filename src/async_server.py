@@ -0,0 +1,408 @@
+'''
+Async Server
+Serves the same routes as server.py from a single asyncio event loop.
+Connections are coroutines, so idle and keep-alive clients cost no
+thread. Each request is handed to the Flask APP through its WSGI interface
+on a pool of config.ASYNC_WORKERS threads, so blocking work (sending
+email, downloading photos, the store's locks) never stalls the loop, and
+errors are turned into responses by the same handlers as server.py.
+
+/channel/stream and the /channels/socket WebSocket are the exceptions:
+they wait for events on the loop, so a waiting client holds no thread at all.
+
+Usage: python3 src/async_server.py [port]
+'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from io import BytesIO
+import sys
+from threading import Lock
+from urllib.parse import parse_qsl, unquote
+from channel import channel_stream_open, newer_events
+from channels import channels_feed_open
+import config
+import events
+import persistence
+import scheduler
+from server import APP, stream_since, wants_event_stream
+import websocket
+
+# largest request line and headers accepted
+MAX_HEAD = 64 * 1024
+
+# asyncio.Events of waiting streams to set, queued by the threads publishing events
+_to_wake = []
+_to_wake_lock = Lock()
+
+
+class BadRequest(Exception):
+    '''
+    Request that can't be parsed or is refused, the connection is closed
+    after answering it with code
+    '''
+
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.code = code
+
+
+def parse_head(head):
+    '''
+    Split the request line and headers. Returns (method, target, version, headers)
+    with header names lower case
+    '''
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise BadRequest(lines[0])
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise BadRequest(line)
+        headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def make_environ(method, target, version, headers, body, server, peer):
+    '''
+    WSGI environ for a request
+    '''
+    path, _, query = target.partition('?')
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote(path, 'latin-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': version,
+        'REMOTE_ADDR': peer[0] if peer else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def call_app(environ):
+    '''
+    Run APP on a request, in a worker thread. Returns (status, headers, body)
+    '''
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    result = APP(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started[0], started[1], body
+
+
+def encode_response(status, headers, body, keep_alive):
+    '''
+    Bytes of a whole HTTP/1.1 response
+    '''
+    head = [f'HTTP/1.1 {status}']
+    for name, value in headers:
+        if name.lower() not in ('content-length', 'connection'):
+            head.append(f'{name}: {value}')
+    head.append(f'Content-Length: {len(body)}')
+    head.append('Connection: ' + ('keep-alive' if keep_alive else 'close'))
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+def error_response(code):
+    '''
+    Response for a request that never reached APP
+    '''
+    status = HTTPStatus(code)
+    return encode_response(f'{code} {status.phrase}', [('Content-Type', 'text/plain')],
+                           status.phrase.encode(), False)
+
+
+def wake_all():
+    '''
+    Set every asyncio.Event queued by publishing threads, on the loop
+    '''
+    with _to_wake_lock:
+        woken = list(_to_wake)
+        _to_wake.clear()
+    for ready in woken:
+        ready.set()
+
+
+def watch(subscription):
+    '''
+    asyncio.Event set whenever an event is queued for the subscription
+    '''
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def wake():
+        # an event published to a thousand sockets calls into the loop once, not a thousand times
+        with _to_wake_lock:
+            _to_wake.append(ready)
+            if len(_to_wake) > 1:
+                return
+        try:
+            loop.call_soon_threadsafe(wake_all)
+        except RuntimeError:
+            # the loop has been closed, the server is stopping
+            pass
+
+    subscription.on_event = wake
+    return ready
+
+
+async def wait_for_events(subscription, ready, last_id, timeout):
+    '''
+    Events newer than last_id, waiting up to timeout seconds for some.
+    ready is set by the subscription whenever an event is queued
+    '''
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        ready.clear()
+        found, last_id = newer_events(subscription.take(), last_id)
+        remaining = deadline - loop.time()
+        if found or remaining <= 0 or subscription.closed:
+            return found, last_id
+        try:
+            await asyncio.wait_for(ready.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def send_event_stream(writer, subscription, ready, found, last_id):
+    '''
+    Write Server-Sent Events until the client goes away or the user leaves the channel
+    '''
+    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                 b'Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n')
+    while True:
+        for event in found:
+            writer.write(event.sse().encode())
+        await writer.drain()
+        if subscription.closed:
+            return
+        found, last_id = await wait_for_events(subscription, ready, last_id, config.STREAM_HEARTBEAT)
+        if not found and not subscription.closed:
+            writer.write(b': keep-alive\n\n')
+
+
+async def serve_stream(writer, environ, headers):
+    '''
+    /channel/stream, served on the loop. Returns the response of a long-poll,
+    or None once an event stream has ended
+    '''
+    loop = asyncio.get_running_loop()
+    args = dict(parse_qsl(environ['QUERY_STRING']))
+    request_headers = {'Accept': headers.get('accept', '')}
+    if 'last-event-id' in headers:
+        request_headers['Last-Event-ID'] = headers['last-event-id']
+    try:
+        since = stream_since(args, request_headers)
+        timeout = min(float(args.get('timeout', config.STREAM_TIMEOUT)), config.STREAM_TIMEOUT)
+        last_id = events.last_event_id() if since is None else since
+        subscription, backlog = await loop.run_in_executor(
+            None, channel_stream_open, args['token'], int(args['channel_id']), since)
+    except Exception:  # pylint: disable=broad-except
+        # APP answers with the same error response as server.py
+        return await loop.run_in_executor(None, call_app, environ)
+
+    ready = watch(subscription)
+    try:
+        if wants_event_stream(request_headers):
+            found, last_id = newer_events(backlog, since or 0)
+            await send_event_stream(writer, subscription, ready, found, last_id)
+            return None
+        found, last_id = newer_events(backlog, last_id)
+        if not found and timeout > 0:
+            found, last_id = await wait_for_events(subscription, ready, last_id, timeout)
+        body = events.encode_events(found, last_id).encode()
+        return '200 OK', [('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*')], body
+    finally:
+        subscription.on_event = None
+        events.unsubscribe(subscription)
+
+
+async def serve_socket(reader, writer, environ, headers):
+    '''
+    /channels/socket upgraded to a WebSocket: every event of the user's
+    channels is written as a text frame until the client closes. Returns the
+    response if the request can't be upgraded, or None once the socket is closed
+    '''
+    loop = asyncio.get_running_loop()
+    key = headers.get('sec-websocket-key')
+    if not key or headers.get('sec-websocket-version') != '13':
+        return '400 Bad Request', [('Sec-WebSocket-Version', '13')], b'Bad WebSocket handshake'
+    try:
+        args = dict(parse_qsl(environ['QUERY_STRING']))
+        feed = await loop.run_in_executor(None, channels_feed_open, args['token'])
+    except Exception:  # pylint: disable=broad-except
+        # APP answers with the same error response as server.py
+        return await loop.run_in_executor(None, call_app, environ)
+
+    ready = watch(feed)
+    writer.write(websocket.handshake_response(key))
+    client = asyncio.ensure_future(websocket.read_frames(reader, writer))
+    # the client closing wakes the loop below as well
+    client.add_done_callback(lambda _: ready.set())
+    try:
+        while not client.done():
+            ready.clear()
+            for event in feed.take():
+                # the same bytes for every connection following the channel
+                writer.write(websocket.event_frame(event))
+            await writer.drain()
+            try:
+                await asyncio.wait_for(ready.wait(), config.STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                writer.write(websocket.encode_frame(websocket.OP_PING))
+        await writer.drain()
+    finally:
+        client.cancel()
+        feed.on_event = None
+        events.unsubscribe(feed)
+    return None
+
+
+async def read_request(reader):
+    '''
+    Read one request. Returns (method, target, version, headers, body), or None
+    if the client closed the connection or was idle for too long
+    :raises BadRequest: If the request can't be parsed, or its body is over config.ASYNC_MAX_BODY
+    '''
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), config.ASYNC_IDLE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise BadRequest('request head too long')
+    method, target, version, headers = parse_head(head[:-4])
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise BadRequest('chunked request bodies are not supported')
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise BadRequest('bad content-length')
+    if length < 0:
+        raise BadRequest('bad content-length')
+    if length > config.ASYNC_MAX_BODY:
+        raise BadRequest('request body too large', 413)
+    if length == 0:
+        return method, target, version, headers, b''
+    try:
+        # a client sending its body slowly is given as long as an idle one
+        body = await asyncio.wait_for(reader.readexactly(length), config.ASYNC_IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    return method, target, version, headers, body
+
+
+def wants_keep_alive(version, headers):
+    '''
+    Whether the client wants the connection kept open after this request
+    '''
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+async def handle_connection(reader, writer):
+    '''
+    Serve requests on a connection until either side closes it
+    '''
+    loop = asyncio.get_running_loop()
+    server = writer.get_extra_info('sockname')[:2]
+    peer = writer.get_extra_info('peername')
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except BadRequest as err:
+                writer.write(error_response(err.code))
+                break
+            except asyncio.IncompleteReadError:
+                writer.write(error_response(400))
+                break
+            if request is None:
+                break
+            method, target, version, headers, body = request
+            environ = make_environ(method, target, version, headers, body, server, peer)
+            if method == 'GET' and environ['PATH_INFO'] == '/channel/stream':
+                response = await serve_stream(writer, environ, headers)
+                if response is None:
+                    break
+            elif method == 'GET' and environ['PATH_INFO'] == '/channels/socket' and websocket.is_upgrade(headers):
+                response = await serve_socket(reader, writer, environ, headers)
+                if response is None:
+                    break
+            else:
+                response = await loop.run_in_executor(None, call_app, environ)
+            status, response_headers, response_body = response
+            keep_alive = wants_keep_alive(version, headers)
+            writer.write(encode_response(status, response_headers, response_body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    except asyncio.CancelledError:
+        # the server is stopping, asyncio would log every connection still open otherwise
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=0):
+    '''
+    Accept connections until cancelled
+    '''
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max(1, config.ASYNC_WORKERS)))
+    server = await asyncio.start_server(handle_connection, host, port, limit=MAX_HEAD,
+                                        backlog=config.ASYNC_BACKLOG)
+    host, port = server.sockets[0].getsockname()[:2]
+    # same line as the Flask server prints, so the http tests can find the url
+    print(f' * Running on http://{host}:{port}/ (Press CTRL+C to quit)', file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    '''
+    Load saved data and serve until interrupted
+    '''
+    persistence.start()
+    scheduler.resume()
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    try:
+        asyncio.run(serve(port=port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
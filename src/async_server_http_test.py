@@ -0,0 +1,282 @@
+'''
+Async Server HTTP Test
+'''
+import asyncio
+import os
+import re
+import signal
+import socket
+from subprocess import Popen, PIPE
+from time import sleep
+from urllib.parse import urlparse
+import json
+import pytest
+import requests
+from websocket import accept_key
+import async_server
+import config
+
+
+@pytest.fixture
+def url():
+    '''
+    Start the asyncio server and get its url
+    '''
+    url_re = re.compile(r' \* Running on ([^ ]*)')
+    server = Popen(["python3", "src/async_server.py"], stderr=PIPE, stdout=PIPE)
+    line = server.stderr.readline()
+    local_url = url_re.match(line.decode())
+    if local_url:
+        yield local_url.group(1)
+        # Terminate the server
+        server.send_signal(signal.SIGINT)
+        waited = 0
+        while server.poll() is None and waited < 5:
+            sleep(0.1)
+            waited += 0.1
+        if server.poll() is None:
+            server.kill()
+    else:
+        server.kill()
+        raise Exception("Couldn't get URL from local server")
+
+
+def test_async_echo(url):
+    resp = requests.get(url + 'echo', params={'data': 'hello'})
+    assert json.loads(resp.text) == {'data': 'hello'}
+    # errors are handled the same way as server.py
+    resp = requests.get(url + 'echo', params={'data': 'echo'})
+    assert resp.status_code == 400
+    assert resp.json()['code'] == 400
+
+
+def test_async_routes_keep_alive(url):
+    session = requests.Session()
+    session.delete(url + 'clear')
+    user = session.post(url + 'auth/register', json={
+        'email': 'validEmail@gmail.com',
+        'password': 'valid_password',
+        'name_first': 'Philgee',
+        'name_last': 'Vlad',
+    }).json()
+    channel = session.post(url + 'channels/create', json={
+        'token': user['token'],
+        'name': 'new_channel',
+        'is_public': True,
+    }).json()
+    for i in range(20):
+        session.post(url + 'message/send', json={
+            'token': user['token'],
+            'channel_id': channel['channel_id'],
+            'message': f'message {i}',
+        })
+    messages = session.get(url + 'channel/messages', params={
+        'token': user['token'],
+        'channel_id': channel['channel_id'],
+        'start': 0,
+    }).json()['messages']
+    assert [message['message'] for message in messages] == [f'message {i}' for i in range(19, -1, -1)]
+
+    resp = session.post(url + 'channel/join', json={'token': 'not a token', 'channel_id': 0})
+    assert resp.status_code == 400
+
+
+def test_async_many_idle_connections(url):
+    parsed = urlparse(url)
+    idle = [socket.create_connection((parsed.hostname, parsed.port)) for _ in range(300)]
+    try:
+        # the idle connections don't hold up anyone else
+        assert requests.get(url + 'echo', params={'data': 'busy'}, timeout=5).json() == {'data': 'busy'}
+        # and each of them can still be served
+        for sock in idle[:10]:
+            sock.sendall(b'GET /echo?data=late HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+            response = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+            assert response.startswith(b'HTTP/1.1 200')
+            assert response.endswith(b'{"data": "late"}')
+    finally:
+        for sock in idle:
+            sock.close()
+
+
+def test_async_bad_request(url):
+    parsed = urlparse(url)
+    with socket.create_connection((parsed.hostname, parsed.port)) as sock:
+        sock.sendall(b'nonsense\r\n\r\n')
+        assert sock.recv(4096).startswith(b'HTTP/1.1 400')
+
+
+def test_async_body_too_large(url):
+    parsed = urlparse(url)
+    with socket.create_connection((parsed.hostname, parsed.port)) as sock:
+        # refused before any of the body is read
+        sock.sendall(b'POST /echo HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n\r\n'
+                     % (config.ASYNC_MAX_BODY + 1))
+        assert sock.recv(4096).startswith(b'HTTP/1.1 413')
+
+
+def test_async_slow_body_times_out(monkeypatch):
+    monkeypatch.setattr(config, 'ASYNC_IDLE_TIMEOUT', 0.2)
+
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'POST /echo HTTP/1.1\r\nHost: x\r\nContent-Length: 10\r\n\r\nabc')
+        return await async_server.read_request(reader)
+
+    # only part of the body ever arrives, the connection is given up on
+    assert asyncio.run(read()) is None
+
+
+def test_async_event_stream(url):
+    requests.delete(url + 'clear')
+    user = requests.post(url + 'auth/register', json={
+        'email': 'validEmail@gmail.com',
+        'password': 'valid_password',
+        'name_first': 'Philgee',
+        'name_last': 'Vlad',
+    }).json()
+    channel = requests.post(url + 'channels/create', json={
+        'token': user['token'],
+        'name': 'new_channel',
+        'is_public': True,
+    }).json()
+    stream = requests.get(url + 'channel/stream', params={
+        'token': user['token'],
+        'channel_id': channel['channel_id'],
+    }, headers={'Accept': 'text/event-stream'}, stream=True, timeout=5)
+    assert stream.headers['Content-Type'] == 'text/event-stream'
+
+    requests.post(url + 'message/send', json={
+        'token': user['token'],
+        'channel_id': channel['channel_id'],
+        'message': 'streamed',
+    })
+    lines = stream.iter_lines(chunk_size=1, decode_unicode=True)
+    received = {}
+    for line in lines:
+        if not line:
+            break
+        field, _, value = line.partition(': ')
+        received[field] = value
+    stream.close()
+    assert received['event'] == 'send'
+    assert json.loads(received['data'])['message']['message'] == 'streamed'
+
+    # a long-poll waits on the loop as well
+    payload = requests.get(url + 'channel/stream', params={
+        'token': user['token'],
+        'channel_id': channel['channel_id'],
+        'since': 0,
+    }).json()
+    assert [event['type'] for event in payload['events']] == ['join', 'send']
+
+
+
+def open_websocket(url, token):
+    '''
+    Connect to the event socket, returning the socket and the handshake response
+    '''
+    parsed = urlparse(url)
+    sock = socket.create_connection((parsed.hostname, parsed.port), timeout=5)
+    key = 'dGhlIHNhbXBsZSBub25jZQ=='
+    sock.sendall(f'GET /channels/socket?token={token} HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\n'
+                 f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n'
+                 'Sec-WebSocket-Version: 13\r\n\r\n'.encode())
+    head = b''
+    while not head.endswith(b'\r\n\r\n'):
+        chunk = sock.recv(1)
+        if not chunk:
+            break
+        head += chunk
+    return sock, head.decode()
+
+
+def recv_exactly(sock, count):
+    data = b''
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        assert chunk
+        data += chunk
+    return data
+
+
+def recv_frame(sock):
+    '''
+    Read one (unmasked) frame from the server, returns (opcode, payload)
+    '''
+    first, second = recv_exactly(sock, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(recv_exactly(sock, 2), 'big')
+    elif length == 127:
+        length = int.from_bytes(recv_exactly(sock, 8), 'big')
+    return first & 0x0F, recv_exactly(sock, length)
+
+
+def send_frame(sock, opcode, payload=b''):
+    mask = os.urandom(4)
+    sock.sendall(bytes((0x80 | opcode, 0x80 | len(payload))) + mask +
+                 bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload)))
+
+
+def test_async_websocket_feed(url):
+    requests.delete(url + 'clear')
+    owner = requests.post(url + 'auth/register', json={
+        'email': 'validEmail@gmail.com',
+        'password': 'valid_password',
+        'name_first': 'Philgee',
+        'name_last': 'Vlad',
+    }).json()
+    user = requests.post(url + 'auth/register', json={
+        'email': 'validEmail2@gmail.com',
+        'password': 'valid_password_2',
+        'name_first': 'Jason',
+        'name_last': 'Henry',
+    }).json()
+    channel = requests.post(url + 'channels/create', json={
+        'token': owner['token'],
+        'name': 'new_channel',
+        'is_public': True,
+    }).json()
+
+    sockets = [open_websocket(url, user['token']), open_websocket(url, user['token'])]
+    for _, head in sockets:
+        assert head.startswith('HTTP/1.1 101')
+        assert f'Sec-WebSocket-Accept: {accept_key("dGhlIHNhbXBsZSBub25jZQ==")}' in head
+
+    requests.post(url + 'channel/join', json={'token': user['token'], 'channel_id': channel['channel_id']})
+    sent = requests.post(url + 'message/send', json={
+        'token': owner['token'],
+        'channel_id': channel['channel_id'],
+        'message': 'pushed',
+    }).json()
+    requests.post(url + 'message/react', json={
+        'token': owner['token'],
+        'message_id': sent['message_id'],
+        'react_id': 1,
+    })
+    requests.post(url + 'message/pin', json={'token': owner['token'], 'message_id': sent['message_id']})
+    for sock, _ in sockets:
+        received = [recv_frame(sock) for _ in range(4)]
+        assert all(opcode == 0x1 for opcode, _ in received)
+        decoded = [json.loads(payload) for _, payload in received]
+        assert [event['type'] for event in decoded] == ['join', 'send', 'react', 'pin']
+        assert decoded[1]['message']['message'] == 'pushed'
+
+    # pings are answered and a close is echoed
+    sock = sockets[0][0]
+    send_frame(sock, 0x9, b'ping')
+    assert recv_frame(sock) == (0xA, b'ping')
+    send_frame(sock, 0x8, (1000).to_bytes(2, 'big'))
+    assert recv_frame(sock) == (0x8, (1000).to_bytes(2, 'big'))
+    for sock, _ in sockets:
+        sock.close()
+
+    # a bad token gets the same error as server.py
+    sock, head = open_websocket(url, 'not a token')
+    assert head.startswith('HTTP/1.1 400')
+    sock.close()
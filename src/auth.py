@@ -4,6 +4,10 @@ AUTH
 import uuid
 from error import InputError
 from global_dic import data
+import store
+import session
+import persistence
+import versions
 from utils import generate_token, check_token, remove_token, generate_secret_code, send_email
 from auth_helper import (
     validate_email, 
@@ -13,7 +17,9 @@ from auth_helper import (
     check_email,  
     change_handle
 )
+from concurrency import writes_users
 
+@writes_users
 def auth_login(email, password):
     '''
     Function to validate email
@@ -24,19 +30,19 @@ def auth_login(email, password):
     if check_email(email) == False:
         raise InputError("Input Error")
 
-    for i in range(len(data["users"])):
-        if data["users"][i]["email"] == email:
-            u_id = data['users'][i]['u_id']
-            #Check if a token exist for that user
-            if ('token' in data['users'][i]):
-                token = data['users'][i]['token']
-            else:
-                token = generate_token(u_id)
-            #Check if hashed password match
-            if (data["users"][i]["password"] != hash_password(password)):
-                raise InputError("Input Error")
-            else:
-                data["users"][i]["state"] = "active"
+    user = store.find_user_by_email(email)
+    u_id = user['u_id']
+    #Check if a token exist for that user
+    if ('token' in user):
+        token = user['token']
+    else:
+        token = generate_token(u_id)
+    #Check if hashed password match
+    if (user["password"] != hash_password(password)):
+        raise InputError("Input Error")
+    else:
+        user["state"] = "active"
+    persistence.record_user(user)
 
     return {
         'u_id': u_id,
@@ -44,17 +50,17 @@ def auth_login(email, password):
     }
 
 
+@writes_users
 def auth_logout(token):
     '''
     Function to logout
     '''
     # check_token(token)
     success = False
-    for i in range(len(data["users"])):
-        #Find token
-        if (data["users"][i]["token"] == token):
-            success = True
-            return True
+    #Find token
+    if store.find_user_by_token(token) is not None:
+        success = True
+        return True
 
     if not success:
         return {'is_success': False }
@@ -64,6 +70,7 @@ def auth_logout(token):
     }
 
 
+@writes_users
 def auth_register(email, password, name_first, name_last):
     '''
     Function to register user
@@ -87,7 +94,7 @@ def auth_register(email, password, name_first, name_last):
     handle = change_handle(handle)
             
 
-    data["users"].append({
+    new_user = {
         "u_id": user_id,
         "token": user_token,
         "email": email,
@@ -99,7 +106,12 @@ def auth_register(email, password, name_first, name_last):
         'profile_img_url': '',
         "secret_code": 0,
         "is_flockr_owner": is_flockr_owner
-    })
+    }
+    store.insert_user(new_user)
+    persistence.record_user(new_user)
+    versions.bump('users')
+    # the token may have been rejected before this user existed
+    session.forget(user_token)
     return {
         'u_id': user_id,
         'token': user_token,
@@ -111,14 +123,14 @@ def auth_passwordreset_request(email):
     global data
     # create the screte code 
     code = generate_secret_code()
-    for user in data["users"]:
-        # Adds the secret code to corresponding user
-        if email == user["email"]:
-            user["secret_code"] = code
-            break
+    # Adds the secret code to corresponding user
+    user = store.find_user_by_email(email)
+    user["secret_code"] = code
+    persistence.record_user(user)
     # Sends the email 
     send_email(email, code)
 
+@writes_users
 def auth_passwordreset_reset(reset_code, new_password):
     # input error
     # reset_code is not a valid reset code 
@@ -138,3 +150,4 @@ def auth_passwordreset_reset(reset_code, new_password):
 
     # by this point all input error has passed and time to set the password for the user
     user['password'] = hash_password(new_password)
+    persistence.record_user(user)
@@ -4,7 +4,7 @@ AUTH_HELPER FUNCTION
 import re
 import hashlib
 from error import InputError, AccessError
-from global_dic import data
+import store
 from utils import decode_token
 import random
 import string
@@ -56,17 +56,11 @@ def check_email(email):
     '''
     Check if email exist
     '''
-    for i in range(len(data["users"])):
-        if data["users"][i]["email"] == email:
-            return True
-    return False
+    return store.find_user_by_email(email) is not None
 
 def check_unique_handle(handle):
     # checking if handle is already in use
-    for user in data['users']:
-        if handle == user['handle']:
-            return False
-    return True
+    return store.find_user_by_handle(handle) is None
 
 def change_handle(handle):
     # checking if handle is greater than 20 chars
@@ -0,0 +1,139 @@
+'''
+Batch
+Runs a list of operations for one token in a single request. Each
+operation names a route, like 'channel/details', and gives its arguments;
+it is run by the same function the route calls, in order, and gets its
+own result or error, so one failing operation doesn't stop the rest.
+
+The token is checked once for the whole batch. The functions still check
+it, but that is a lookup in the session cache.
+'''
+import traceback
+from werkzeug.exceptions import HTTPException, InternalServerError
+from error import InputError
+from utils import decode_token
+from channels import channels_list, channels_listall, channels_create
+from channel import channel_invite, channel_details, channel_leave, channel_join, channel_addowner, channel_removeowner
+from channel import channel_messages_json
+from user import user_profile, user_profile_setname, user_profile_setemail, user_profile_sethandle
+from other import users_all_json, admin_userpermission_change, search
+from message import message_send, message_remove, message_edit, message_sendlater, message_react, message_unreact
+from message import message_pin, message_unpin
+from standup import standup_start, standup_active, standup_send
+from serialization import dumps
+import config
+
+# an argument without a default has to be given
+REQUIRED = object()
+
+
+def _keep(value):
+    return value
+
+
+def _optional_int(value):
+    return None if value is None else int(value)
+
+
+# op -> (function, [(argument, conversion, default)]), the conversions are the ones the routes make
+OPERATIONS = {
+    'channels/list': (channels_list, []),
+    'channels/listall': (channels_listall, []),
+    'channels/create': (channels_create, [('name', _keep, REQUIRED), ('is_public', _keep, REQUIRED)]),
+    'channel/invite': (channel_invite, [('channel_id', int, REQUIRED), ('u_id', int, REQUIRED)]),
+    'channel/details': (channel_details, [('channel_id', int, REQUIRED)]),
+    'channel/messages': (channel_messages_json, [
+        ('channel_id', int, REQUIRED), ('start', int, 0), ('before_message_id', _optional_int, None),
+        ('after_message_id', _optional_int, None), ('limit', _optional_int, None)]),
+    'channel/leave': (channel_leave, [('channel_id', int, REQUIRED)]),
+    'channel/join': (channel_join, [('channel_id', int, REQUIRED)]),
+    'channel/addowner': (channel_addowner, [('channel_id', int, REQUIRED), ('u_id', int, REQUIRED)]),
+    'channel/removeowner': (channel_removeowner, [('channel_id', int, REQUIRED), ('u_id', int, REQUIRED)]),
+    'user/profile': (user_profile, [('u_id', int, REQUIRED)]),
+    'user/profile/setname': (user_profile_setname, [('name_first', _keep, REQUIRED), ('name_last', _keep, REQUIRED)]),
+    'user/profile/setemail': (user_profile_setemail, [('email', _keep, REQUIRED)]),
+    'user/profile/sethandle': (user_profile_sethandle, [('handle_str', _keep, REQUIRED)]),
+    'users/all': (users_all_json, [('limit', _optional_int, None), ('cursor', _keep, None)]),
+    'admin/userpermission/change': (admin_userpermission_change,
+                                    [('u_id', int, REQUIRED), ('permission_id', int, REQUIRED)]),
+    'search': (search, [('query_str', _keep, REQUIRED), ('limit', _optional_int, None), ('cursor', _keep, None)]),
+    'message/send': (message_send, [('channel_id', int, REQUIRED), ('message', _keep, REQUIRED)]),
+    'message/sendlater': (message_sendlater, [('channel_id', int, REQUIRED), ('message', _keep, REQUIRED),
+                                              ('time_sent', _keep, REQUIRED)]),
+    'message/remove': (message_remove, [('message_id', int, REQUIRED)]),
+    'message/edit': (message_edit, [('message_id', int, REQUIRED), ('message', _keep, REQUIRED)]),
+    'message/react': (message_react, [('message_id', int, REQUIRED), ('react_id', int, REQUIRED)]),
+    'message/unreact': (message_unreact, [('message_id', int, REQUIRED), ('react_id', int, REQUIRED)]),
+    'message/pin': (message_pin, [('message_id', int, REQUIRED)]),
+    'message/unpin': (message_unpin, [('message_id', int, REQUIRED)]),
+    'standup/start': (standup_start, [('channel_id', int, REQUIRED), ('length', int, REQUIRED)]),
+    'standup/active': (standup_active, [('channel_id', int, REQUIRED)]),
+    'standup/send': (standup_send, [('channel_id', int, REQUIRED), ('message', _keep, REQUIRED)]),
+}
+
+# ops whose function returns its result already encoded
+ENCODED_OPERATIONS = {'channel/messages', 'users/all'}
+
+
+def run_operation(token, operation):
+    '''
+    JSON of one operation's result, the function's return value
+    :raises InputError: If the op is unknown or its arguments are missing or malformed
+    '''
+    if not isinstance(operation, dict):
+        raise InputError("Operation is not an object")
+    op = str(operation.get('op', '')).strip('/')
+    if op not in OPERATIONS:
+        raise InputError(f"Unknown operation {op!r}")
+    function, parameters = OPERATIONS[op]
+    args = operation.get('args') or {}
+    if not isinstance(args, dict):
+        raise InputError("Operation args is not an object")
+
+    values = []
+    for name, convert, default in parameters:
+        if name not in args or args[name] is None:
+            if default is REQUIRED:
+                raise InputError(f"Missing argument {name}")
+            values.append(default)
+            continue
+        try:
+            values.append(convert(args[name]))
+        except (TypeError, ValueError):
+            raise InputError(f"Invalid argument {name}") from None
+
+    result = function(token, *values)
+    return result if op in ENCODED_OPERATIONS else dumps(result)
+
+
+def run_batch(token, operations):
+    '''
+    JSON of {'results': [...]}, one entry per operation in the same order:
+    {'status': 200, 'result': ...} or {'status': code, 'error': {code, name, message}}
+    as a route would have answered it, 500 for an unexpected exception
+    :raises AccessError: If the token does not correspond to a logged in user
+    :raises InputError: If operations is not a list or is longer than config.BATCH_MAX_OPERATIONS
+    '''
+    decode_token(token)
+    if not isinstance(operations, list):
+        raise InputError("Operations is not a list")
+    if len(operations) > config.BATCH_MAX_OPERATIONS:
+        raise InputError(f"A batch can have at most {config.BATCH_MAX_OPERATIONS} operations")
+
+    results = []
+    for operation in operations:
+        try:
+            results.append(b'{"status":200,"result":' + run_operation(token, operation) + b'}')
+        except HTTPException as err:
+            results.append(_error(err.code, err.get_description()))
+        except Exception:  # pylint: disable=broad-except
+            # the operations before it have been done, so the rest still run
+            # and the client gets every result. What went wrong is only
+            # logged, the client gets the same message as any other 500
+            traceback.print_exc()
+            results.append(_error(500, InternalServerError().get_description()))
+    return b'{"results":[' + b','.join(results) + b']}'
+
+
+def _error(code, message):
+    return dumps({"status": code, "error": {"code": code, "name": "System Error", "message": message}})
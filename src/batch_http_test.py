@@ -0,0 +1,75 @@
+'''
+Batch HTTP test
+'''
+from subprocess import Popen, PIPE
+import re
+import signal
+from time import sleep
+import requests
+import pytest
+from utils import create_channel, authorised_user, second_user, prepare_user
+
+
+@pytest.fixture
+def url():
+    '''
+    Fixture to get the url of the server
+    '''
+    url_re = re.compile(r' \* Running on ([^ ]*)')
+    server = Popen(["python3", "src/server.py"], stderr=PIPE, stdout=PIPE)
+    line = server.stderr.readline()
+    local_url = url_re.match(line.decode())
+    if local_url:
+        yield local_url.group(1)
+        # Terminate the server
+        server.send_signal(signal.SIGINT)
+        waited = 0
+        while server.poll() is None and waited < 5:
+            sleep(0.1)
+            waited += 0.1
+        if server.poll() is None:
+            server.kill()
+    else:
+        server.kill()
+        raise Exception("Couldn't get URL from local server")
+
+
+def test_batch(url):
+    '''
+    Runs the requests a client makes to show a channel in one round-trip
+    '''
+    requests.delete(f"{url}/clear")
+    user_1 = prepare_user(url, authorised_user)
+    user_2 = prepare_user(url, second_user)
+    channel_1 = create_channel(url, user_1['token'], "GoodThings", True)
+    requests.post(f"{url}/channel/join", json={"token": user_2['token'], "channel_id": channel_1['channel_id']})
+
+    operations = [
+        {"op": "message/send", "args": {"channel_id": channel_1['channel_id'], "message": "hello"}},
+        {"op": "channel/details", "args": {"channel_id": channel_1['channel_id']}},
+        {"op": "channel/messages", "args": {"channel_id": channel_1['channel_id'], "start": 0}},
+        {"op": "user/profile", "args": {"u_id": user_2['u_id']}},
+        {"op": "channel/details", "args": {"channel_id": channel_1['channel_id'] + 100}},
+    ]
+    r = requests.post(f"{url}/batch", json={"token": user_1['token'], "operations": operations})
+    assert r.status_code == 200
+    results = r.json()['results']
+
+    assert [result['status'] for result in results] == [200, 200, 200, 200, 400]
+    details = requests.get(f"{url}/channel/details",
+                           params={"token": user_1['token'], "channel_id": channel_1['channel_id']})
+    assert results[1]['result'] == details.json()
+    assert results[2]['result']['messages'][0]['message'] == "hello"
+    assert results[3]['result']['user']['u_id'] == user_2['u_id']
+    assert results[4]['error']['code'] == 400
+
+
+def test_batch_invalid_token(url):
+    '''
+    The whole batch fails when the token is invalid
+    '''
+    requests.delete(f"{url}/clear")
+    r = requests.post(f"{url}/batch", json={"token": "not a token",
+                                            "operations": [{"op": "channels/list"}]})
+    assert r.status_code == 400
+    assert 'results' not in r.json()
@@ -0,0 +1,116 @@
+'''
+Tests for batch.py
+'''
+import json
+import pytest
+from auth import auth_register
+from batch import run_batch
+from channel import channel_details, channel_messages
+from channels import channels_create
+from message import message_send
+from user import user_profile
+from other import clear
+from error import InputError, AccessError
+import config
+
+
+def test_batch_results_in_order():
+    '''
+    Each operation gets what calling its function gives
+    '''
+    clear()
+    owner = auth_register("validEmail@gmail.com", "valid_password", "Phil", "Knight")
+    token = owner['token']
+    channel_id = channels_create(token, "GoodThings", True)['channel_id']
+    message_send(token, channel_id, "hello")
+
+    results = json.loads(run_batch(token, [
+        {"op": "channel/details", "args": {"channel_id": channel_id}},
+        {"op": "/channel/messages", "args": {"channel_id": str(channel_id), "start": 0}},
+        {"op": "user/profile", "args": {"u_id": owner['u_id']}},
+    ]))['results']
+
+    assert [result['status'] for result in results] == [200, 200, 200]
+    assert results[0]['result'] == channel_details(token, channel_id)
+    assert results[1]['result'] == channel_messages(token, channel_id, 0)
+    assert results[2]['result'] == user_profile(token, owner['u_id'])
+
+
+def test_batch_runs_in_order():
+    '''
+    Later operations see the changes of earlier ones
+    '''
+    clear()
+    token = auth_register("validEmail@gmail.com", "valid_password", "Phil", "Knight")['token']
+    channel_id = channels_create(token, "GoodThings", True)['channel_id']
+
+    results = json.loads(run_batch(token, [
+        {"op": "message/send", "args": {"channel_id": channel_id, "message": "first"}},
+        {"op": "message/send", "args": {"channel_id": channel_id, "message": "second"}},
+        {"op": "channel/messages", "args": {"channel_id": channel_id}},
+    ]))['results']
+
+    sent = [message['message'] for message in results[2]['result']['messages']]
+    assert sent == ["second", "first"]
+    assert results[2]['result']['messages'][0]['message_id'] == results[1]['result']['message_id']
+
+
+def test_batch_errors_per_operation():
+    '''
+    A failing operation gets its error and the rest still run
+    '''
+    clear()
+    token = auth_register("validEmail@gmail.com", "valid_password", "Phil", "Knight")['token']
+    channel_id = channels_create(token, "GoodThings", True)['channel_id']
+
+    results = json.loads(run_batch(token, [
+        {"op": "channel/details", "args": {"channel_id": channel_id + 100}},
+        {"op": "channel/explode", "args": {}},
+        {"op": "channel/details", "args": {}},
+        {"op": "channel/details", "args": {"channel_id": "abc"}},
+        "channel/details",
+        {"op": "channel/details", "args": {"channel_id": channel_id}},
+    ]))['results']
+
+    assert [result['status'] for result in results] == [400, 400, 400, 400, 400, 200]
+    assert all(result['error']['code'] == 400 for result in results[:5])
+    assert 'Missing argument channel_id' in results[2]['error']['message']
+    assert results[5]['result']['name'] == "GoodThings"
+
+
+def test_batch_unexpected_error():
+    '''
+    An operation raising something other than an HTTP error gets a 500
+    and the rest still run
+    '''
+    clear()
+    token = auth_register("validEmail@gmail.com", "valid_password", "Phil", "Knight")['token']
+
+    results = json.loads(run_batch(token, [
+        {"op": "channels/create", "args": {"name": "first", "is_public": True}},
+        {"op": "channels/create", "args": {"name": 5, "is_public": True}},
+        {"op": "channels/list"},
+    ]))['results']
+
+    assert [result['status'] for result in results] == [200, 500, 200]
+    assert results[1]['error']['code'] == 500
+    # the exception itself is not given away
+    assert 'Error' not in results[1]['error']['message']
+    assert 'internal error' in results[1]['error']['message']
+    assert [channel['name'] for channel in results[2]['result']['channels']] == ["first"]
+
+
+def test_batch_invalid():
+    '''
+    A bad token or operations list fails the whole batch
+    '''
+    clear()
+    token = auth_register("validEmail@gmail.com", "valid_password", "Phil", "Knight")['token']
+
+    with pytest.raises(AccessError):
+        run_batch("not a token", [])
+    with pytest.raises(InputError):
+        run_batch(token, {"op": "channels/list"})
+    with pytest.raises(InputError):
+        run_batch(token, [{"op": "channels/list"}] * (config.BATCH_MAX_OPERATIONS + 1))
+    assert json.loads(run_batch(token, [])) == {"results": []}
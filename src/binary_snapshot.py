@@ -0,0 +1,122 @@
+'''
+Binary Snapshot
+Snapshot file format used by the journal. Users and channel details are
+read as soon as the file is opened, but each channel's messages are kept
+in their own segment of the file and only unpickled, through a memory
+map, the first time the channel is used.
+
+Layout of the file:
+    MAGIC
+    one pickled list of message tuples per channel
+    padding to a multiple of 8 bytes
+    channel_id of every message_id, as 8 byte ints, -1 for none
+    pickled header, with the seq, users, channels and where everything is
+    offset of the header, as an 8 byte int
+'''
+from array import array
+import mmap
+import os
+import pickle
+import struct
+from message_record import Message
+
+MAGIC = b'FLOCKR\x00\x01'
+OFFSET = struct.Struct('<q')
+
+
+class Segment:
+    '''
+    The saved messages of one channel, still sitting in the memory mapped file
+    '''
+    __slots__ = ('view',)
+
+    def __init__(self, view):
+        self.view = view
+
+    def load(self):
+        '''
+        Unpickle the messages
+        '''
+        return [Message.from_tuple(fields) for fields in pickle.loads(self.view)]
+
+
+def is_binary(path):
+    '''
+    Check if the file at path is a binary snapshot
+    '''
+    with open(path, 'rb') as snapshot:
+        return snapshot.read(len(MAGIC)) == MAGIC
+
+
+def write(path, seq, state):
+    '''
+    Write state from persistence.dump_state to path and fsync it.
+    Each channel's messages are either a list of Message.as_tuple()s or a
+    Segment, which is copied over without being unpickled.
+    '''
+    segments = {}
+    with open(path, 'wb') as snapshot:
+        snapshot.write(MAGIC)
+        channels = []
+        for saved in state['channels']:
+            saved = dict(saved)
+            messages = saved.pop('messages')
+            if isinstance(messages, Segment):
+                raw = messages.view
+            else:
+                raw = pickle.dumps(list(messages),
+                                   pickle.HIGHEST_PROTOCOL)
+            segments[saved['channel_id']] = (snapshot.tell(), len(raw))
+            snapshot.write(raw)
+            channels.append(saved)
+
+        snapshot.write(b'\0' * (-snapshot.tell() % 8))
+        message_channels = state['message_channels']
+        message_channels_at = (snapshot.tell(), len(message_channels))
+        message_channels.tofile(snapshot)
+
+        header_at = snapshot.tell()
+        pickle.dump({
+            'seq': seq,
+            'users': state['users'],
+            'channels': channels,
+            'message_count': state['message_count'],
+            'segments': segments,
+            'message_channels': message_channels_at,
+            'jobs': state.get('jobs', []),
+            'standup': state.get('standup', []),
+        }, snapshot, pickle.HIGHEST_PROTOCOL)
+        snapshot.write(OFFSET.pack(header_at))
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+
+
+def read(path):
+    '''
+    Open the snapshot at path. Returns (seq, state) where each channel has a
+    'segment' instead of its 'messages', and state['message_channels']
+    reads straight from the file.
+    '''
+    with open(path, 'rb') as snapshot:
+        mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    header_at = OFFSET.unpack(view[-OFFSET.size:])[0]
+    header = pickle.loads(view[header_at:-OFFSET.size])
+
+    for saved in header['channels']:
+        start, length = header['segments'][saved['channel_id']]
+        saved['segment'] = Segment(view[start:start + length])
+
+    start, count = header['message_channels']
+    if count:
+        message_channels = view[start:start + count * 8].cast('q')
+    else:
+        message_channels = array('q')
+    return header['seq'], {
+        'users': header['users'],
+        'channels': header['channels'],
+        'message_count': header['message_count'],
+        'message_channels': message_channels,
+        'jobs': header.get('jobs', []),
+        'standup': header.get('standup', []),
+    }
@@ -1,12 +1,20 @@
 '''
 Channel
 '''
-from channel_helper import check_channel, check_uid, check_member_channel, channel_details_helper, check_start, delete_member, delete_owner, add_user, check_owner, delete_user, add_owner
+from channel_helper import check_channel, check_uid, check_member_channel, channel_details_helper, check_start, delete_member, delete_owner, add_user, check_owner, delete_user, add_owner, message_cursor
 from error import InputError, AccessError
 from global_dic import data
+import config
+import store
+import persistence
+import events
+import versions
+import serialization
 from utils import decode_token, check_token, check_user_in_channel
+from concurrency import reads_channel, writes_channel
 
 
+@writes_channel
 def channel_invite(token, channel_id, u_id):
     '''
     Invite user to channel
@@ -35,8 +43,12 @@ def channel_invite(token, channel_id, u_id):
 
     # no errors raised, add the user to channels all members
     add_user(channel_id, u_id)
+    persistence.record_channel(store.find_channel(channel_id))
+    events.publish(channel_id, 'join', u_id=u_id)
+    versions.bump(('channel', channel_id), ('member', u_id))
 
 
+@reads_channel
 def channel_details(token, channel_id):
     '''
     Grab channel details
@@ -59,9 +71,34 @@ def channel_details(token, channel_id):
     return channel_details_helper(channel_id)
 
 
-def channel_messages(token, channel_id, start):
+@reads_channel
+def channel_messages(token, channel_id, start=0, before_message_id=None, after_message_id=None,
+                     limit=None):
     '''
-    Grab channel messages
+    Grab channel messages, newest first, limit of them at a time
+    (config.MESSAGES_PAGE_SIZE if not given).
+    Pages by start, the number of newer messages to skip, unless
+    before_message_id or after_message_id is given. Those page through the
+    messages just older or just newer than that message, which stay the
+    same pages when messages are sent or removed elsewhere in the channel.
+    '''
+    page, fields = messages_page(token, channel_id, start, before_message_id, after_message_id, limit)
+    return dict({'messages': [message.to_dict() for message in page]}, **fields)
+
+
+@reads_channel
+def channel_messages_json(token, channel_id, start=0, before_message_id=None, after_message_id=None,
+                          limit=None):
+    '''
+    channel_messages encoded as JSON, joined from each message's cached JSON
+    '''
+    page, fields = messages_page(token, channel_id, start, before_message_id, after_message_id, limit)
+    return serialization.messages_json(page, fields)
+
+
+def messages_page(token, channel_id, start, before_message_id, after_message_id, limit):
+    '''
+    The Messages of a channel_messages page, and the response's other fields
     '''
     check_token(token)
 
@@ -76,39 +113,122 @@ def channel_messages(token, channel_id, start):
     if check_member_channel(channel_id, u_id) is False:
         raise AccessError("User is not a member of the channel")
 
+    if limit is None:
+        limit = config.MESSAGES_PAGE_SIZE
+    elif limit < 1:
+        raise InputError("Limit must be at least 1")
+
+    if before_message_id is not None or after_message_id is not None:
+        return channel_messages_around(channel_id, before_message_id, after_message_id, limit)
+
     # seeing if start is greater than total number of messages in the channel
     if check_start(channel_id, start) is True:
         raise InputError("Start is greater than total number of messages")
 
-    messages = []
-    # channel_id is the index based on order created so it will be corresponding list index in data
-    remaining_length = len(data['channels'][channel_id]['messages']) - start
+    history = store.history(store.find_channel(channel_id))
+    remaining_length = len(history) - start
 
-    # determining if there are >= 50 messages left to return, if not end point is -1
-    # setting last index variable for loop boundary
-    if remaining_length < 50:
+    # determining if there are >= limit messages left to return, if not end point is -1
+    if remaining_length < limit:
         end = -1
-        last_index = start + remaining_length
+        count = remaining_length
     else:
-        end = start + 50
-        last_index = end
-
-    maximum_index = len(data['channels'][channel_id]['messages']) - 1
-
-    # looping through data structure and populating list with all messages required
-    for i in range(start, last_index):
-        messages.append(
-            data['channels'][channel_id]['messages'][maximum_index - i])
+        end = start + limit
+        count = limit
 
-    # print(len(messages))
-    # print(messages)
-    return {
-        'messages': messages,
+    page = history.page(start, count)
+    return page, {
         'start': start,
         'end': end,
     }
 
 
+@reads_channel
+def channel_stream_open(token, channel_id, since=None):
+    '''
+    Start streaming the message events of a channel the user is a member of,
+    until they leave it. Returns the subscription, which has to be given to events.unsubscribe once
+    done, and the kept events after event id since
+    '''
+    check_token(token)
+    if check_channel(channel_id) is False:
+        raise InputError("Invalid channel")
+    u_id = decode_token(token)
+    if check_member_channel(channel_id, u_id) is False:
+        raise AccessError("User is not a member of the channel")
+    # subscribe first so nothing published in between is missed
+    subscription = events.subscribe(channel_id, u_id)
+    backlog = [] if since is None else events.events_since(channel_id, since)
+    return subscription, backlog
+
+
+def newer_events(found, last_id):
+    '''
+    The events in found newer than event id last_id, and the id of the newest.
+    Resync events are always kept
+    '''
+    fresh = []
+    for event in found:
+        if event.event_id == 0:
+            fresh.append(event)
+        elif event.event_id > last_id:
+            fresh.append(event)
+            last_id = event.event_id
+    return fresh, last_id
+
+
+def channel_stream(token, channel_id, since=None, timeout=None):
+    '''
+    Long-poll for message events of a channel: the events after event id since,
+    or once there are none, the next ones published within timeout seconds
+    (config.STREAM_TIMEOUT if not given). Without since only new events are waited for.
+    Returns (list of events.Event, id of the last event seen)
+    '''
+    if timeout is None or timeout > config.STREAM_TIMEOUT:
+        timeout = config.STREAM_TIMEOUT
+    last_id = events.last_event_id() if since is None else since
+    subscription, backlog = channel_stream_open(token, channel_id, since)
+    try:
+        found, last_id = newer_events(backlog, last_id)
+        if not found and timeout > 0:
+            found, last_id = newer_events(subscription.wait(timeout), last_id)
+    finally:
+        events.unsubscribe(subscription)
+    return found, last_id
+
+
+def channel_messages_around(channel_id, before_message_id, after_message_id, limit):
+    '''
+    Page of up to limit Messages, newest first, just older than before_message_id
+    or just newer than after_message_id. Also returns the message_ids to pass
+    back in for the next older and next newer pages, None if there are none.
+    '''
+    if before_message_id is not None and after_message_id is not None:
+        raise InputError("Only one of before_message_id and after_message_id can be given")
+
+    channel = store.find_channel(channel_id)
+    history = store.history(channel)
+    # a removed cursor message pages from the message before it, so paging carries on
+    if before_message_id is not None:
+        segment, message_id = message_cursor(channel, before_message_id)
+        if segment is None:
+            page, has_older = [], False
+        else:
+            page, has_older = history.older(segment, message_id, limit,
+                                            inclusive=message_id != before_message_id)
+        has_newer = True
+    else:
+        segment, message_id = message_cursor(channel, after_message_id)
+        page, has_newer = history.newer(segment, message_id, limit)
+        has_older = True
+
+    return page, {
+        'before_message_id': page[-1].message_id if page and has_older else None,
+        'after_message_id': page[0].message_id if page and has_newer else None,
+    }
+
+
+@writes_channel
 def channel_leave(token, channel_id):
     '''
     Leave channel
@@ -131,8 +251,12 @@ def channel_leave(token, channel_id):
 
     # deleting from owner_members if an owner
     delete_owner(matching_u_id, channel_id)
+    persistence.record_channel(store.find_channel(channel_id))
+    events.publish(channel_id, 'leave', u_id=matching_u_id)
+    versions.bump(('channel', channel_id), ('member', matching_u_id))
 
 
+@writes_channel
 def channel_join(token, channel_id):
     '''
     arg: token, channe_id
@@ -150,10 +274,8 @@ def channel_join(token, channel_id):
     pub = False
 
     # utilizes a diff globalDict
-    for channel in data['channels']:
-        if channel['channel_id'] is channel_id and channel['is_public'] == True:
-            pub = True
-            break
+    if store.find_channel(channel_id)['is_public'] == True:
+        pub = True
     if pub is False:
         raise AccessError
 
@@ -161,10 +283,15 @@ def channel_join(token, channel_id):
 
     # add user to the channel
     # loop through each property of all channel
-
+    if check_member_channel(channel_id, matching_u_id) is True:
+        return
     add_user(channel_id, matching_u_id)
+    persistence.record_channel(store.find_channel(channel_id))
+    events.publish(channel_id, 'join', u_id=matching_u_id)
+    versions.bump(('channel', channel_id), ('member', matching_u_id))
 
 
+@writes_channel
 def channel_addowner(token, channel_id, u_id):
     '''
     Add owner to channel
@@ -184,8 +311,12 @@ def channel_addowner(token, channel_id, u_id):
         raise AccessError
 
     add_owner(channel_id, u_id)
+    persistence.record_channel(store.find_channel(channel_id))
+    events.publish(channel_id, 'addowner', u_id=u_id)
+    versions.bump(('channel', channel_id))
 
 
+@writes_channel
 def channel_removeowner(token, channel_id, u_id):
     '''
     Remove owner from channel
@@ -205,3 +336,6 @@ def channel_removeowner(token, channel_id, u_id):
 
     # find the dictionary in the owner list, and delete
     delete_user(channel_id, u_id)
+    persistence.record_channel(store.find_channel(channel_id))
+    events.publish(channel_id, 'removeowner', u_id=u_id)
+    versions.bump(('channel', channel_id))
@@ -1,46 +1,39 @@
 '''
 Channel Helper
 '''
-from global_dic import data
+from error import InputError
+import store
 
 
 def check_channel(channel_id):
     '''
     Check if channel exist
     '''
-    for channel in data['channels']:
-        if channel_id == channel['channel_id']:
-            return True
-    return False
+    return store.find_channel(channel_id) is not None
 
 
 def check_owner(channel_id, u_id_match):
     '''
     Check if channel owner is true
     '''
-    # loop through each channel
-    for channel in data['channels']:
-        # check channel_id exists
-        if channel_id == channel['channel_id']:
-            # loop through owners in that specific channel
-            for owners in channel["owner_members"]:
-                # check if that owner is already an owner
-                if owners["u_id"] == u_id_match:
-                    return True
-    return False
+    channel = store.find_channel(channel_id)
+    if channel is None:
+        return False
+    # check if that owner is already an owner
+    return u_id_match in channel["owner_ids"]
 
 
 def channel_details_helper(channel_id):
     '''
     Grab channel given by channel_id
     '''
-    for channel in data['channels']:
-        if channel['channel_id'] == channel_id:
-            return { 
-                "name": channel["name"],
-                "owner_members": channel["owner_members"], 
-                "all_members": channel["all_members"]
-                }
+    channel = store.find_channel(channel_id)
+    if channel is not None:
+        return {
+            "name": channel["name"],
+            "owner_members": channel["owner_members"],
+            "all_members": channel["all_members"]
+            }
 
 
 
@@ -48,92 +41,110 @@ def check_uid(u_id):
     '''
     Check if u_id is valid
     '''
-    for user in data['users']:
-        if u_id == user['u_id']:
-            return True
-    return False
+    return store.find_user(u_id) is not None
 
 
 def check_member_channel(channel_id, u_id):
     '''
     Check if member is part of that channel
     '''
-    for channel in data['channels']:
-        if channel['channel_id'] == channel_id:
-            for member in channel['all_members']:
-                if u_id == member['u_id']:
-                    return True
-    return False
+    channel = store.find_channel(channel_id)
+    if channel is None:
+        return False
+    return u_id in channel['member_ids']
 
 
 def check_start(channel_id, start):
     '''
     Check Start
     '''
-    for channel in data['channels']:
-        if channel_id == channel['channel_id']:
-            if start > len(channel['messages']):
-                return True
-    return False
+    channel = store.find_channel(channel_id)
+    return channel is not None and start > len(store.history(channel))
 
 
 def delete_member(u_id, channel_id):
     '''
     Delete member base on user id
     '''
-    for channel in data['channels']:
-        if channel['channel_id'] == channel_id:
-            for i in range(0, len(channel['all_members'])):
-                if u_id == channel['all_members'][i]['u_id']:
-                    del channel['all_members'][i]
+    channel = store.find_channel(channel_id)
+    if channel is not None and u_id in channel['member_ids']:
+        channel['member_ids'].discard(u_id)
+        store.remove_membership(u_id, channel_id)
+        remove_from_members(channel['all_members'], u_id)
 
 
 def delete_owner(u_id, channel_id):
     '''
     Delete owner base on user id
     '''
-    for channel in data['channels']:
-        if channel['channel_id'] == channel_id:
-            for i in range(0, len(channel['owner_members'])):
-                if u_id == channel['owner_members'][i]['u_id']:
-                    del channel['owner_members'][i]
+    channel = store.find_channel(channel_id)
+    if channel is not None and u_id in channel['owner_ids']:
+        channel['owner_ids'].discard(u_id)
+        remove_from_members(channel['owner_members'], u_id)
 
 
 def add_user(channel_id, u_id):
     '''
     Add user to the channel
     '''
-    global data
-    for user in data["users"]:
-        if u_id == user["u_id"]:
-            new_user = {
-                'u_id': user["u_id"],
-                "name_first": user["first_name"], 
-                "name_last": user["last_name"]
-            }
-    for channel in data['channels']:
-        if channel['channel_id'] == channel_id:
-            channel['all_members'].append(new_user)
+    user = store.find_user(u_id)
+    new_user = {
+        'u_id': user["u_id"],
+        "name_first": user["first_name"],
+        "name_last": user["last_name"]
+    }
+    channel = store.find_channel(channel_id)
+    if channel is not None and u_id not in channel['member_ids']:
+        channel['member_ids'].add(u_id)
+        store.add_membership(u_id, channel_id)
+        channel['all_members'].append(new_user)
 
 
 def add_owner(channel_id, uid):
     '''
     Add owner to the channel
     '''
-    for channel in data['channels']:
-        if channel['channel_id'] == channel_id:
-            new_owner = {'u_id': uid}
-            channel["owner_members"].append(new_owner)
+    channel = store.find_channel(channel_id)
+    if channel is not None and uid not in channel['owner_ids']:
+        new_owner = {'u_id': uid}
+        channel['owner_ids'].add(uid)
+        channel["owner_members"].append(new_owner)
 
 
 def delete_user(channel_id, u_id):
     '''
     Delete user from the channel
     '''
-    for channel in data['channels']:
-        if channel['channel_id'] == channel_id:
-            for member in channel['owner_members']:
-                if member['u_id'] == u_id:
-                    channel['owner_members'].remove(member)
-                    return True
-    return False
\ No newline at end of file
+    channel = store.find_channel(channel_id)
+    if channel is not None and u_id in channel['owner_ids']:
+        channel['owner_ids'].discard(u_id)
+        remove_from_members(channel['owner_members'], u_id)
+        return True
+    return False
+
+
+def message_cursor(channel, message_id):
+    '''
+    (segment, message_id) of the channel's history to page from for the
+    cursor message_id. A removed message is stood in for by the newest
+    message older than it, (None, None) if there is none.
+    InputError if the message was never in the channel, or was removed
+    too long ago to be stood in for
+    '''
+    found = store.locate_cursor(message_id)
+    if found is None or found[0] != channel['channel_id']:
+        raise InputError("Message_ID does not exist in the channel")
+    if found[1] is None:
+        return None, None
+    return store.locate_message(found[1])[1], found[1]
+
+
+def remove_from_members(members, u_id):
+    '''
+    Remove the entry for u_id from an ordered list of members,
+    only called once the channel's id set says that u_id is in it
+    '''
+    for i, member in enumerate(members):
+        if member['u_id'] == u_id:
+            del members[i]
+            return
@@ -2,6 +2,7 @@
 Channel HTTP test
 '''
 from subprocess import Popen, PIPE
+import json
 import re
 import signal
 from time import sleep
@@ -293,6 +294,181 @@ def test_channel_messages_normal(url):
         index += 1
 
 
+def test_channel_messages_before_message_id(url):
+    '''
+    Pages through messages older than a given message
+    '''
+    requests.delete(f"{url}/clear")
+    regular_user = register_user(url, authorised_user)
+    login_user(url, authorised_user)
+
+    channel = create_channel(url, regular_user['token'], 'new_channel', True)
+    sent = []
+    for i in range(0, 10):
+        sent.append(requests.post(f"{url}/message/send",
+                                  json={
+                                      'token': regular_user['token'],
+                                      'channel_id': channel['channel_id'],
+                                      'message': f"{9 - i}"
+                                  }).json()['message_id'])
+
+    payload = requests.get(f"{url}/channel/messages",
+                           params={
+                               'token': regular_user['token'],
+                               'channel_id': channel['channel_id'],
+                               'before_message_id': sent[5],
+                               'limit': 3
+                           }).json()
+    assert [message['message'] for message in payload['messages']] == ['5', '6', '7']
+    assert payload['before_message_id'] == sent[2]
+    assert payload['after_message_id'] == sent[4]
+
+
+def test_channel_stream_long_poll(url):
+    '''
+    Long-polls for the message events of a channel
+    '''
+    requests.delete(f"{url}/clear")
+    regular_user = register_user(url, authorised_user)
+    channel = create_channel(url, regular_user['token'], 'new_channel', True)
+    sent = requests.post(f"{url}/message/send",
+                         json={
+                             'token': regular_user['token'],
+                             'channel_id': channel['channel_id'],
+                             'message': "hello"
+                         }).json()
+    requests.post(f"{url}/message/pin",
+                  json={'token': regular_user['token'], 'message_id': sent['message_id']})
+
+    payload = requests.get(f"{url}/channel/stream",
+                           params={
+                               'token': regular_user['token'],
+                               'channel_id': channel['channel_id'],
+                               'since': 0
+                           }).json()
+    assert [event['type'] for event in payload['events']] == ['join', 'send', 'pin']
+    assert payload['events'][2]['message']['is_pinned'] is True
+
+    payload = requests.get(f"{url}/channel/stream",
+                           params={
+                               'token': regular_user['token'],
+                               'channel_id': channel['channel_id'],
+                               'since': payload['last_event_id'],
+                               'timeout': 0.2
+                           }).json()
+    assert payload['events'] == []
+
+    response = requests.get(f"{url}/channel/stream",
+                            params={'token': regular_user['token'], 'channel_id': 5555555555})
+    assert response.status_code == 400
+
+
+def test_channel_stream_event_stream(url):
+    '''
+    Streams the message events of a channel as Server-Sent Events
+    '''
+    requests.delete(f"{url}/clear")
+    regular_user = register_user(url, authorised_user)
+    channel = create_channel(url, regular_user['token'], 'new_channel', True)
+    stream = requests.get(f"{url}/channel/stream",
+                          params={'token': regular_user['token'], 'channel_id': channel['channel_id']},
+                          headers={'Accept': 'text/event-stream'}, stream=True, timeout=5)
+    assert stream.headers['Content-Type'].startswith('text/event-stream')
+
+    requests.post(f"{url}/message/send",
+                  json={
+                      'token': regular_user['token'],
+                      'channel_id': channel['channel_id'],
+                      'message': "streamed"
+                  })
+    received = {}
+    for line in stream.iter_lines(chunk_size=1, decode_unicode=True):
+        if line.startswith(':'):
+            continue
+        if not line and received:
+            break
+        field, _, value = line.partition(': ')
+        received[field] = value
+    stream.close()
+    assert received['event'] == 'send'
+    assert json.loads(received['data'])['message']['message'] == "streamed"
+
+
+def test_channel_stream_ends_on_leave(url):
+    '''
+    A user's event stream ends after their leave event, so they get nothing
+    sent to the channel afterwards
+    '''
+    requests.delete(f"{url}/clear")
+    owner = register_user(url, authorised_user)
+    member = register_user(url, second_user)
+    channel = create_channel(url, owner['token'], 'new_channel', True)
+    requests.post(f"{url}/channel/join", json={'token': member['token'], 'channel_id': channel['channel_id']})
+    stream = requests.get(f"{url}/channel/stream",
+                          params={'token': member['token'], 'channel_id': channel['channel_id']},
+                          headers={'Accept': 'text/event-stream'}, stream=True, timeout=5)
+
+    requests.post(f"{url}/channel/leave", json={'token': member['token'], 'channel_id': channel['channel_id']})
+    requests.post(f"{url}/message/send",
+                  json={'token': owner['token'], 'channel_id': channel['channel_id'], 'message': "private"})
+    # the response ends by itself
+    received = [line for line in stream.iter_lines(chunk_size=1, decode_unicode=True)
+                if line.startswith('event: ')]
+    stream.close()
+    assert received == ['event: leave']
+
+
+def test_channel_conditional_get(url):
+    '''
+    Asks again for messages and details with the ETag it got, and only gets
+    them again once they have changed
+    '''
+    requests.delete(f"{url}/clear")
+    owner = register_user(url, authorised_user)
+    member = register_user(url, second_user)
+    channel = create_channel(url, owner['token'], 'new_channel', True)
+    messages_args = {'token': owner['token'], 'channel_id': channel['channel_id'], 'start': 0}
+    details_args = {'token': owner['token'], 'channel_id': channel['channel_id']}
+
+    first = requests.get(f"{url}/channel/messages", params=messages_args)
+    details = requests.get(f"{url}/channel/details", params=details_args)
+    assert first.headers['ETag'] and details.headers['ETag']
+    unchanged = requests.get(f"{url}/channel/messages", params=messages_args,
+                             headers={'If-None-Match': first.headers['ETag']})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b''
+    assert unchanged.headers['ETag'] == first.headers['ETag']
+
+    # a new message changes the messages but not the details
+    requests.post(f"{url}/message/send",
+                  json={'token': owner['token'], 'channel_id': channel['channel_id'], 'message': "hello"})
+    changed = requests.get(f"{url}/channel/messages", params=messages_args,
+                           headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+    assert [message['message'] for message in changed.json()['messages']] == ["hello"]
+    assert requests.get(f"{url}/channel/details", params=details_args,
+                        headers={'If-None-Match': details.headers['ETag']}).status_code == 304
+
+    # someone joining changes the details
+    requests.post(f"{url}/channel/join", json={'token': member['token'], 'channel_id': channel['channel_id']})
+    assert requests.get(f"{url}/channel/details", params=details_args,
+                        headers={'If-None-Match': details.headers['ETag']}).status_code == 200
+
+    # the tag is per user and per query
+    assert requests.get(f"{url}/channel/messages",
+                        params=dict(messages_args, token=member['token']),
+                        headers={'If-None-Match': changed.headers['ETag']}).status_code == 200
+    assert requests.get(f"{url}/channel/messages",
+                        params=dict(messages_args, limit=1),
+                        headers={'If-None-Match': changed.headers['ETag']}).status_code == 200
+
+    # a bad token is still an error
+    assert requests.get(f"{url}/channel/messages",
+                        params=dict(messages_args, token='not a token'),
+                        headers={'If-None-Match': changed.headers['ETag']}).status_code == 400
+
+
 def test_channel_messages_not_enough_messages_remaining(url):
     '''
     Checks if there the right amount of messages left.
@@ -1,13 +1,19 @@
 '''
 Channel Test
 '''
+import json
 import pytest
 from auth import auth_login, auth_register, auth_register
 from channel import channel_invite, channel_details, channel_messages, channel_leave, channel_join, channel_addowner, channel_removeowner
+from channel import channel_stream, channel_stream_open
 from channels import channels_create
 from error import InputError, AccessError
 from other import clear
-from message import message_send
+from message import message_send, message_edit, message_remove
+from threading import Timer
+import config
+import events
+import store
 
 # variables to represent invalid id's
 INVALID_U_ID = 99999999999
@@ -258,6 +264,190 @@ def test_channel_messages_not_enough_messages_remaining():
     clear()
 
 
+def test_channel_messages_before_and_after():
+    clear()
+
+    authorised_user = register_and_login()
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+
+    # sending 100 simple messages, with latest message being 0 and oldest 99
+    sent = []
+    for i in range(0, 100):
+        sent.append(message_send(authorised_user['token'], channel['channel_id'],
+                                 f"{99 - i}")['message_id'])
+
+    first_page = channel_messages(authorised_user['token'], channel['channel_id'], 0, limit=30)
+    assert [message['message'] for message in first_page['messages']] == [f'{j}' for j in range(30)]
+    assert first_page['end'] == 30
+
+    # new messages don't move the next page along
+    message_send(authorised_user['token'], channel['channel_id'], "newest")
+    older = channel_messages(authorised_user['token'], channel['channel_id'],
+                             before_message_id=first_page['messages'][-1]['message_id'], limit=30)
+    assert [message['message'] for message in older['messages']] == [f'{j}' for j in range(30, 60)]
+    assert older['before_message_id'] == sent[40]
+    assert older['after_message_id'] == sent[69]
+
+    oldest = channel_messages(authorised_user['token'], channel['channel_id'],
+                              before_message_id=sent[10], limit=30)
+    assert [message['message'] for message in oldest['messages']] == [f'{j}' for j in range(90, 100)]
+    assert oldest['before_message_id'] is None
+
+    newer = channel_messages(authorised_user['token'], channel['channel_id'],
+                             after_message_id=sent[95])
+    assert [message['message'] for message in newer['messages']] == ['newest', '0', '1', '2', '3']
+    assert newer['after_message_id'] is None
+    assert newer['before_message_id'] == sent[96]
+
+    clear()
+
+
+def test_channel_stream():
+    clear()
+
+    authorised_user = register_and_login()
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+    sent = message_send(authorised_user['token'], channel['channel_id'], "first")
+    message_edit(authorised_user['token'], sent['message_id'], "edited")
+    message_remove(authorised_user['token'], sent['message_id'])
+
+    # everything after since is returned straight away
+    found, last_id = channel_stream(authorised_user['token'], channel['channel_id'], 0)
+    assert [event.type for event in found] == ['join', 'send', 'edit', 'remove']
+    assert json.loads(found[2].json)['message']['message'] == "edited"
+
+    # with nothing newer, it waits for the next event
+    later = Timer(0.2, message_send, args=[authorised_user['token'], channel['channel_id'], "later"])
+    later.start()
+    found, newest = channel_stream(authorised_user['token'], channel['channel_id'], last_id, timeout=5)
+    later.join()
+    assert [json.loads(event.json)['message']['message'] for event in found] == ["later"]
+    assert newest > last_id
+
+    # and gives up after timeout
+    assert channel_stream(authorised_user['token'], channel['channel_id'], newest, timeout=0.1) == ([], newest)
+
+    clear()
+
+
+def test_channel_stream_ends_on_leave():
+    clear()
+
+    authorised_user = register_and_login()
+    other_user = auth_register("other@gmail.com", "valid_password", "Other", "User")
+    channel = channels_create(authorised_user['token'], "new_channel", False)
+    channel_invite(authorised_user['token'], channel['channel_id'], other_user['u_id'])
+    owner_stream, _ = channel_stream_open(authorised_user['token'], channel['channel_id'])
+    other_stream, _ = channel_stream_open(other_user['token'], channel['channel_id'])
+
+    channel_leave(other_user['token'], channel['channel_id'])
+    message_send(authorised_user['token'], channel['channel_id'], "private")
+
+    # the user leaving gets their leave event and nothing sent after it
+    assert [event.type for event in other_stream.wait(1)] == ['leave']
+    assert other_stream.closed
+    assert other_stream.wait(1) == []
+    assert [event.type for event in owner_stream.take()] == ['leave', 'send']
+    assert not owner_stream.closed
+    for subscription in (owner_stream, other_stream):
+        events.unsubscribe(subscription)
+
+    clear()
+
+
+def test_channel_stream_errors():
+    clear()
+
+    authorised_user = register_and_login()
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+    other_user = auth_register("other@gmail.com", "valid_password", "Other", "User")
+    with pytest.raises(InputError):
+        channel_stream(authorised_user['token'], INVALID_CHANNEL_ID, 0, timeout=0)
+    with pytest.raises(AccessError):
+        channel_stream(other_user['token'], channel['channel_id'], 0, timeout=0)
+
+    clear()
+
+
+def test_channel_messages_cursor_removed():
+    clear()
+
+    authorised_user = register_and_login()
+    token = authorised_user['token']
+    channel = channels_create(token, "new_channel", True)
+    sent = [message_send(token, channel['channel_id'], f"{i}")['message_id'] for i in range(10)]
+
+    first_page = channel_messages(token, channel['channel_id'], 0, limit=3)
+    assert [message['message'] for message in first_page['messages']] == ['9', '8', '7']
+    # the cursor message is removed before the next page is asked for
+    message_remove(token, first_page['messages'][-1]['message_id'])
+    older = channel_messages(token, channel['channel_id'],
+                             before_message_id=first_page['messages'][-1]['message_id'], limit=3)
+    assert [message['message'] for message in older['messages']] == ['6', '5', '4']
+
+    # and so are the messages it would stand in for
+    message_remove(token, sent[6])
+    message_remove(token, sent[5])
+    older = channel_messages(token, channel['channel_id'], before_message_id=sent[7], limit=3)
+    assert [message['message'] for message in older['messages']] == ['4', '3', '2']
+    newer = channel_messages(token, channel['channel_id'], after_message_id=sent[6], limit=3)
+    assert [message['message'] for message in newer['messages']] == ['9', '8']
+
+    # with nothing older left, before is empty and after starts from the oldest
+    message_remove(token, sent[0])
+    assert channel_messages(token, channel['channel_id'], before_message_id=sent[0])['messages'] == []
+    newer = channel_messages(token, channel['channel_id'], after_message_id=sent[0], limit=2)
+    assert [message['message'] for message in newer['messages']] == ['2', '1']
+
+    clear()
+
+
+def test_channel_messages_cursor_removed_long_ago(monkeypatch):
+    clear()
+    monkeypatch.setattr(config, 'REMOVED_CURSORS', 2)
+
+    authorised_user = register_and_login()
+    token = authorised_user['token']
+    channel = channels_create(token, "new_channel", True)
+    sent = [message_send(token, channel['channel_id'], f"{i}")['message_id'] for i in range(6)]
+    for message_id in sent[1:4]:
+        message_remove(token, message_id)
+
+    # only the two most recently removed are remembered
+    assert list(store.removed_messages) == sent[2:4]
+    older = channel_messages(token, channel['channel_id'], before_message_id=sent[3])
+    assert [message['message'] for message in older['messages']] == ['0']
+    # the first one was forgotten, as a cursor it is rejected rather than guessed
+    with pytest.raises(InputError):
+        channel_messages(token, channel['channel_id'], before_message_id=sent[1])
+
+    clear()
+
+
+def test_channel_messages_cursor_errors():
+    clear()
+
+    authorised_user = register_and_login()
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+    other_channel = channels_create(authorised_user['token'], "other_channel", True)
+    message = message_send(authorised_user['token'], channel['channel_id'], "hello")
+    other = message_send(authorised_user['token'], other_channel['channel_id'], "hello")
+
+    # message not in the channel
+    with pytest.raises(InputError):
+        channel_messages(authorised_user['token'], channel['channel_id'],
+                         before_message_id=other['message_id'])
+    # both directions at once
+    with pytest.raises(InputError):
+        channel_messages(authorised_user['token'], channel['channel_id'],
+                         before_message_id=message['message_id'],
+                         after_message_id=message['message_id'])
+    with pytest.raises(InputError):
+        channel_messages(authorised_user['token'], channel['channel_id'], 0, limit=0)
+
+    clear()
+
+
 def test_channel_messages_input_error():
     # Cant do regular tests as no messages can be sent, according to piazza's instructors answer:
 
@@ -326,6 +516,37 @@ def test_channel_leave_regular():
     clear()
 
 
+def test_channel_leave_keeps_member_order():
+
+    clear()
+
+    authorised_user = register_and_login()
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+
+    # invite two new users, then have the one in the middle leave
+    middle_user = auth_register("newEmail@gmail.com", "new_password", "New",
+                                "Last")
+    last_user = auth_register("lastEmail@gmail.com", "last_password", "Last",
+                              "User")
+    channel_invite(authorised_user['token'], channel['channel_id'],
+                   middle_user['u_id'])
+    channel_invite(authorised_user['token'], channel['channel_id'],
+                   last_user['u_id'])
+    channel_leave(middle_user['token'], channel['channel_id'])
+
+    # remaining members should be in the order they joined
+    details = channel_details(authorised_user['token'], channel['channel_id'])
+    assert [member['u_id'] for member in details['all_members']] == [
+        authorised_user['u_id'], last_user['u_id']
+    ]
+
+    # the user who left can no longer see the channel
+    with pytest.raises(AccessError):
+        channel_details(middle_user['token'], channel['channel_id'])
+
+    clear()
+
+
 def test_channel_leave_input_error():
     clear()
 
@@ -2,8 +2,14 @@
 Channel
 '''
 from global_dic import data
+import store
+from history import ChannelHistory
+from concurrency import channels_lock, channel_lock
+import persistence
+import events
+import versions
 from error import InputError
-from utils import decode_token, check_token
+from utils import decode_token, check_token, get_user_from_token
 from channels_helper import valid_channel_name
 
 
@@ -12,8 +18,7 @@ from channels_helper import valid_channel_name
 ###################
 def channels_list(token):
     ''' 
-    Loops through the list of channels and each member in that channel,
-    checking if the current user is part of that channel. If so, add
+    Looks up the channels the current user is part of and adds
     the channel details to the authorized_channels list. 
     
     Return: a list of channels the user is part of
@@ -22,27 +27,20 @@ def channels_list(token):
 
     u_id = decode_token(token)
     authorized_channels = []
-    # Loops through all channels
-    for channels in data["channels"]:
-        # Loops through all members of that channel
-        for members in channels["all_members"]:
-            # Checks if user is part of this channel
-            if members["u_id"] == u_id:
-                # Add details to the authorized_channels list
-                authorized_channels.append({
-                    "channel_id": channels["channel_id"],
-                    "name": channels["name"]
-                })
-                # Speed up the search efficiency, by iterating to the next channel after being added to the list
-                break
+    # Loops through only the channels this user is part of
+    for channels in store.list_user_channels(u_id):
+        # Add details to the authorized_channels list
+        authorized_channels.append({
+            "channel_id": channels["channel_id"],
+            "name": channels["name"]
+        })
     return {'channels': authorized_channels}
 
 
 def channels_listall(token):
     ''' 
-    Adds all public channels and loops through the list private 
-    of channels, checking if the current user is part of that channel. If so, add
-    the channel details to the authorized_channels list. 
+    Adds all public channels and the private channels the current
+    user is part of to the authorized_channels list. 
 
     Return: a list of all public channels and any private channels the user is part of
     '''
@@ -50,27 +48,12 @@ def channels_listall(token):
 
     u_id = decode_token(token)
     authorized_channels = []
-    # Loops through all channels
-    for channels in data["channels"]:
-        if channels['is_public'] == True:
-            authorized_channels.append({
-                "channel_id": channels["channel_id"],
-                "name": channels["name"]
-            })
-        else:
-            # Loops through all members of that channel
-            for members in channels["all_members"]:
-                # Checks if the channel is public or user is part of this channel
-                if members["u_id"] == u_id:
-                    # Add details to the authorised_channels list
-                    authorized_channels.append({
-                        "channel_id":
-                        channels["channel_id"],
-                        "name":
-                        channels["name"]
-                    })
-                    # Prevent duplicates by breaking out of the loop once details have been added
-                    break
+    # Loops through public channels and private channels the user is part of
+    for channels in store.list_visible_channels(u_id):
+        authorized_channels.append({
+            "channel_id": channels["channel_id"],
+            "name": channels["name"]
+        })
     return {'channels': authorized_channels}
 
 
@@ -84,29 +67,16 @@ def channels_create(token, name, is_public):
     u_id = decode_token(token)
     # Name is over 20 characters long or empty or space => input error
     valid_channel_name(name)
-    # The next available id
-    available_id = len(data["channels"])
-
     # obtaining the correct user and assigning it to variable person
-    for user in data["users"]:
-        if token == user["token"]:
-            person = user
-            break
+    person = get_user_from_token(token)
 
     # creating a list of owners that will have global permissions across all channels
-    list_of_owners = []
-
-    for user in data['users']:
-        if user['is_flockr_owner']:
-            list_of_owners.append(user)
-
+    list_of_owners = store.list_flockr_owners()
 
     # Form the data structure
-    data["channels"].append({
+    new_channel = {
         "name":
         name,
-        "channel_id":
-        available_id,
         "is_public":
         is_public,
         "owner_members": [{
@@ -119,14 +89,13 @@ def channels_create(token, name, is_public):
             "name_first": person["first_name"],
             "name_last": person["last_name"]
         }],
-        "messages": [],
+        # sets of u_ids for quick membership checks, kept in sync with the lists above
+        "owner_ids": {u_id},
+        "member_ids": {u_id},
+        # made once the channel_id is known, as it is guarded by the channel's lock
+        "messages": None,
         "standup": [],
-    })
-
-    # grabbing channel we just created
-    for channel in data['channels']:
-        if channel['channel_id'] == available_id:
-            new_channel = channel
+    }
 
     # adding all flockr owners as members to channel
     for owner in list_of_owners:
@@ -134,6 +103,30 @@ def channels_create(token, name, is_public):
         if owner['token'] != token:
             new_channel['owner_members'].append(user_info)
             new_channel['all_members'].append(user_info)
-
+            new_channel['owner_ids'].add(owner['u_id'])
+            new_channel['member_ids'].add(owner['u_id'])
+
+    # the id is taken and the channel added together, so no two channels get the same id
+    with channels_lock:
+        # The next available id
+        available_id = len(data["channels"])
+        new_channel["channel_id"] = available_id
+        new_channel["messages"] = ChannelHistory(lock=channel_lock(available_id))
+        store.insert_channel(new_channel)
+
+    persistence.record_channel(new_channel)
+    # the members' feeds start following the new channel
+    for member in new_channel['all_members']:
+        events.publish(available_id, 'join', u_id=member['u_id'])
+    versions.bump('channels', *[('member', member['u_id']) for member in new_channel['all_members']])
 
     return {'channel_id': available_id}
+
+
+def channels_feed_open(token):
+    '''
+    Start streaming the events of every channel the user is a member of.
+    Returns the feed, which has to be given to events.unsubscribe once done
+    '''
+    check_token(token)
+    return events.subscribe_user(decode_token(token))
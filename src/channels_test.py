@@ -1,8 +1,10 @@
 import pytest
 from auth import auth_login, auth_register, auth_register
-from channel import channel_invite
-from channels import channels_list, channels_listall, channels_create
-from error import InputError
+from channel import channel_invite, channel_leave
+from channels import channels_list, channels_listall, channels_create, channels_feed_open
+from message import message_send
+from error import InputError, AccessError
+import events
 from other import clear
 from global_dic import data
 
@@ -310,6 +312,29 @@ def test_channels_listall_uninvited():
     clear()
 
 
+def test_channels_list_after_leave():
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    new_user2 = auth_register("validEmail2@gmail.com", "valid_password_2",
+                              "Jason", "Henry")
+
+    channels_create(authorised_user['token'], "public_channel", True)
+    channel_private = channels_create(authorised_user['token'],
+                                      "private_channel", False)
+    channel_invite(authorised_user['token'], channel_private['channel_id'],
+                   new_user2['u_id'])
+    channel_leave(new_user2['token'], channel_private['channel_id'])
+
+    # new_user2 left the private channel, so only the public channel is visible
+    assert channels_list(new_user2['token'])['channels'] == []
+    assert channels_listall(new_user2['token'])['channels'] == [{
+        "channel_id": 0,
+        "name": "public_channel"
+    }]
+    clear()
+
+
 def test_channels_create_fails():
     clear()
     authorised_user = auth_register("validEmail@gmail.com", "valid_password",
@@ -407,3 +432,28 @@ def test_channels_create_private():
                                       False)
     assert channel_private['channel_id'] == 0
     clear()
+
+
+def test_channels_feed():
+    clear()
+    owner = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    user = auth_register("validEmail2@gmail.com", "valid_password_2", "Jason", "Henry")
+    first = channels_create(owner['token'], "first", True)['channel_id']
+    second = channels_create(owner['token'], "second", True)['channel_id']
+    channel_invite(owner['token'], first, user['u_id'])
+
+    # the feed follows the channels the user is in, and ones they are added to later
+    feed = channels_feed_open(user['token'])
+    message_send(owner['token'], first, "in first")
+    message_send(owner['token'], second, "not for the user")
+    channel_invite(owner['token'], second, user['u_id'])
+    message_send(owner['token'], second, "in second")
+    channel_leave(user['token'], first)
+    message_send(owner['token'], first, "after leaving")
+    received = [(event.type, event.channel_id) for event in feed.take()]
+    assert received == [('send', first), ('join', second), ('send', second), ('leave', first)]
+    events.unsubscribe(feed)
+
+    with pytest.raises(AccessError):
+        channels_feed_open("not a token")
+    clear()
@@ -0,0 +1,274 @@
+'''
+Concurrency
+Locks shared by the request threads and the timer threads.
+
+Channels are covered by a fixed number of striped reader/writer locks,
+picked by channel_id, so changes to different channels rarely wait on
+each other. Users have a single reader/writer lock. Functions that change
+users and channels together take the users lock and then every channel
+stripe in order, so there is a single order locks are taken in.
+
+Every lock counts how often it was taken, how often it had to wait and
+how long it waited, which lock_stats reports.
+'''
+from functools import wraps
+from threading import Condition, Lock, get_ident, local
+from time import perf_counter
+import config
+from global_dic import data
+import store
+
+
+class RWLock:
+    '''
+    Reader/writer lock. Many readers or a single writer hold it at once,
+    and waiting writers go before new readers. A thread holding it for
+    writing can take it again for reading or writing.
+    '''
+
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._writers_waiting = 0
+        # read locks held by the current thread
+        self._held = local()
+        self.acquired = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    def _wait(self, blocked):
+        '''
+        Wait until blocked() is False, counting the wait. Called holding _cond
+        '''
+        if not blocked():
+            return
+        self.contended += 1
+        start = perf_counter()
+        while blocked():
+            self._cond.wait()
+        self.wait_time += perf_counter() - start
+
+    def acquire_read(self, blocking=True):
+        '''
+        Take the lock for reading. If not blocking and a writer holds it or
+        is waiting for it, give up straight away. Returns whether it was taken
+        '''
+        with self._cond:
+            if self._writer == get_ident():
+                self.acquired += 1
+                self._depth += 1
+                return True
+            held = getattr(self._held, 'reads', 0)
+            if not held:
+                if not blocking and (self._writer is not None or self._writers_waiting):
+                    return False
+                self._wait(lambda: self._writer is not None or self._writers_waiting)
+            self.acquired += 1
+            self._held.reads = held + 1
+            self._readers += 1
+            return True
+
+    def release_read(self):
+        with self._cond:
+            if self._writer == get_ident():
+                self._release_write()
+                return
+            self._held.reads -= 1
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self.acquired += 1
+            if self._writer == get_ident():
+                self._depth += 1
+                return
+            self._writers_waiting += 1
+            self._wait(lambda: self._writer is not None or self._readers)
+            self._writers_waiting -= 1
+            self._writer = get_ident()
+            self._depth = 1
+
+    def release_write(self):
+        with self._cond:
+            self._release_write()
+
+    def _release_write(self):
+        self._depth -= 1
+        if not self._depth:
+            self._writer = None
+            self._cond.notify_all()
+
+    def reading(self):
+        '''
+        Context manager holding the lock for reading
+        '''
+        return _Held(self.acquire_read, self.release_read)
+
+    def writing(self):
+        '''
+        Context manager holding the lock for writing
+        '''
+        return _Held(self.acquire_write, self.release_write)
+
+
+class _Held:
+    '''
+    Context manager calling acquire on entry and release on exit
+    '''
+    __slots__ = ('acquire', 'release')
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# one lock per stripe of channels, and one for every user
+channel_stripes = [RWLock() for _ in range(max(1, config.LOCK_STRIPES))]
+users_lock = RWLock()
+# held while a new channel is given its id and added
+channels_lock = Lock()
+# held while a new message_id is handed out
+_ids_lock = Lock()
+
+
+def _stripe(channel_id):
+    '''
+    Index of the stripe covering channel_id
+    '''
+    try:
+        stripe = hash(channel_id)
+    except TypeError:
+        # invalid channel ids still need a lock, the function will reject them
+        stripe = 0
+    return stripe % len(channel_stripes)
+
+
+def channel_lock(channel_id):
+    '''
+    The lock of the stripe covering channel_id
+    '''
+    return channel_stripes[_stripe(channel_id)]
+
+
+def reading_channels(channel_ids):
+    '''
+    Context manager holding the locks of every channel in channel_ids for
+    reading. The stripes are taken in order, like writes_everything takes them
+    '''
+    locks = [channel_stripes[stripe] for stripe in sorted({_stripe(channel_id) for channel_id in channel_ids})]
+
+    def acquire():
+        for lock in locks:
+            lock.acquire_read()
+
+    def release():
+        for lock in reversed(locks):
+            lock.release_read()
+    return _Held(acquire, release)
+
+
+def next_message_id():
+    '''
+    Hand out the next message_id
+    '''
+    with _ids_lock:
+        data["message_count"] += 1
+        return data["message_count"]
+
+
+def reads_channel(func):
+    '''
+    Decorator holding the channel's lock for reading, the channel_id being the second argument
+    '''
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with channel_lock(args[1]).reading():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def writes_channel(func):
+    '''
+    Decorator holding the channel's lock for writing, the channel_id being the second argument
+    '''
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with channel_lock(args[1]).writing():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def writes_message_channel(func):
+    '''
+    Decorator holding the lock of the channel holding a message for writing,
+    the message_id being the second argument
+    '''
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        location = store.locate_message(args[1])
+        if location is None:
+            # the function raises the error for a missing message
+            return func(*args, **kwargs)
+        with channel_lock(location[0]["channel_id"]).writing():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def writes_users(func):
+    '''
+    Decorator holding the users lock for writing
+    '''
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with users_lock.writing():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def writes_everything(func):
+    '''
+    Decorator holding the users lock and every channel stripe for writing
+    '''
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        users_lock.acquire_write()
+        for stripe in channel_stripes:
+            stripe.acquire_write()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            for stripe in reversed(channel_stripes):
+                stripe.release_write()
+            users_lock.release_write()
+    return wrapper
+
+
+def _lock_summary(locks):
+    return {
+        'acquired': sum(lock.acquired for lock in locks),
+        'contended': sum(lock.contended for lock in locks),
+        'wait_ms': round(sum(lock.wait_time for lock in locks) * 1000, 3),
+    }
+
+
+def lock_stats():
+    '''
+    How often the channel and user locks were taken, waited on, and for how long
+    '''
+    busiest = max(channel_stripes, key=lambda lock: lock.contended)
+    return {
+        'channel_stripes': len(channel_stripes),
+        'channels': _lock_summary(channel_stripes),
+        'busiest_stripe': _lock_summary([busiest]),
+        'users': _lock_summary([users_lock]),
+    }
@@ -0,0 +1,171 @@
+'''
+Concurrency Test
+'''
+from threading import Thread, Event
+from time import sleep
+import pytest
+from auth import auth_register
+from channel import channel_messages, channel_join
+from channels import channels_create
+from message import message_send, message_remove
+from other import clear, search
+from concurrency import RWLock, channel_lock, lock_stats
+
+
+@pytest.fixture
+def reset():
+    clear()
+    yield
+    clear()
+
+
+def run_threads(target, count):
+    '''
+    Run target(i) in count threads at once and wait for them
+    '''
+    threads = [Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_rwlock_readers_share():
+    lock = RWLock()
+    inside = []
+    both_in = Event()
+
+    def read(_):
+        with lock.reading():
+            inside.append(1)
+            if len(inside) == 2:
+                both_in.set()
+            assert both_in.wait(5)
+
+    run_threads(read, 2)
+    assert both_in.is_set()
+
+
+def test_rwlock_writer_excludes_readers():
+    lock = RWLock()
+    order = []
+    lock.acquire_write()
+    reader = Thread(target=lambda: (lock.acquire_read(), order.append('read'), lock.release_read()))
+    reader.start()
+    sleep(0.1)
+    order.append('write')
+    lock.release_write()
+    reader.join()
+    assert order == ['write', 'read']
+    assert lock.contended == 1
+    assert lock.wait_time > 0
+
+
+def test_rwlock_writer_reenters():
+    lock = RWLock()
+    with lock.writing():
+        with lock.writing():
+            with lock.reading():
+                pass
+    # free again, so another thread can take it
+    taken = []
+    thread = Thread(target=lambda: (lock.acquire_write(), taken.append(1), lock.release_write()))
+    thread.start()
+    thread.join(5)
+    assert taken == [1]
+
+
+def test_rwlock_read_without_blocking():
+    lock = RWLock()
+    taken = []
+    with lock.writing():
+        # the writer can still read, another thread gives up at once
+        assert lock.acquire_read(blocking=False)
+        lock.release_read()
+        thread = Thread(target=lambda: taken.append(lock.acquire_read(blocking=False)))
+        thread.start()
+        thread.join()
+    assert taken == [False]
+    assert lock.contended == 0
+    with lock.reading():
+        assert lock.acquire_read(blocking=False)
+        lock.release_read()
+
+
+def test_channel_lock_is_striped():
+    assert channel_lock(3) is channel_lock(3)
+    assert channel_lock('not an id') is channel_lock('not an id')
+
+
+def test_concurrent_sends(reset):
+    user = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    channels = [channels_create(user['token'], f"channel{i}", True)['channel_id'] for i in range(4)]
+    sent = []
+
+    def send(i):
+        for j in range(50):
+            sent.append(message_send(user['token'], channels[i % 4], f'message {i} {j}')['message_id'])
+
+    run_threads(send, 8)
+    assert len(set(sent)) == 400
+    for channel_id in channels:
+        result = channel_messages(user['token'], channel_id, 0, limit=200)
+        assert len(result['messages']) == 100
+
+
+def test_concurrent_register_and_join(reset):
+    owner = auth_register("owner@gmail.com", "valid_password", "Philgee", "Vlad")
+    channel_id = channels_create(owner['token'], "new_channel", True)['channel_id']
+    users = []
+
+    def register(i):
+        user = auth_register(f"user{i}@gmail.com", "valid_password", "Philgee", "Vlad")
+        channel_join(user['token'], channel_id)
+        users.append(user)
+
+    run_threads(register, 10)
+    assert len({user['u_id'] for user in users}) == 10
+    assert len({user['token'] for user in users}) == 10
+
+
+def test_search_while_messages_are_removed(reset):
+    sender = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    searcher = auth_register("validEmail2@gmail.com", "valid_password", "Tara", "Simons")
+    busy_channel = channels_create(sender['token'], "busy", True)['channel_id']
+    channel_join(searcher['token'], busy_channel)
+    quiet_channel = channels_create(searcher['token'], "quiet", True)['channel_id']
+    message_send(searcher['token'], quiet_channel, "a needle that stays")
+    done = Event()
+    errors = []
+
+    def send_and_remove():
+        for i in range(300):
+            sent = message_send(sender['token'], busy_channel, f"needle {i}")
+            message_remove(sender['token'], sent['message_id'])
+        done.set()
+
+    def run_search(i):
+        token = searcher['token'] if i % 2 else sender['token']
+        while not done.is_set():
+            try:
+                search(token, "needle", limit=5)
+                search(token, "needle")
+            except Exception as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+    writer = Thread(target=send_and_remove)
+    writer.start()
+    run_threads(run_search, 4)
+    writer.join()
+    assert errors == []
+    assert [message['message'] for message in search(searcher['token'], "needle")['messages']
+            ] == ["a needle that stays"]
+
+
+def test_lock_stats(reset):
+    user = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    channels_create(user['token'], "new_channel", True)
+    stats = lock_stats()
+    assert set(stats) == {'channel_stripes', 'channels', 'busiest_stripe', 'users'}
+    assert set(stats['users']) == {'acquired', 'contended', 'wait_ms'}
+    assert stats['users']['acquired'] > 0
@@ -0,0 +1,66 @@
+'''
+Config
+Settings that can be changed through environment variables when starting the server
+'''
+import os
+
+# file that every change is appended to, journaling is off if this is not set
+JOURNAL_PATH = os.environ.get('FLOCKR_JOURNAL')
+
+# when journal writes are fsynced to disk:
+#   always   - every change waits for its fsync, changes arriving together share one
+#   interval - changes are written and fsynced together every JOURNAL_FLUSH_INTERVAL seconds
+#   never    - changes are written every JOURNAL_FLUSH_INTERVAL seconds, the OS decides when to sync
+JOURNAL_FSYNC = os.environ.get('FLOCKR_JOURNAL_FSYNC', 'interval')
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get('FLOCKR_JOURNAL_FLUSH_INTERVAL', '0.05'))
+
+# a snapshot is taken and the journal emptied after this many changes
+SNAPSHOT_EVERY = int(os.environ.get('FLOCKR_SNAPSHOT_EVERY', '10000'))
+
+# SQLite database every change is written to instead of the journal, if this is set.
+# JOURNAL_FSYNC also decides how hard SQLite syncs each change.
+SQLITE_PATH = os.environ.get('FLOCKR_SQLITE')
+
+# channel histories are kept as segments of this many messages
+HISTORY_SEGMENT_SIZE = int(os.environ.get('FLOCKR_HISTORY_SEGMENT_SIZE', '1024'))
+# at most this many segments across every channel are kept in memory,
+# the least recently used ones are spilled to a file in SPILL_DIR
+RESIDENT_SEGMENTS = int(os.environ.get('FLOCKR_RESIDENT_SEGMENTS', '4096'))
+SPILL_DIR = os.environ.get('FLOCKR_SPILL_DIR')
+
+# number of messages channel_messages returns when no limit is given
+MESSAGES_PAGE_SIZE = int(os.environ.get('FLOCKR_MESSAGES_PAGE_SIZE', '50'))
+
+# removed messages leave tombstones, a segment is compacted once this fraction of it is tombstones
+COMPACT_RATIO = float(os.environ.get('FLOCKR_COMPACT_RATIO', '0.25'))
+# page cursors on this many of the most recently removed messages still work,
+# older ones are rejected
+REMOVED_CURSORS = int(os.environ.get('FLOCKR_REMOVED_CURSORS', '10000'))
+
+# number of striped locks the channels are spread over
+LOCK_STRIPES = int(os.environ.get('FLOCKR_LOCK_STRIPES', '64'))
+
+# number of threads running sendlater messages and standups once they are due
+SCHEDULER_WORKERS = int(os.environ.get('FLOCKR_SCHEDULER_WORKERS', '4'))
+
+# most characters the message collated from a standup can hold, standup/send fails once it is full
+STANDUP_MAX_LENGTH = int(os.environ.get('FLOCKR_STANDUP_MAX_LENGTH', '100000'))
+
+# async_server.py: threads running requests, seconds an idle connection is kept, and the listen backlog
+ASYNC_WORKERS = int(os.environ.get('FLOCKR_ASYNC_WORKERS', '8'))
+ASYNC_IDLE_TIMEOUT = float(os.environ.get('FLOCKR_ASYNC_IDLE_TIMEOUT', '60'))
+ASYNC_BACKLOG = int(os.environ.get('FLOCKR_ASYNC_BACKLOG', '1024'))
+# largest request body async_server.py accepts, in bytes, larger ones get a 413
+ASYNC_MAX_BODY = int(os.environ.get('FLOCKR_ASYNC_MAX_BODY', '10485760'))
+
+# /channel/stream: events queued per subscriber and kept per channel, the longest a
+# long-poll waits, and how often an idle event stream is sent a keep-alive comment
+STREAM_QUEUE_SIZE = int(os.environ.get('FLOCKR_STREAM_QUEUE_SIZE', '256'))
+STREAM_TIMEOUT = float(os.environ.get('FLOCKR_STREAM_TIMEOUT', '30'))
+STREAM_HEARTBEAT = float(os.environ.get('FLOCKR_STREAM_HEARTBEAT', '15'))
+
+# JSON encoder for responses: orjson, ujson or json. The fastest one installed is used if not set
+JSON_ENCODER = os.environ.get('FLOCKR_JSON_ENCODER')
+
+# /batch: the most operations one request can run
+BATCH_MAX_OPERATIONS = int(os.environ.get('FLOCKR_BATCH_MAX_OPERATIONS', '100'))
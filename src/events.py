@@ -0,0 +1,279 @@
+'''
+Events
+Message changes published to whoever is streaming a channel.
+
+Each event is serialized to JSON once when it is published, and that same
+string is handed to every subscriber. Every subscriber has its own queue
+of at most config.STREAM_QUEUE_SIZE events. A subscriber that falls that
+far behind loses its oldest events and gets a 'resync' event telling it
+to fetch the channel's messages again, so a slow reader never holds more
+than its queue.
+
+The last config.STREAM_QUEUE_SIZE events of every channel are also kept,
+so a long-poll client can ask for everything after the last event it saw.
+
+A Feed is one queue for every channel a user is a member of. 'join' and
+'leave' events of the user add and remove channels from it, so it
+follows the user without them opening a stream per channel. A user's
+stream of a single channel is closed once they leave it.
+'''
+from collections import deque
+import json
+from threading import Condition, Lock
+import config
+import serialization
+import store
+
+# events that change who is in a channel, and so which channels a Feed follows
+MEMBERSHIP_EVENTS = ('join', 'leave')
+
+# held while subscribers and recent events are changed
+_lock = Lock()
+# channel_id -> set of Subscriptions
+_subscribers = {}
+# u_id -> set of Feeds
+_feeds = {}
+# channel_id -> deque of the latest Events
+_recent = {}
+# channel_id -> id of the newest event dropped from _recent
+_forgotten = {}
+# id of the newest event published to any channel
+_last_id = 0
+
+
+class Event:
+    '''
+    A published event and its JSON
+    '''
+    __slots__ = ('event_id', 'type', 'channel_id', 'json', 'frame')
+
+    def __init__(self, event_id, event_type, channel_id, encoded):
+        self.event_id = event_id
+        self.type = event_type
+        self.channel_id = channel_id
+        self.json = encoded
+        # the event as a WebSocket frame, made by websocket.event_frame when first sent
+        self.frame = None
+
+    def sse(self):
+        '''
+        The event as a Server-Sent Events frame
+        '''
+        return f'id: {self.event_id}\nevent: {self.type}\ndata: {self.json}\n\n'
+
+
+def resync_event(channel_id):
+    '''
+    Event telling a subscriber it missed some events
+    '''
+    return Event(0, 'resync', channel_id, json.dumps({'type': 'resync', 'channel_id': channel_id}))
+
+
+class Subscription:
+    '''
+    Queue of the events published to a channel since subscribing, for u_id
+    '''
+
+    def __init__(self, channel_id, u_id=None):
+        self.channel_id = channel_id
+        # channels whose events are queued, changed with _lock held
+        self.channel_ids = {channel_id}
+        # user the events are for, followed by a Feed
+        self.u_id = u_id
+        # set once no more events will be queued, after the user left the channel
+        self.closed = False
+        self._events = deque()
+        # channels some of whose events were dropped because the queue was full
+        self.missed = set()
+        self._ready = Condition(Lock())
+        # called from the publishing thread after an event is queued
+        self.on_event = None
+
+    def put(self, event):
+        '''
+        Queue an event, dropping the oldest one if the queue is full
+        '''
+        with self._ready:
+            if len(self._events) >= config.STREAM_QUEUE_SIZE:
+                self.missed.add(self._events.popleft().channel_id)
+            self._events.append(event)
+            self._ready.notify()
+        if self.on_event is not None:
+            self.on_event()
+
+    def close(self):
+        '''
+        Stop the subscription for good, waking whoever is waiting on it
+        '''
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+        if self.on_event is not None:
+            self.on_event()
+
+    def take(self):
+        '''
+        Every queued event, starting with a resync event for each channel
+        some were dropped from
+        '''
+        with self._ready:
+            events = [resync_event(channel_id) for channel_id in sorted(self.missed)]
+            events.extend(self._events)
+            self._events.clear()
+            self.missed.clear()
+        return events
+
+    def wait(self, timeout):
+        '''
+        Take the queued events, waiting up to timeout seconds for one if there are none
+        '''
+        with self._ready:
+            if not self._events and not self.missed and not self.closed:
+                self._ready.wait(timeout)
+        return self.take()
+
+
+class Feed(Subscription):
+    '''
+    Queue of the events of every channel a user is a member of
+    '''
+
+    def __init__(self, u_id):
+        super().__init__(None, u_id)
+        self.channel_ids = set()
+
+
+def _follow(subscription, channel_id):
+    '''
+    Queue a channel's events for a subscription, with _lock held
+    '''
+    subscription.channel_ids.add(channel_id)
+    _subscribers.setdefault(channel_id, set()).add(subscription)
+
+
+def _unfollow(subscription, channel_id):
+    '''
+    Stop queueing a channel's events for a subscription, with _lock held
+    '''
+    subscription.channel_ids.discard(channel_id)
+    subscribers = _subscribers.get(channel_id)
+    if subscribers is not None:
+        subscribers.discard(subscription)
+        if not subscribers:
+            del _subscribers[channel_id]
+
+
+def subscribe(channel_id, u_id=None):
+    '''
+    Start queueing the events of a channel for u_id, until they leave it
+    '''
+    subscription = Subscription(channel_id, u_id)
+    with _lock:
+        _follow(subscription, channel_id)
+    return subscription
+
+
+def subscribe_user(u_id):
+    '''
+    Start queueing the events of every channel a user is a member of
+    '''
+    feed = Feed(u_id)
+    with _lock:
+        # membership events are published with _lock held, so none can come
+        # between reading the user's channels and following them
+        _feeds.setdefault(u_id, set()).add(feed)
+        for channel in store.list_user_channels(u_id):
+            _follow(feed, channel['channel_id'])
+    return feed
+
+
+def unsubscribe(subscription):
+    '''
+    Stop queueing events for a subscription
+    '''
+    with _lock:
+        for channel_id in list(subscription.channel_ids):
+            _unfollow(subscription, channel_id)
+        feeds = _feeds.get(subscription.u_id)
+        if feeds is not None:
+            feeds.discard(subscription)
+            if not feeds:
+                del _feeds[subscription.u_id]
+
+
+def publish(channel_id, event_type, **fields):
+    '''
+    Send an event to everyone streaming a channel. Messages are given as
+    message=Message and sent as their dict, membership events give the u_id
+    of the user joining or leaving. Called with the channel locked
+    '''
+    global _last_id
+    message = fields.pop('message', None)
+    # the message's cached JSON, the same channel/messages sends
+    start = b'{' if message is None else b'{"message":' + serialization.message_json(message) + b','
+    with _lock:
+        _last_id += 1
+        event_id = _last_id
+        encoded = serialization.dumps(dict(fields, id=event_id, type=event_type, channel_id=channel_id))
+        event = Event(event_id, event_type, channel_id, (start + encoded[1:]).decode())
+        recent = _recent.setdefault(channel_id, deque())
+        recent.append(event)
+        if len(recent) > config.STREAM_QUEUE_SIZE:
+            _forgotten[channel_id] = recent.popleft().event_id
+        # a user joining gets the join event on their feeds, and so does one leaving
+        if event_type in MEMBERSHIP_EVENTS:
+            feeds = list(_feeds.get(fields['u_id'], ()))
+        if event_type == 'join':
+            for feed in feeds:
+                _follow(feed, channel_id)
+        subscribers = list(_subscribers.get(channel_id, ()))
+        # and their streams of the channel end with it
+        leaving = []
+        if event_type == 'leave':
+            for feed in feeds:
+                _unfollow(feed, channel_id)
+            leaving = [subscription for subscription in subscribers
+                       if not isinstance(subscription, Feed) and subscription.u_id == fields['u_id']]
+            for subscription in leaving:
+                _unfollow(subscription, channel_id)
+    for subscription in subscribers:
+        subscription.put(event)
+    for subscription in leaving:
+        subscription.close()
+    return event
+
+
+def events_since(channel_id, since):
+    '''
+    The kept events of a channel newer than event id since, starting with a
+    resync event if some newer ones are no longer kept
+    '''
+    with _lock:
+        events = [event for event in _recent.get(channel_id, ()) if event.event_id > since]
+        if since < _forgotten.get(channel_id, 0):
+            events.insert(0, resync_event(channel_id))
+    return events
+
+
+def last_event_id():
+    '''
+    Id of the newest event published to any channel
+    '''
+    return _last_id
+
+
+def encode_events(events, last_id):
+    '''
+    JSON body of a long-poll response, built from the events' JSON without decoding it
+    '''
+    return '{"events": [' + ', '.join(event.json for event in events) + \
+        f'], "last_event_id": {last_id}}}'
+
+
+def clear():
+    '''
+    Forget the kept events. Subscribers stay subscribed
+    '''
+    with _lock:
+        _recent.clear()
+        _forgotten.clear()
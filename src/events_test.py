@@ -0,0 +1,106 @@
+'''
+Events Test
+'''
+import json
+import pytest
+import config
+import events
+from message_record import Message
+
+
+@pytest.fixture
+def small_queues(monkeypatch):
+    monkeypatch.setattr(config, 'STREAM_QUEUE_SIZE', 3)
+    events.clear()
+    yield
+    events.clear()
+
+
+def test_event_serialized_once(small_queues):
+    first = events.subscribe(5)
+    second = events.subscribe(5)
+    other = events.subscribe(6)
+    published = events.publish(5, 'send', message=Message(0, 1, 100, 'hello'))
+    received = first.take()
+    assert received == [published]
+    # every subscriber gets the very same encoded event
+    assert second.take()[0].json is received[0].json
+    assert other.take() == []
+    decoded = json.loads(received[0].json)
+    assert decoded['type'] == 'send'
+    assert decoded['channel_id'] == 5
+    assert decoded['message']['message'] == 'hello'
+    for subscription in (first, second, other):
+        events.unsubscribe(subscription)
+
+
+def test_slow_subscriber_is_bounded(small_queues):
+    subscription = events.subscribe(5)
+    for message_id in range(10):
+        events.publish(5, 'remove', message_id=message_id)
+    received = subscription.take()
+    # only the newest events are kept, after a resync event
+    assert [event.type for event in received] == ['resync', 'remove', 'remove', 'remove']
+    assert [json.loads(event.json)['message_id'] for event in received[1:]] == [7, 8, 9]
+    assert subscription.take() == []
+    events.unsubscribe(subscription)
+
+
+def test_events_since(small_queues):
+    published = [events.publish(5, 'remove', message_id=i) for i in range(5)]
+    newest = published[-1].event_id
+    assert events.events_since(5, newest) == []
+    assert events.events_since(5, published[3].event_id) == [published[4]]
+    # events older than the kept ones have been forgotten
+    assert [event.type for event in events.events_since(5, 0)] == ['resync', 'remove', 'remove', 'remove']
+    body = json.loads(events.encode_events(published[2:], newest))
+    assert [event['message_id'] for event in body['events']] == [2, 3, 4]
+    assert body['last_event_id'] == newest
+
+
+def test_feed_follows_membership(small_queues):
+    feed = events.subscribe_user(4)
+    events.publish(7, 'send', message=Message(0, 1, 100, 'before joining'))
+    assert feed.take() == []
+    events.publish(7, 'join', u_id=4)
+    events.publish(8, 'join', u_id=4)
+    sent = events.publish(7, 'send', message=Message(1, 1, 100, 'hello'))
+    assert [event.type for event in feed.take()] == ['join', 'join', 'send']
+    # the very event every other subscriber of the channel gets
+    assert sent.channel_id == 7
+    left = events.publish(7, 'leave', u_id=4)
+    events.publish(7, 'send', message=Message(2, 1, 100, 'after leaving'))
+    events.publish(8, 'remove', message_id=1)
+    assert [event.type for event in feed.take()] == ['leave', 'remove']
+    assert left.channel_id == 7
+    events.unsubscribe(feed)
+    events.publish(8, 'remove', message_id=2)
+    assert feed.take() == []
+
+
+def test_feed_resyncs_each_channel(small_queues):
+    feed = events.subscribe_user(4)
+    events.publish(7, 'join', u_id=4)
+    events.publish(8, 'join', u_id=4)
+    for message_id in range(3):
+        events.publish(7, 'remove', message_id=message_id)
+        events.publish(8, 'remove', message_id=message_id)
+    received = feed.take()
+    assert [(event.type, event.channel_id) for event in received] == [
+        ('resync', 7), ('resync', 8), ('remove', 8), ('remove', 7), ('remove', 8)]
+    events.unsubscribe(feed)
+
+
+def test_subscription_closed_on_leave(small_queues):
+    leaving = events.subscribe(5, u_id=1)
+    staying = events.subscribe(5, u_id=2)
+    events.publish(5, 'leave', u_id=1)
+    events.publish(5, 'remove', message_id=1)
+    assert [event.type for event in leaving.take()] == ['leave']
+    assert leaving.closed
+    # waiting on a closed subscription returns straight away
+    assert leaving.wait(5) == []
+    assert [event.type for event in staying.take()] == ['leave', 'remove']
+    assert not staying.closed
+    for subscription in (leaving, staying):
+        events.unsubscribe(subscription)
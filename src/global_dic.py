@@ -1,9 +1,13 @@
 # global dict that will be populated as functions are called
+# users and channels should be added through store.py so its indexes stay in sync
 data = {
     "users": [],
     "channels": [],
-    "standup": [],
+    # channel_id -> standup running in it, see standup.py
+    "standup": {},
     "message_count": 0,
+    # job_id -> scheduled job that has not run yet, see scheduler.py
+    "jobs": {},
 }
 
 # An example of how data would look like when populated
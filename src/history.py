@@ -0,0 +1,539 @@
+'''
+History
+The messages of a channel, oldest first, kept as fixed-size segments.
+Only the most recently used segments across every channel stay in memory,
+up to config.RESIDENT_SEGMENTS of them. Older ones are pickled into a
+spill file and read back through a memory map the next time they are used.
+Messages sent to a channel whose newest segment is spilled are added to
+the spill file on their own, without reading the segment back. Copies
+replaced by newer ones are counted, and once they take up more of the
+spill file than the live copies it is written again without them.
+
+A message is found by the segment it was put in and its message_id, and
+the message_ids of every segment stay in memory so spilled segments are
+only read back when their messages are needed.
+
+Removing a message leaves a tombstone in its place, which reads skip.
+Once config.COMPACT_RATIO of a segment is tombstones, a background
+thread rewrites the segment without them. Messages never move to another
+segment, so nothing pointing at a segment has to change.
+
+Each history is guarded by its channel's stripe lock, taken for reading
+or writing by every operation. The module lock only covers which segments
+are resident and waiting to be compacted, and the spill lock covers the
+spill file. A segment is spilled by whichever thread went over the budget,
+holding the segment's channel lock for reading so no one changes it
+meanwhile, and skipping segments whose channel is being written to, so
+pickling and spill writes never hold up other channels.
+'''
+from array import array
+from collections import OrderedDict
+import mmap
+import pickle
+import tempfile
+from threading import Condition, Lock, Thread
+import concurrency
+import config
+from message_record import Message
+
+# held while _resident, _to_compact or whether a segment's messages are in memory changes
+_lock = Lock()
+# segments with their messages in memory, least recently used first
+_resident = OrderedDict()
+# segments waiting to be compacted, and the condition the compactor waits on
+_to_compact = set()
+_compact_ready = Condition(_lock)
+_compactor = None
+
+# message_id left in a segment where a message was removed
+TOMBSTONE = -1
+# bytes of replaced copies the spill file can hold before it is written again,
+# if they are also more than its live bytes
+SPILL_REWRITE_MIN = 1 << 20
+
+
+class SpillFile:
+    '''
+    Temporary file that spilled segments are appended to
+    '''
+
+    def __init__(self, directory=None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._map = None
+        self.size = 0
+        # bytes of copies that have been replaced
+        self.dead = 0
+
+    def write(self, raw):
+        '''
+        Append raw bytes, returning where they were put as (offset, length)
+        '''
+        offset = self.size
+        self._file.seek(offset)
+        self._file.write(raw)
+        self._file.flush()
+        self.size += len(raw)
+        return offset, len(raw)
+
+    def free(self, chunks):
+        '''
+        Count the (offset, length) chunks as no longer used
+        '''
+        self.dead += sum(length for _, length in chunks)
+
+    def read(self, offset, length):
+        '''
+        Read back bytes put by write
+        '''
+        if self._map is None or len(self._map) < offset + length:
+            # the file has grown since it was mapped
+            self._map = mmap.mmap(self._file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def close(self):
+        '''
+        Delete the file
+        '''
+        self._map = None
+        self._file.close()
+
+
+# held while the spill file, _spilled or a segment's spilled chunks are used
+_spill_lock = Lock()
+# created the first time a segment is spilled
+_spill = None
+# segments with a copy in the spill file
+_spilled = set()
+
+
+class Segment:
+    '''
+    Up to config.HISTORY_SEGMENT_SIZE consecutive messages of a channel
+    '''
+    __slots__ = ('number', 'lock', 'ids', 'messages', 'live', 'spilled', 'dirty')
+
+    def __init__(self, number, lock):
+        # position of the segment in its history
+        self.number = number
+        # the lock of the history it is in
+        self.lock = lock
+        # message_id of each message, TOMBSTONE where one was removed
+        self.ids = array('q')
+        # None while spilled, removed messages are None
+        self.messages = []
+        # number of messages that are not tombstones
+        self.live = 0
+        # list of (offset, length) in the spill file of the last spilled copy,
+        # then of each message added while it was spilled
+        self.spilled = None
+        # True if the messages changed since the last spilled copy
+        self.dirty = True
+
+    def offset(self, message_id):
+        '''
+        Index of message_id in the segment
+        '''
+        try:
+            return self.ids.index(message_id)
+        except (ValueError, TypeError, OverflowError):
+            raise KeyError(message_id)
+
+
+def _evict(keep=None):
+    '''
+    Spill the least recently used segments until the budget is met,
+    skipping keep and the ones whose channel is being written to
+    '''
+    victims = []
+    with _lock:
+        excess = len(_resident) - max(1, config.RESIDENT_SEGMENTS)
+        for segment in _resident:
+            if len(victims) >= excess:
+                break
+            if segment is not keep and segment.lock.acquire_read(blocking=False):
+                victims.append(segment)
+        for segment in victims:
+            del _resident[segment]
+    for segment in victims:
+        try:
+            _spill_segment(segment)
+        finally:
+            segment.lock.release_read()
+
+
+def _spill_segment(segment):
+    '''
+    Write a segment that is no longer resident to the spill file if it
+    changed, and drop its messages. Called holding its lock for reading,
+    readers of the channel keep the messages they already have
+    '''
+    global _spill
+    if segment.dirty:
+        raw = pickle.dumps([None if message is None else message.as_tuple()
+                            for message in segment.messages], pickle.HIGHEST_PROTOCOL)
+        with _spill_lock:
+            if _spill is None:
+                _spill = SpillFile(config.SPILL_DIR)
+            if segment.spilled is not None:
+                _spill.free(segment.spilled)
+            segment.spilled = [_spill.write(raw)]
+            _spilled.add(segment)
+            segment.dirty = False
+            if _spill.dead > max(SPILL_REWRITE_MIN, _spill.size - _spill.dead):
+                _rewrite_spill()
+    with _lock:
+        segment.messages = None
+
+
+def _rewrite_spill():
+    '''
+    Copy the live chunks to a new spill file, leaving the replaced ones behind.
+    Called holding _spill_lock
+    '''
+    global _spill
+    fresh = SpillFile(config.SPILL_DIR)
+    for segment in list(_spilled):
+        if segment.dirty:
+            # resident and changed, its copy will be replaced when it is spilled again
+            segment.spilled = None
+            _spilled.discard(segment)
+        else:
+            segment.spilled = [fresh.write(_spill.read(*chunk)) for chunk in segment.spilled]
+    _spill.close()
+    _spill = fresh
+
+
+def _append_spilled(segment, message):
+    '''
+    Add a message to a spilled segment without reading the segment back
+    '''
+    raw = pickle.dumps([message.as_tuple()], pickle.HIGHEST_PROTOCOL)
+    with _spill_lock:
+        segment.spilled.append(_spill.write(raw))
+
+
+def _resident_messages(segment):
+    '''
+    The messages of a segment, reading them back if it was spilled
+    '''
+    with _lock:
+        messages = segment.messages
+        if messages is not None:
+            if segment in _resident:
+                _resident.move_to_end(segment)
+            return messages
+    with _spill_lock:
+        raws = [_spill.read(*chunk) for chunk in segment.spilled]
+    fields = []
+    for raw in raws:
+        fields.extend(pickle.loads(raw))
+    messages = [None if message is None else Message.from_tuple(message) for message in fields]
+    with _lock:
+        if segment.messages is None:
+            segment.messages = messages
+            # read back from several chunks, it is spilled again as one
+            segment.dirty = len(raws) > 1
+            _resident[segment] = None
+        else:
+            # another reader of the channel got to it first
+            messages = segment.messages
+    _evict(keep=segment)
+    return messages
+
+
+def resident_count():
+    '''
+    Number of segments with their messages in memory
+    '''
+    return len(_resident)
+
+
+def _compact(segment):
+    '''
+    Rewrite a segment without its tombstones. Called holding its lock for writing
+    '''
+    if segment.live == len(segment.ids):
+        return
+    if segment.messages is None and segment.spilled is None:
+        # dropped by clear after it was queued
+        return
+    messages = _resident_messages(segment)
+    kept = [(message_id, message)
+            for message_id, message in zip(segment.ids, messages)
+            if message_id != TOMBSTONE]
+    segment.ids = array('q', [message_id for message_id, _ in kept])
+    messages[:] = [message for _, message in kept]
+    segment.dirty = True
+
+
+def _next_to_compact(wait):
+    '''
+    Take a segment off the compaction queue, waiting for one if wait,
+    otherwise None if there is none
+    '''
+    with _compact_ready:
+        while wait and not _to_compact:
+            _compact_ready.wait()
+        return _to_compact.pop() if _to_compact else None
+
+
+def compact_pending():
+    '''
+    Compact every segment waiting for it now
+    '''
+    segment = _next_to_compact(False)
+    while segment is not None:
+        with segment.lock.writing():
+            _compact(segment)
+        segment = _next_to_compact(False)
+
+
+def _compact_loop():
+    '''
+    Background thread compacting segments as they pass the threshold
+    '''
+    while True:
+        segment = _next_to_compact(True)
+        with segment.lock.writing():
+            _compact(segment)
+
+
+def _request_compaction(segment):
+    '''
+    Queue a segment for the compactor, starting it the first time
+    '''
+    global _compactor
+    with _compact_ready:
+        _to_compact.add(segment)
+        if _compactor is None:
+            _compactor = Thread(target=_compact_loop, daemon=True)
+            _compactor.start()
+        _compact_ready.notify()
+
+
+def clear():
+    '''
+    Forget every resident and spilled segment
+    '''
+    global _spill
+    with _lock:
+        for segment in _resident:
+            segment.messages = None
+        _resident.clear()
+        _to_compact.clear()
+    with _spill_lock:
+        for segment in _spilled:
+            segment.spilled = None
+        _spilled.clear()
+        if _spill is not None:
+            _spill.close()
+            _spill = None
+
+
+class ChannelHistory:
+    '''
+    History of a channel's messages. Messages are looked up by the
+    segment returned when they were appended and their message_id.
+    '''
+
+    def __init__(self, messages=(), lock=None):
+        # the lock of the channel's stripe, or one of its own
+        self.lock = concurrency.RWLock() if lock is None else lock
+        self._segments = []
+        # number of messages that are not tombstones
+        self._live = 0
+        # no one else can see the history yet, so its segments are only
+        # made resident, and maybe spilled, once they are all built
+        for message in messages:
+            if not self._segments or len(self._segments[-1].ids) >= config.HISTORY_SEGMENT_SIZE:
+                self._segments.append(Segment(len(self._segments), self.lock))
+            segment = self._segments[-1]
+            segment.messages.append(message)
+            segment.ids.append(message.message_id)
+            segment.live += 1
+            self._live += 1
+        if self._segments:
+            with _lock:
+                for segment in self._segments:
+                    _resident[segment] = None
+            _evict()
+
+    def __len__(self):
+        return self._live
+
+    def __iter__(self):
+        '''
+        Every message, oldest first
+        '''
+        with self.lock.reading():
+            segments = list(self._segments)
+        for segment in segments:
+            with self.lock.reading():
+                messages = [message for message in _resident_messages(segment) if message is not None]
+            yield from messages
+
+    def newest_first(self):
+        '''
+        Generator of every message, newest first
+        '''
+        for number in range(len(self._segments) - 1, -1, -1):
+            with self.lock.reading():
+                segment = self._segments[number]
+                messages = [] if segment.live == 0 else _resident_messages(segment)[::-1]
+            for message in messages:
+                if message is not None:
+                    yield message
+
+    def locations(self):
+        '''
+        (message_id, segment) of every message, oldest first. Only reads the segments' ids
+        '''
+        with self.lock.reading():
+            return [(message_id, segment) for segment in self._segments
+                    for message_id in segment.ids if message_id != TOMBSTONE]
+
+    def append(self, message):
+        '''
+        Add a message at the end, starting a new segment if the last one is full.
+        Returns the segment the message was put in
+        '''
+        with self.lock.writing():
+            if not self._segments or len(self._segments[-1].ids) >= config.HISTORY_SEGMENT_SIZE:
+                self._segments.append(Segment(len(self._segments), self.lock))
+                with _lock:
+                    _resident[self._segments[-1]] = None
+                _evict(keep=self._segments[-1])
+            segment = self._segments[-1]
+            with _lock:
+                messages = segment.messages
+                if segment in _resident:
+                    _resident.move_to_end(segment)
+            if messages is None:
+                _append_spilled(segment, message)
+            else:
+                messages.append(message)
+                segment.dirty = True
+            segment.ids.append(message.message_id)
+            segment.live += 1
+            self._live += 1
+            return segment
+
+    def get(self, segment, message_id):
+        '''
+        The message with message_id in segment
+        '''
+        with self.lock.reading():
+            return _resident_messages(segment)[segment.offset(message_id)]
+
+    def replace(self, segment, message):
+        '''
+        Store a new or changed version of a message in segment
+        '''
+        with self.lock.writing():
+            offset = segment.offset(message.message_id)
+            _resident_messages(segment)[offset] = message
+            segment.dirty = True
+
+    def remove(self, segment, message_id):
+        '''
+        Leave a tombstone where the message with message_id was
+        '''
+        with self.lock.writing():
+            offset = segment.offset(message_id)
+            _resident_messages(segment)[offset] = None
+            segment.ids[offset] = TOMBSTONE
+            segment.live -= 1
+            segment.dirty = True
+            self._live -= 1
+            if len(segment.ids) - segment.live >= config.COMPACT_RATIO * len(segment.ids):
+                _request_compaction(segment)
+
+    def previous_id(self, segment, message_id):
+        '''
+        message_id of the newest message older than the one with message_id
+        in segment, None if there is none. Only reads the segments' ids
+        '''
+        with self.lock.reading():
+            end = segment.offset(message_id)
+            for number in range(segment.number, -1, -1):
+                ids = self._segments[number].ids
+                if number != segment.number:
+                    end = len(ids)
+                for i in range(end - 1, -1, -1):
+                    if ids[i] != TOMBSTONE:
+                        return ids[i]
+        return None
+
+    def page(self, skip, count):
+        '''
+        Up to count messages, newest first, after skipping the skip newest ones
+        '''
+        result = []
+        with self.lock.reading():
+            for number in range(len(self._segments) - 1, -1, -1):
+                if len(result) >= count:
+                    break
+                segment = self._segments[number]
+                if skip >= segment.live:
+                    # the whole segment is skipped without reading it
+                    skip -= segment.live
+                    continue
+                for message in reversed(_resident_messages(segment)):
+                    if message is None:
+                        continue
+                    if skip:
+                        skip -= 1
+                    elif len(result) < count:
+                        result.append(message)
+        return result
+
+    def older(self, segment, message_id, count, inclusive=False):
+        '''
+        Up to count messages older than the message with message_id in segment,
+        or starting with it if inclusive, newest first, and whether there are
+        more older messages after them
+        '''
+        result = []
+        with self.lock.reading():
+            offset = segment.offset(message_id) + (1 if inclusive else 0)
+            for number in range(segment.number, -1, -1):
+                current = self._segments[number]
+                if current is not segment:
+                    offset = len(current.ids)
+                    if current.live == 0:
+                        continue
+                messages = _resident_messages(current)
+                for i in range(offset - 1, -1, -1):
+                    if messages[i] is not None:
+                        if len(result) == count:
+                            return result, True
+                        result.append(messages[i])
+        return result, False
+
+    def newer(self, segment, message_id, count):
+        '''
+        Up to count messages newer than the message with message_id in segment,
+        or from the oldest message if segment is None, newest first, and
+        whether there are more newer messages after them
+        '''
+        result = []
+        more = False
+        with self.lock.reading():
+            start = 0 if segment is None else segment.offset(message_id) + 1
+            for number in range(0 if segment is None else segment.number, len(self._segments)):
+                current = self._segments[number]
+                if current is not segment:
+                    start = 0
+                    if current.live == 0:
+                        continue
+                messages = _resident_messages(current)
+                for i in range(start, len(messages)):
+                    if messages[i] is not None:
+                        if len(result) == count:
+                            more = True
+                            break
+                        result.append(messages[i])
+                if more:
+                    break
+        result.reverse()
+        return result, more
@@ -0,0 +1,171 @@
+'''
+History Test
+'''
+from threading import Thread
+from time import sleep
+import pytest
+from auth import auth_register
+from channel import channel_messages
+from channels import channels_create
+from message import message_send, message_react, message_remove
+from message_record import Message
+from history import ChannelHistory
+from other import clear
+import history
+import config
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    '''
+    Segments of 4 messages, with only 3 of them kept in memory
+    '''
+    monkeypatch.setattr(config, 'HISTORY_SEGMENT_SIZE', 4)
+    monkeypatch.setattr(config, 'RESIDENT_SEGMENTS', 3)
+    clear()
+    yield
+    clear()
+
+
+def texts(messages):
+    return [message.message for message in messages]
+
+
+def build(count):
+    '''
+    History of count messages, with the segment each one was put in
+    '''
+    messages = ChannelHistory()
+    segments = [messages.append(Message(0, i, i, f'message {i}')) for i in range(count)]
+    return messages, segments
+
+
+def test_history_spills_and_reads_back(small_segments):
+    messages, segments = build(40)
+    assert len(messages) == 40
+    assert history.resident_count() <= 3
+    assert texts(messages) == [f'message {i}' for i in range(40)]
+    assert messages.get(segments[0], 0).message == 'message 0'
+    assert messages.get(segments[39], 39).message == 'message 39'
+    assert texts(messages.page(2, 9)) == [f'message {i}' for i in range(37, 28, -1)]
+    assert texts(messages.page(35, 10)) == [f'message {i}' for i in range(4, -1, -1)]
+    assert history.resident_count() <= 3
+    with pytest.raises(KeyError):
+        messages.get(segments[0], 39)
+
+
+def test_history_changes_survive_spilling(small_segments):
+    messages, segments = build(40)
+    messages.replace(segments[1], Message(0, 1, 1, 'replaced'))
+    pinned = messages.get(segments[2], 2)
+    pinned.is_pinned = True
+    messages.replace(segments[2], pinned)
+    messages.remove(segments[5], 5)
+    # read every other segment so the changed ones are spilled again
+    texts(messages)
+
+    assert messages.get(segments[1], 1).message == 'replaced'
+    assert messages.get(segments[2], 2).is_pinned
+    assert len(messages) == 39
+    assert texts(messages)[4:6] == ['message 4', 'message 6']
+
+
+def test_history_tombstones_are_skipped_and_compacted(small_segments, monkeypatch):
+    monkeypatch.setattr(config, 'COMPACT_RATIO', 0.5)
+    messages, segments = build(12)
+    messages.remove(segments[4], 4)
+    assert segments[4].ids[0] == history.TOMBSTONE
+    messages.remove(segments[5], 5)
+    messages.remove(segments[6], 6)
+    history.compact_pending()
+
+    # the segment was rewritten without its tombstones, and the rest of it can still be found
+    assert list(segments[7].ids) == [7]
+    assert messages.get(segments[7], 7).message == 'message 7'
+    assert len(messages) == 9
+    assert texts(messages.page(3, 3)) == ['message 8', 'message 7', 'message 3']
+
+    older, more = messages.older(segments[8], 8, 2)
+    assert texts(older) == ['message 7', 'message 3']
+    assert more
+    newer, more = messages.newer(segments[3], 3, 2)
+    assert texts(newer) == ['message 8', 'message 7']
+    assert more
+    newer, more = messages.newer(segments[9], 9, 5)
+    assert texts(newer) == ['message 11', 'message 10']
+    assert not more
+
+
+def test_channel_messages_pages_spilled_segments(small_segments):
+    user = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    channel = channels_create(user['token'], "new_channel", True)
+    sent = [
+        message_send(user['token'], channel['channel_id'], f'message {i}')['message_id']
+        for i in range(120)
+    ]
+    message_react(user['token'], sent[3], 1)
+    message_remove(user['token'], sent[50])
+    assert history.resident_count() <= 3
+
+    result = channel_messages(user['token'], channel['channel_id'], 50)
+    expected = [f'message {i}' for i in range(119, -1, -1) if i != 50][50:100]
+    assert [message['message'] for message in result['messages']] == expected
+    oldest = channel_messages(user['token'], channel['channel_id'], 100)['messages']
+    assert oldest[-4]['reacts'][0]['u_ids'] == [user['u_id']]
+    assert history.resident_count() <= 3
+
+
+def test_history_compacts_in_background(small_segments):
+    messages, segments = build(8)
+    for message_id in range(4):
+        messages.remove(segments[message_id], message_id)
+    waited = 0
+    while len(segments[0].ids) and waited < 50:
+        sleep(0.1)
+        waited += 1
+    assert len(segments[0].ids) == 0
+    assert texts(messages.page(0, 10)) == [f'message {i}' for i in range(7, 3, -1)]
+
+
+def test_history_appends_to_spilled_segment(small_segments):
+    # four channels take turns, more newest segments than are kept in memory
+    channels = [ChannelHistory() for _ in range(4)]
+    for i in range(4):
+        channels[i].append(Message(0, i, i, f'message {i}'))
+    spilled = channels[0].append(Message(0, 4, 4, 'message 4'))
+    # the message is added to the spill file, the segment isn't read back
+    assert spilled.messages is None
+    channels[0].append(Message(0, 5, 5, 'message 5'))
+    assert spilled.messages is None
+    # the segment's copy, then a chunk for each message
+    assert len(spilled.spilled) == 3
+    assert texts(channels[0]) == ['message 0', 'message 4', 'message 5']
+    assert channels[0].get(spilled, 5).message == 'message 5'
+
+
+def test_history_spill_file_is_rewritten(small_segments, monkeypatch):
+    monkeypatch.setattr(history, 'SPILL_REWRITE_MIN', 4096)
+    messages, segments = build(40)
+    for round_number in range(30):
+        # every segment is changed and spilled again, leaving its old copy behind
+        for message_id in range(0, 40, 4):
+            messages.replace(segments[message_id], Message(0, message_id, message_id, f'round {round_number}'))
+    assert history._spill.dead <= max(history.SPILL_REWRITE_MIN, history._spill.size - history._spill.dead)
+    assert history._spill.size < 3 * history.SPILL_REWRITE_MIN
+    assert texts(messages)[::4] == ['round 29'] * 10
+    assert texts(messages)[1:4] == ['message 1', 'message 2', 'message 3']
+
+
+def test_history_channels_spill_independently(small_segments):
+    busy, other = ChannelHistory(), ChannelHistory()
+    busy_segments = [busy.append(Message(0, i, i, f'message {i}')) for i in range(12)]
+    # while the busy channel is being written to, the other one can still
+    # go over the budget, spilling its own segments and skipping the busy ones
+    with busy.lock.writing():
+        adding = Thread(target=lambda: [other.append(Message(0, i, i, f'message {i}')) for i in range(12, 40)])
+        adding.start()
+        adding.join(5)
+        assert not adding.is_alive()
+        assert all(segment.messages is not None for segment in busy_segments[::4])
+    assert texts(other) == [f'message {i}' for i in range(12, 40)]
+    assert texts(busy) == [f'message {i}' for i in range(12)]
@@ -0,0 +1,222 @@
+'''
+Journal
+Append-only file of changes, one JSON record per line, plus a binary
+snapshot file (see binary_snapshot.py) that lets the journal be emptied
+once it gets long.
+
+Records are group committed: changes waiting to be written are written
+together with one write and at most one fsync.
+'''
+import json
+import os
+from threading import Condition, Thread
+import binary_snapshot
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class Journal:
+    '''
+    Journal file at path, with its snapshot at path + '.snapshot'
+    '''
+
+    def __init__(self, path, fsync='interval', flush_interval=0.05):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'fsync must be one of {FSYNC_POLICIES}')
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        # sequence number of the last record appended, and of the last one on disk
+        self.seq = 0
+        self.flushed = 0
+        # number of records in the journal file since the last snapshot
+        self.length = 0
+        # bytes of the journal file up to its last whole record, set by load
+        self.good_size = None
+        self._pending = []
+        # while a snapshot is being written, the records appended since its state was taken
+        self._since_snapshot = None
+        self._flushing = False
+        self._closed = False
+        self._cond = Condition()
+        self._file = None
+        self._flusher = None
+
+    def load(self):
+        '''
+        Read the latest snapshot and the journal records written after it.
+        Returns (snapshot state or None, list of records)
+        '''
+        state = None
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            if binary_snapshot.is_binary(self.snapshot_path):
+                snapshot_seq, state = binary_snapshot.read(self.snapshot_path)
+            else:
+                # snapshots used to be written as JSON
+                with open(self.snapshot_path) as snapshot:
+                    saved = json.load(snapshot)
+                state = saved['state']
+                snapshot_seq = saved['seq']
+
+        records = []
+        self.good_size = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as journal:
+                for line in journal:
+                    if not line.endswith(b'\n'):
+                        # a torn write at the end of the file, nothing after it was committed
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self.good_size += len(line)
+                    if record['seq'] > snapshot_seq:
+                        records.append(record)
+
+        self.seq = max([snapshot_seq] + [record['seq'] for record in records])
+        self.flushed = self.seq
+        self.length = len(records)
+        return state, records
+
+    def open(self):
+        '''
+        Start appending to the journal file. A torn write left at its end by
+        a crash is cut off first, or the next record would be appended onto
+        it and lost along with everything after it
+        '''
+        if self.good_size is not None and os.path.exists(self.path) \
+                and os.path.getsize(self.path) > self.good_size:
+            os.truncate(self.path, self.good_size)
+        self._file = open(self.path, 'a')
+        if self.fsync != 'always':
+            self._flusher = Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def append(self, record):
+        '''
+        Add a record to the journal. With the 'always' policy this only
+        returns once the record is on disk.
+        '''
+        with self._cond:
+            self.seq += 1
+            seq = self.seq
+            record['seq'] = seq
+            line = json.dumps(record) + '\n'
+            self._pending.append(line)
+            if self._since_snapshot is not None:
+                self._since_snapshot.append(line)
+            self.length += 1
+            if self.fsync == 'always':
+                while self.flushed < seq:
+                    if self._flushing:
+                        # another thread is writing, it may take our record with it
+                        self._cond.wait()
+                    else:
+                        self._flush_pending()
+        return seq
+
+    def flush(self):
+        '''
+        Write every pending record now
+        '''
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            if self._pending:
+                self._flush_pending()
+
+    def _flush_pending(self):
+        '''
+        Write every pending record in one go. Called holding the lock,
+        which is let go while the file is written.
+        '''
+        lines = self._pending
+        last_seq = self.seq
+        self._pending = []
+        self._flushing = True
+        self._cond.release()
+        try:
+            self._file.write(''.join(lines))
+            self._file.flush()
+            if self.fsync != 'never':
+                os.fsync(self._file.fileno())
+        finally:
+            self._cond.acquire()
+            self._flushing = False
+            self.flushed = last_seq
+            self._cond.notify_all()
+
+    def _flush_loop(self):
+        '''
+        Background thread writing pending records every flush_interval seconds
+        '''
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+                if self._pending and not self._flushing:
+                    self._flush_pending()
+
+    def snapshot(self, get_state):
+        '''
+        Save the result of get_state() as the latest snapshot and empty the
+        journal. Records can be appended the whole time, the ones appended
+        after the snapshot began start the new journal.
+        '''
+        with self._cond:
+            while self._since_snapshot is not None:
+                self._cond.wait()
+            seq = self.seq
+            self._since_snapshot = []
+        try:
+            # every change is made before it is recorded, so a state taken now
+            # has everything up to seq. It may also have later changes, which
+            # replaying their records on top of it makes again
+            state = get_state()
+            tmp_path = self.snapshot_path + '.tmp'
+            binary_snapshot.write(tmp_path, seq, state)
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            with self._cond:
+                self._since_snapshot = None
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            # records up to seq are in the snapshot, including any still pending,
+            # so the journal starts again from the ones after it. Until it is
+            # replaced the old journal still has every record, so a crash
+            # at any point loses nothing
+            lines = self._since_snapshot
+            self._since_snapshot = None
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as journal:
+                journal.write(''.join(lines))
+                journal.flush()
+                if self.fsync != 'never':
+                    os.fsync(journal.fileno())
+            os.replace(tmp_path, self.path)
+            self._file.close()
+            self._file = open(self.path, 'a')
+            self._pending = []
+            self.flushed = self.seq
+            self.length = len(lines)
+            self._cond.notify_all()
+
+    def close(self):
+        '''
+        Write anything pending and stop the background thread
+        '''
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -2,17 +2,24 @@
 MESSAGE
 """
 import datetime
-from threading import Timer
+import scheduler
 from error import InputError, AccessError
 from global_dic import data
+import store
+import persistence
+import events
+import versions
 from utils import decode_token, check_token, get_current_timestamp
 from message_helper import get_channel, get_message, get_message_owner, valid_message
+from message_record import Message
 from channel_helper import check_member_channel, check_channel, check_owner
 from standup import standup_start, standup_send, standup_active
+from concurrency import writes_channel, writes_message_channel, channel_lock, next_message_id
 
 VALID_REACTS = [1]
 
 
+@writes_channel
 def message_send(token, channel_id, message):
     """
     Function that sends a message to the provided channel_id
@@ -46,29 +53,21 @@ def message_send(token, channel_id, message):
     
 
     #Increment the message counter by 1
-    data["message_count"] += 1
+    message_id = next_message_id()
     #Append message to dictionary
-    for channel in data["channels"]:
-        if channel["channel_id"] == channel_id:
-            channel["messages"].append({
-                'u_id': u_id,
-                'message_id': data["message_count"],
-                'time_created': get_current_timestamp(),
-                'message': message,
-                'reacts': [{
-                    'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False
-                }],
-                'is_pinned': False
-            })
-
+    channel = store.find_channel(channel_id)
+    new_message = create_message(u_id, message_id, get_current_timestamp(), message)
+    store.append_message(channel, new_message)
+    persistence.record_message(channel, new_message)
+    events.publish(channel_id, 'send', message=new_message)
+    versions.bump(('messages', channel_id))
 
     return {
-        'message_id': data["message_count"],
+        'message_id': message_id,
     }
 
 
+@writes_message_channel
 def message_remove(token, message_id):
     """
     Function that removes message given message_id
@@ -82,14 +81,15 @@ def message_remove(token, message_id):
     #Check if user_id belongs to the message_id
     if u_id != get_message_owner(message_id):
         raise AccessError(AccessError)
-    for channel in data["channels"]:
-        for i in range(len(channel["messages"])):
-            if channel["messages"][i]["message_id"] == message_id:
-                del channel["messages"][i]
-                return
+    channel_id = get_channel(message_id)['channel_id']
+    store.delete_message(message_id)
+    persistence.record_message_removed(message_id)
+    events.publish(channel_id, 'remove', message_id=message_id)
+    versions.bump(('messages', channel_id))
     return {}
 
 
+@writes_message_channel
 def message_edit(token, message_id, message):
     """
     Function that edits the message
@@ -109,10 +109,12 @@ def message_edit(token, message_id, message):
     if len(message) == 0:
         message_remove(token, message_id)
         return {}
-    for channel in data["channels"]:
-        for i in range(len(channel["messages"])):
-            if channel["messages"][i]["message_id"] == message_id:
-                channel['messages'][i]["message"] = message
+    store.update_message_text(message_id, message)
+    channel = get_channel(message_id)
+    edited = get_message(message_id)
+    persistence.record_message(channel, edited)
+    events.publish(channel['channel_id'], 'edit', message=edited)
+    versions.bump(('messages', channel['channel_id']))
     return {}
 
 
@@ -120,20 +122,10 @@ def create_message(user_id, message_id, time_created, message):
     '''
     returns a default message with is_pinned = False
     '''
-    return {
-        'u_id': user_id,
-        'message_id': message_id,
-        'time_created': time_created,
-        'message': message,
-        'reacts': [{
-            'react_id': 1,
-            'u_ids': [],
-            'is_this_user_reacted': False
-        }],
-        'is_pinned': False
-    }
+    return Message(user_id, message_id, time_created, message)
 
 
+@writes_message_channel
 def message_react(token, message_id, react_id):
     '''
     adds a reaction to a messages list of reactions
@@ -151,15 +143,17 @@ def message_react(token, message_id, react_id):
         raise AccessError('User is not in channel')
     if react_id not in VALID_REACTS:
         raise InputError('Invalid react id')
-    for react in message['reacts']:
-        if react['react_id'] == react_id:
-            if u_id in react['u_ids']:
-                raise InputError('Already reacted')
-            react['u_ids'].append(u_id)
-            react['is_this_user_reacted'] = True
+    if message.has_reacted(react_id, u_id):
+        raise InputError('Already reacted')
+    message.add_react(react_id, u_id)
+    store.message_changed(message)
+    persistence.record_message(channel_id, message)
+    events.publish(channel_id['channel_id'], 'react', message=message)
+    versions.bump(('messages', channel_id['channel_id']))
     return {}
 
 
+@writes_message_channel
 def message_unreact(token, message_id, react_id):
     '''
     removes a reaction from a messages list of reactions
@@ -177,16 +171,17 @@ def message_unreact(token, message_id, react_id):
         raise InputError('Invalid react id')
     if not check_member_channel(channel_id['channel_id'], u_id):
         raise AccessError('User is not in channel')
-    for react in message['reacts']:
-        if react['react_id'] == react_id:
-            if u_id in react['u_ids']:
-                react['u_ids'].remove(u_id)
-                react['is_this_user_reacted'] = False
-            else:
-                raise InputError('You have not made this reaction')
+    if not message.has_reacted(react_id, u_id):
+        raise InputError('You have not made this reaction')
+    message.remove_react(react_id, u_id)
+    store.message_changed(message)
+    persistence.record_message(channel_id, message)
+    events.publish(channel_id['channel_id'], 'unreact', message=message)
+    versions.bump(('messages', channel_id['channel_id']))
     return {}
 
 
+@writes_message_channel
 def message_pin(token, message_id):
     '''
     Pins a message in a channel
@@ -203,16 +198,21 @@ def message_pin(token, message_id):
     if not check_owner(u_id, channel_specific['channel_id']):
         raise InputError('The authorised user is not an owner')
 
-    if message_specific['is_pinned']:
+    if message_specific.is_pinned:
         raise InputError('Message with ID message_id is already pinned')
 
     if check_owner(u_id, channel_specific['channel_id']
-                   ) is True and message_specific['is_pinned'] is False:
-        message_specific['is_pinned'] = True
+                   ) is True and message_specific.is_pinned is False:
+        message_specific.is_pinned = True
+        store.message_changed(message_specific)
+        persistence.record_message(channel_specific, message_specific)
+        events.publish(channel_specific['channel_id'], 'pin', message=message_specific)
+        versions.bump(('messages', channel_specific['channel_id']))
 
     return {}
 
 
+@writes_message_channel
 def message_unpin(token, message_id):
     '''
     Unpins a message in a channel
@@ -229,16 +229,21 @@ def message_unpin(token, message_id):
 
     if not check_owner(u_id, channel_specific['channel_id']):
         raise InputError('The authorised user is not an owner')
-    if message_specific['is_pinned'] is False:
+    if message_specific.is_pinned is False:
         raise InputError(
             'Message with ID message_id is already unpinned')
     if check_owner(u_id, channel_specific['channel_id']
-                   ) is True and message_specific['is_pinned'] is True:
-        message_specific['is_pinned'] = False
+                   ) is True and message_specific.is_pinned is True:
+        message_specific.is_pinned = False
+        store.message_changed(message_specific)
+        persistence.record_message(channel_specific, message_specific)
+        events.publish(channel_specific['channel_id'], 'unpin', message=message_specific)
+        versions.bump(('messages', channel_specific['channel_id']))
 
     return {}
 
 
+@writes_channel
 def message_sendlater(token, channel_id, message, time_sent):
     '''
     sends a message at a given time_sent, where time_sent is a unix timestamp
@@ -257,21 +262,29 @@ def message_sendlater(token, channel_id, message, time_sent):
     current_time = get_current_timestamp()
     if current_time >= time_sent:
         raise InputError("You can not send a message back in time")
-    delay = time_sent - current_time
-    data["message_count"] += 1
-    message_id = data["message_count"]
+    message_id = next_message_id()
+    persistence.record_message_count()
     message_template = create_message(u_id, message_id, time_sent, message)
-    timer = Timer(delay, sendlater_end, args=[channel_id, message_template])
-    timer.start()
+    scheduler.schedule_job('sendlater', time_sent, channel_id, message_template.to_dict())
     return {'message_id': message_id}
 
 
 def sendlater_end(channel_id, message):
     '''
-    Helper function for message_sendlater, used with threading.Timer to
+    Helper function for message_sendlater, run by the scheduler to
     add a messsage to a channels list of message after a delay.
+    message is the dict of the message, as the job is saved.
     '''
-    global data
-    for channel in data["channels"]:
-        if channel["channel_id"] == channel_id:
-            channel["messages"].append(message)
+    message = Message.from_dict(message)
+    with channel_lock(channel_id).writing():
+        if store.locate_message(message.message_id) is not None:
+            # already sent before the server was restarted
+            return
+        channel = store.find_channel(channel_id)
+        store.append_message(channel, message)
+        persistence.record_message(channel, message)
+        events.publish(channel_id, 'send', message=message)
+        versions.bump(('messages', channel_id))
+
+
+scheduler.register('sendlater', sendlater_end)
@@ -2,40 +2,37 @@
 Message Helper
 '''
 from error import InputError, AccessError
-from global_dic import data
+import store
 
 
 def get_message(message_id):
     """
     Get the corresponding message by message_id
     """
-    for channel in data["channels"]:
-        for message in channel["messages"]:
-            if (message["message_id"] == message_id):
-                return message
-    raise InputError("Message_ID does not exist")
+    message = store.find_message(message_id)
+    if message is None:
+        raise InputError("Message_ID does not exist")
+    return message
 
 
 def get_channel(message_id):
     """
     Get the corresponding channel by message_id
     """
-    for channel in data["channels"]:
-        for message in channel["messages"]:
-            if (message["message_id"] == message_id):
-                return channel
-    raise InputError("Channel does not exist")
+    location = store.locate_message(message_id)
+    if location is None:
+        raise InputError("Channel does not exist")
+    return location[0]
 
 
 def get_message_owner(message_id):
     """
     Get the user_id with the corresponding message_id
     """
-    for channel in data["channels"]:
-        for message in channel["messages"]:
-            if (message["message_id"] == message_id):
-                return message["u_id"]
-    raise InputError("Message owner does not exist")
+    message = store.find_message(message_id)
+    if message is None:
+        raise InputError("Message owner does not exist")
+    return message.u_id
 
 
 def valid_message(message):
@@ -0,0 +1,121 @@
+'''
+Message Record
+Compact storage for a single message. Every message used to be a dict
+holding its own reacts list, react dict and u_ids list, even when nobody
+had reacted. A Message uses __slots__ and only builds its reacts once
+someone reacts, but still serializes to the same shape as before.
+'''
+
+# react ids every message shows, even before anyone has reacted
+REACT_IDS = (1,)
+
+
+class Message:
+    '''
+    A message sent to a channel
+    '''
+    __slots__ = ('u_id', 'message_id', 'time_created', 'message', 'is_pinned', 'reacts', 'encoded')
+
+    def __init__(self, u_id, message_id, time_created, message, is_pinned=False):
+        self.u_id = u_id
+        self.message_id = message_id
+        self.time_created = time_created
+        self.message = message
+        self.is_pinned = is_pinned
+        # react_id -> [list of u_ids, is_this_user_reacted], None until the first react
+        self.reacts = None
+        # JSON of to_dict, kept by serialization.message_json until the message changes
+        self.encoded = None
+
+    def has_reacted(self, react_id, u_id):
+        '''
+        Check if u_id has reacted with react_id
+        '''
+        return self.reacts is not None and react_id in self.reacts and u_id in self.reacts[react_id][0]
+
+    def add_react(self, react_id, u_id):
+        '''
+        Add u_id's react
+        '''
+        if self.reacts is None:
+            self.reacts = {}
+        react = self.reacts.setdefault(react_id, [[], False])
+        react[0].append(u_id)
+        react[1] = True
+
+    def remove_react(self, react_id, u_id):
+        '''
+        Remove u_id's react
+        '''
+        react = self.reacts[react_id]
+        react[0].remove(u_id)
+        react[1] = False
+
+    def react_list(self):
+        '''
+        Reacts in the shape returned by the API
+        '''
+        reacts = self.reacts or {}
+        react_ids = list(REACT_IDS) + [react_id for react_id in reacts if react_id not in REACT_IDS]
+        result = []
+        for react_id in react_ids:
+            u_ids, reacted = reacts.get(react_id, ((), False))
+            result.append({
+                'react_id': react_id,
+                'u_ids': list(u_ids),
+                'is_this_user_reacted': reacted
+            })
+        return result
+
+    def to_dict(self):
+        '''
+        The message in the shape returned by the API
+        '''
+        return {
+            'u_id': self.u_id,
+            'message_id': self.message_id,
+            'time_created': self.time_created,
+            'message': self.message,
+            'reacts': self.react_list(),
+            'is_pinned': self.is_pinned
+        }
+
+    @classmethod
+    def from_dict(cls, message):
+        '''
+        Build a Message from the shape returned by to_dict
+        '''
+        record = cls(message['u_id'], message['message_id'], message['time_created'],
+                     message['message'], message['is_pinned'])
+        for react in message['reacts']:
+            if react['u_ids'] or react['is_this_user_reacted']:
+                if record.reacts is None:
+                    record.reacts = {}
+                record.reacts[react['react_id']] = [list(react['u_ids']), react['is_this_user_reacted']]
+        return record
+
+    def as_tuple(self):
+        '''
+        Every field in a plain tuple, for writing to snapshots
+        '''
+        return (self.u_id, self.message_id, self.time_created, self.message,
+                self.is_pinned, self.reacts)
+
+    @classmethod
+    def from_tuple(cls, fields):
+        '''
+        Build a Message from the tuple returned by as_tuple
+        '''
+        record = cls(*fields[:5])
+        record.reacts = fields[5]
+        return record
+
+    def __getitem__(self, key):
+        '''
+        Read a field by name, the same way as the old message dicts
+        '''
+        if key == 'reacts':
+            return self.react_list()
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
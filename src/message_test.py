@@ -120,6 +120,27 @@ def test_message_remove_authorized():
         message_remove(non_authorized_user['token'], message_id)
 
 
+def test_message_remove_keeps_later_messages():
+    '''
+    Messages after a removed message can still be found and edited
+    '''
+    clear()
+    authorized_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    new_channel = channels_create(authorized_user['token'], "public_channel",
+                                  True)
+    message_ids = [
+        message_send(authorized_user['token'], new_channel['channel_id'],
+                     f"message {i}")["message_id"] for i in range(3)
+    ]
+    message_remove(authorized_user['token'], message_ids[0])
+    message_edit(authorized_user['token'], message_ids[2], "edited")
+    assert get_message(message_ids[1])['message'] == "message 1"
+    assert get_message(message_ids[2])['message'] == "edited"
+    with pytest.raises(InputError):
+        get_message(message_ids[0])
+
+
 def test_message_edit_valid_message():
     '''
     Edit message greater than 1001 in length
@@ -284,6 +305,28 @@ def test_sendlater_valid_inputs():
                          0)['messages']) == 1
 
 
+def test_sendlater_cleared():
+    '''
+    A message waiting to be sent is dropped by clear, and doesn't turn up
+    in the channel that gets its channel_id afterwards
+    '''
+    clear()
+    authorized_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    new_channel = channels_create(authorized_user['token'], "public_channel",
+                                  True)
+    message_sendlater(authorized_user['token'], new_channel['channel_id'],
+                      "ghost", get_current_timestamp() + 1)
+    clear()
+    authorized_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    new_channel = channels_create(authorized_user['token'], "public_channel",
+                                  True)
+    sleep(1.5)
+    assert channel_messages(authorized_user['token'], new_channel['channel_id'],
+                            0)['messages'] == []
+
+
 # #react
 def test_message_react_normal():
     '''Test that legal user react a message'''
@@ -303,6 +346,37 @@ def test_message_react_normal():
     }]
 
 
+def test_message_react_channel_messages_shape():
+    '''Test that messages keep the same shape in channel_messages before and after a react'''
+    clear()
+    authorized_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    new_channel = channels_create(authorized_user['token'], "public_channel",
+                                  True)
+    message = message_send(authorized_user['token'], new_channel['channel_id'],
+                           "abcd")
+    expected = {
+        'u_id': authorized_user['u_id'],
+        'message_id': message['message_id'],
+        'time_created': get_message(message['message_id'])['time_created'],
+        'message': "abcd",
+        'reacts': [{
+            'react_id': 1,
+            'u_ids': [],
+            'is_this_user_reacted': False
+        }],
+        'is_pinned': False
+    }
+    assert channel_messages(authorized_user['token'], new_channel['channel_id'],
+                            0)['messages'] == [expected]
+
+    message_react(authorized_user['token'], message['message_id'], 1)
+    expected['reacts'][0]['u_ids'] = [authorized_user['u_id']]
+    expected['reacts'][0]['is_this_user_reacted'] = True
+    assert channel_messages(authorized_user['token'], new_channel['channel_id'],
+                            0)['messages'] == [expected]
+
+
 def test_message_already_reacted():
     '''Test that if a user react to a message that has already been reacted'''
     clear()
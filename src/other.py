@@ -1,34 +1,60 @@
 '''
 other.py contains the clear, users_all, admin_permission_change, and search functions
 '''
+from bisect import bisect_right
 from global_dic import data
+import store
+import session
+import search_index
+import persistence
+import scheduler
+import events
+import versions
+import serialization
 from error import InputError, AccessError
-from utils import check_token, decode_token
+from utils import check_token, decode_token, get_user_from_token
 from channels import channels_list
 from channel_helper import check_uid
+from other_helper import top_matches, encode_cursor, decode_cursor, encode_user_cursor, decode_user_cursor
+from concurrency import writes_everything, reading_channels
 
+# every user as users_all returns them, with their u_ids in order and each
+# one's JSON, built again only once a user registers or changes their profile.
+# 'body' is the JSON of the whole list, made the first time it is asked for
+_directory = {'stamp': None, 'users': [], 'u_ids': [], 'encoded': [], 'body': None}
+
+@writes_everything
 def clear():
     '''
     Function to reset user and channel entries in the data dictionary
     '''
-    data["users"].clear()
-    data["channels"].clear()
     data["standup"].clear()
-    data["message_count"] = 0
+    scheduler.clear()
+    events.clear()
+    versions.clear()
+    store.clear()
+    session.clear()
+    persistence.record_clear()
 
 
-def users_all(token):
+def user_directory():
     '''
-    Function which returns a list of all the users
+    Every user's details in u_id order as {'users', 'u_ids', 'encoded'},
+    'encoded' holding each one's JSON. Cached until the users change
+    (registering and the profile setters bump versions 'users')
     '''
-    # Check if user's token is valid
-    check_token(token)
+    global _directory
+    # taken before building, so a change made meanwhile is picked up next time
+    stamp = versions.stamp('users')
+    directory = _directory
+    if directory['stamp'] == stamp:
+        return directory
 
     # List of authorised users
     authorised_users = []
 
     # Gather user details and append list
-    for user in data["users"]:
+    for user in sorted(data["users"], key=lambda user: user["u_id"]):
         authorised_users.append({
             "u_id": user["u_id"],
             "email": user["email"],
@@ -37,11 +63,64 @@ def users_all(token):
             'handle_str': user['handle'],
             'profile_img_url': user['profile_img_url']
         })
+    # replaced as a whole, so a reader never sees parts of two builds
+    _directory = {
+        'stamp': stamp,
+        'users': authorised_users,
+        'u_ids': [user["u_id"] for user in authorised_users],
+        'encoded': [serialization.dumps(user) for user in authorised_users],
+        'body': None,
+    }
+    return _directory
+
+
+def users_page(token, limit, cursor):
+    '''
+    The user directory and the (start, end, next_cursor) of a users_all page of it
+    '''
+    # Check if user's token is valid
+    check_token(token)
+
+    if limit is not None and limit < 1:
+        raise InputError("Limit must be at least 1")
+
+    directory = user_directory()
+    u_ids = directory['u_ids']
+    start = bisect_right(u_ids, decode_user_cursor(cursor)) if cursor else 0
+    end = len(u_ids) if limit is None else start + limit
+
+    next_cursor = None
+    if end < len(u_ids):
+        next_cursor = encode_user_cursor(u_ids[end - 1])
+    return directory, start, end, next_cursor
+
+
+def users_all(token, limit=None, cursor=None):
+    '''
+    Function which returns a list of all the users.
+    Returns the first limit users (every user if limit is None) in u_id order
+    and a cursor to pass back in to get the next page, or None on the last page
+    '''
+    directory, start, end, next_cursor = users_page(token, limit, cursor)
 
     # Return list as dictionary
-    return {"users": authorised_users}
+    return {"users": directory['users'][start:end], "next_cursor": next_cursor}
+
+
+def users_all_json(token, limit=None, cursor=None):
+    '''
+    users_all's response as JSON, joined from the cached JSON of each user.
+    The JSON of the whole list is cached as well
+    '''
+    directory, start, end, next_cursor = users_page(token, limit, cursor)
+    if start == 0 and next_cursor is None:
+        if directory['body'] is None:
+            directory['body'] = serialization.list_json('users', directory['encoded'], {"next_cursor": None})
+        return directory['body']
+    return serialization.list_json('users', directory['encoded'][start:end], {"next_cursor": next_cursor})
 
 
+@writes_everything
 def admin_userpermission_change(token, u_id, permission_id):
     '''
     Function to alter a user's permission to an owner, or from an owner to a member
@@ -55,37 +134,39 @@ def admin_userpermission_change(token, u_id, permission_id):
     if permission_id not in [1, 2]:
         raise InputError("Not a valid permission value")
 
-    for user in data['users']:
-        if user['token'] == token:
-            if user['is_flockr_owner'] == False:
-                raise InputError("You are not an owner of Flockr")
-            break
+    if get_user_from_token(token)['is_flockr_owner'] == False:
+        raise InputError("You are not an owner of Flockr")
 
     # changing permissions to new permissions
     new_permission = permission_id == 1
 
-    for user in data['users']:
-        if user['u_id'] == u_id:
-            user['is_flockr_owner'] = new_permission
-            user_details = {
-                'u_id': u_id, 
-                'name_first': user['first_name'], 
-                'name_last': user['last_name']
-            }
+    user = store.find_user(u_id)
+    store.update_flockr_owner(user, new_permission)
+    user_details = {
+        'u_id': u_id, 
+        'name_first': user['first_name'], 
+        'name_last': user['last_name']
+    }
 
     for channel in data['channels']:
-        is_member = False
-        for member in channel["owner_members"]:
-            if member['u_id'] == u_id:
-                is_member = True
-        if is_member == False:
+        joined = u_id not in channel["member_ids"]
+        made_owner = u_id not in channel["owner_ids"]
+        if made_owner:
+            channel["owner_ids"].add(u_id)
             channel["owner_members"].append(user_details)
-        is_member = False
-        for member in channel["all_members"]:
-            if member['u_id'] == u_id:
-                is_member = True
-        if is_member == False:
+        if joined:
+            channel["member_ids"].add(u_id)
+            store.add_membership(u_id, channel["channel_id"])
             channel["all_members"].append(user_details)
+        persistence.record_channel(channel)
+        if joined:
+            events.publish(channel["channel_id"], 'join', u_id=u_id)
+            versions.bump(('member', u_id))
+        if made_owner:
+            events.publish(channel["channel_id"], 'addowner', u_id=u_id)
+        if joined or made_owner:
+            versions.bump(('channel', channel["channel_id"]))
+    persistence.record_user(user)
 
     return {}
 
@@ -93,30 +174,41 @@ def admin_userpermission_change(token, u_id, permission_id):
     
 
 
-def search(token, query_str):
+def search(token, query_str, limit=None, cursor=None):
     '''
-    Function to search for previous messages
+    Function to search for previous messages.
+    Returns the newest limit matches (every match if limit is None) and
+    a cursor to pass back in to get the next page, or None on the last page
     '''
 
-    user_channels = []
-
     user_u_id = decode_token(token)
 
-    for channel in data['channels']:
-        for member in channel['all_members']:
-            if member['u_id'] == user_u_id:
-                user_channels.append(channel)
-
-    result = []
-
-    # Search for query in the channel's message history
-    for channel in user_channels:
-        for message in channel["messages"]:
-            if query_str in message['message']:
-                result.append(message)
-
-    # Sort list based on time_created
-    sorted(result, key=lambda message: message["time_created"], reverse=True)
-
-    # Return dictionary containing result list
-    return {"messages": result}
+    if limit is not None and limit < 1:
+        raise InputError("Limit must be at least 1")
+    before = decode_cursor(cursor) if cursor else None
+
+    user_channels = store.list_user_channels(user_u_id)
+    # the user's channels are read with them locked, messages are sent and removed meanwhile
+    with reading_channels([channel["channel_id"] for channel in user_channels]):
+        # the search index only covers loaded channels, so load the user's channels first
+        for channel in user_channels:
+            store.history(channel)
+
+        # Messages that could contain the query, found through the search index.
+        # None if the query is too short for the index
+        candidates = search_index.candidates(query_str)
+
+        # Ask for one extra match to know if there is another page
+        fetch = None if limit is None else limit + 1
+        result = top_matches(user_channels, query_str, candidates, fetch, before)
+
+        next_cursor = None
+        if limit is not None and len(result) > limit:
+            result = result[:limit]
+            next_cursor = encode_cursor(result[-1])
+
+        # Return dictionary containing result list, newest first
+        return {
+            "messages": [message.to_dict() for message in result],
+            "next_cursor": next_cursor
+        }
@@ -0,0 +1,104 @@
+'''
+Other Helper
+'''
+import base64
+import heapq
+from itertools import islice
+from error import InputError
+import store
+
+# past this many index candidates, it is cheaper to walk channel histories
+# newest first and stop after enough matches than to look at every candidate
+SPARSE_CANDIDATES = 1024
+
+
+def message_key(message):
+    '''
+    Sort key that orders messages from oldest to newest
+    '''
+    return (message.time_created, message.message_id)
+
+
+def encode_cursor(message):
+    '''
+    Turn the last message of a page into an opaque cursor string
+    '''
+    raw = f'{message.time_created}:{message.message_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    '''
+    Turn a cursor string back into the key of the last message of a page
+    '''
+    try:
+        time_created, message_id = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split(':')
+        return (int(time_created), int(message_id))
+    except (ValueError, AttributeError, UnicodeError):
+        raise InputError("Invalid cursor")
+
+
+def encode_user_cursor(u_id):
+    '''
+    Turn the u_id of the last user of a page into an opaque cursor string
+    '''
+    return base64.urlsafe_b64encode(f'u:{u_id}'.encode()).decode()
+
+
+def decode_user_cursor(cursor):
+    '''
+    Turn a cursor string back into the u_id of the last user of a page
+    '''
+    try:
+        kind, u_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        if kind != 'u':
+            raise ValueError(kind)
+        return int(u_id)
+    except (ValueError, AttributeError, UnicodeError):
+        raise InputError("Invalid cursor")
+
+
+def newest_matches(channel, query_str, candidates, before):
+    '''
+    Generator of the messages in a channel which contain query_str,
+    from newest to oldest, starting after the key before
+    '''
+    for message in store.history(channel).newest_first():
+        if candidates is not None and message.message_id not in candidates:
+            continue
+        if before is not None and message_key(message) >= before:
+            continue
+        if query_str in message.message:
+            yield message
+
+
+def top_matches(channels, query_str, candidates, limit, before=None):
+    '''
+    The newest limit messages across channels that contain query_str and
+    are older than the key before. A limit of None returns every match.
+    '''
+    if candidates is not None and (limit is None or len(candidates) <= SPARSE_CANDIDATES):
+        # few candidates, check each of them and keep the newest
+        channel_ids = {channel["channel_id"] for channel in channels}
+        matches = []
+        for message_id in candidates:
+            location = store.locate_message(message_id)
+            # candidates in other channels may have been removed since the index was read
+            if location is None or location[0]["channel_id"] not in channel_ids:
+                continue
+            message = store.find_message(message_id)
+            if query_str not in message.message:
+                continue
+            if before is not None and message_key(message) >= before:
+                continue
+            matches.append(message)
+        if limit is None:
+            return sorted(matches, key=message_key, reverse=True)
+        return heapq.nlargest(limit, matches, key=message_key)
+
+    # merge each channel's newest matches and stop after limit of them
+    merged = heapq.merge(
+        *(newest_matches(channel, query_str, candidates, before) for channel in channels),
+        key=message_key, reverse=True)
+    return list(islice(merged, limit))
@@ -212,3 +212,91 @@ def test_search_null(url):
                             "query_str": None
                         })
     assert data.status_code == 400
+
+
+def test_search_limit(url):
+    '''
+    Search with a limit returns the newest matches and a cursor for the rest
+    '''
+    # Reset/clear data
+    requests.delete(f"{url}/clear")
+
+    user_1 = register_user(url, authorised_user)
+    login_user(url, authorised_user)
+    channel_1 = create_channel(url, user_1['token'], "GoodThings", True)
+    for i in range(3):
+        requests.post(f"{url}/message/send",
+                      json={
+                          "token": user_1['token'],
+                          "channel_id": channel_1['channel_id'],
+                          "message": f"Hello {i}"
+                      })
+
+    data = requests.get(f"{url}/search",
+                        params={
+                            "token": user_1['token'],
+                            "query_str": "Hello",
+                            "limit": 2
+                        }).json()
+    assert [message['message'] for message in data['messages']] == ["Hello 2", "Hello 1"]
+
+    data = requests.get(f"{url}/search",
+                        params={
+                            "token": user_1['token'],
+                            "query_str": "Hello",
+                            "limit": 2,
+                            "cursor": data['next_cursor']
+                        }).json()
+    assert [message['message'] for message in data['messages']] == ["Hello 0"]
+    assert data['next_cursor'] is None
+
+
+def test_users_all_limit(url):
+    '''
+    users/all with a limit returns the first users and a cursor for the rest
+    '''
+    requests.delete(f"{url}/clear")
+    user_1 = register_user(url, authorised_user)
+    user_2 = register_user(url, second_user)
+
+    data = requests.get(f"{url}/users/all", params={"token": user_1['token'], "limit": 1}).json()
+    assert [user['u_id'] for user in data['users']] == [user_1['u_id']]
+
+    data = requests.get(f"{url}/users/all",
+                        params={"token": user_1['token'], "limit": 1, "cursor": data['next_cursor']}).json()
+    assert [user['u_id'] for user in data['users']] == [user_2['u_id']]
+    assert data['next_cursor'] is None
+
+
+def test_users_conditional_get(url):
+    '''
+    Users and profiles are only sent again once they have changed
+    '''
+    requests.delete(f"{url}/clear")
+    user = register_user(url, authorised_user)
+    users = requests.get(f"{url}/users/all", params={'token': user['token']})
+    profile = requests.get(f"{url}/user/profile", params={'token': user['token'], 'u_id': user['u_id']})
+    assert requests.get(f"{url}/users/all", params={'token': user['token']},
+                        headers={'If-None-Match': users.headers['ETag']}).status_code == 304
+    assert requests.get(f"{url}/user/profile", params={'token': user['token'], 'u_id': user['u_id']},
+                        headers={'If-None-Match': profile.headers['ETag']}).status_code == 304
+    channels = requests.get(f"{url}/channels/list", params={'token': user['token']})
+
+    requests.put(f"{url}/user/profile/setname",
+                 json={'token': user['token'], 'name_first': 'New', 'name_last': 'Name'})
+    users = requests.get(f"{url}/users/all", params={'token': user['token']},
+                         headers={'If-None-Match': users.headers['ETag']})
+    assert users.status_code == 200
+    assert users.json()['users'][0]['name_first'] == 'New'
+    assert requests.get(f"{url}/user/profile", params={'token': user['token'], 'u_id': user['u_id']},
+                        headers={'If-None-Match': profile.headers['ETag']}).status_code == 200
+
+    # registering someone else changes the users but not this user's channels
+    register_user(url, second_user)
+    assert requests.get(f"{url}/users/all", params={'token': user['token']},
+                        headers={'If-None-Match': users.headers['ETag']}).status_code == 200
+    assert requests.get(f"{url}/channels/list", params={'token': user['token']},
+                        headers={'If-None-Match': channels.headers['ETag']}).status_code == 304
+    create_channel(url, user['token'], 'new_channel', True)
+    assert requests.get(f"{url}/channels/list", params={'token': user['token']},
+                        headers={'If-None-Match': channels.headers['ETag']}).status_code == 200
@@ -1,12 +1,14 @@
 '''
 Tests for other.py. Testing functions users_all, admin_userpermission_change, and search.
 '''
+import json
 import pytest
 from auth import auth_login, auth_register
 from channel import channel_invite, channel_details, channel_join
 from channels import channels_create
-from message import message_send
-from other import clear, users_all, admin_userpermission_change, search
+from message import message_send, message_edit, message_remove
+from other import clear, users_all, users_all_json, admin_userpermission_change, search
+from user import user_profile_setname, user_profile_sethandle
 from error import InputError, AccessError
 
 '''
@@ -37,6 +39,83 @@ def test_users_all_expected():
     }]
 
 
+def test_users_all_limit_and_cursor():
+    '''
+    Test if users_all pages through users in u_id order using limit and cursor
+    '''
+    clear()
+    users = [auth_register(f"validEmail{i}@gmail.com", "valid_password", "Philgee", f"Vlad{i}")
+             for i in range(7)]
+    token = users[0]['token']
+
+    found = []
+    cursor = None
+    while True:
+        page = users_all(token, 3, cursor)
+        assert len(page['users']) <= 3
+        found += [user['u_id'] for user in page['users']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert found == [user['u_id'] for user in users]
+
+    everything = users_all(token)
+    assert [user['u_id'] for user in everything['users']] == found
+    assert everything['next_cursor'] is None
+
+    with pytest.raises(InputError):
+        users_all(token, 0)
+    with pytest.raises(InputError):
+        users_all(token, 3, 'not a cursor')
+    clear()
+
+
+def test_users_all_cached_until_changed():
+    '''
+    Test if users_all reuses its list until someone registers or changes their profile
+    '''
+    clear()
+    user = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    first = users_all(user['token'])['users']
+    assert users_all(user['token'])['users'][0] is first[0]
+
+    user_profile_setname(user['token'], "New", "Name")
+    renamed = users_all(user['token'])['users']
+    assert renamed[0] is not first[0]
+    assert renamed[0]['name_first'] == "New"
+
+    user_profile_sethandle(user['token'], "newhandle")
+    assert users_all(user['token'])['users'][0]['handle_str'] == "newhandle"
+
+    other = auth_register("validEmail2@gmail.com", "valid_password", "Jason", "Henry")
+    assert [found['u_id'] for found in users_all(user['token'])['users']] == [user['u_id'], other['u_id']]
+    clear()
+
+
+def test_users_all_json():
+    '''
+    Test if users_all_json gives users_all's response, reusing its JSON until the users change
+    '''
+    clear()
+    user = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    for i in range(4):
+        auth_register(f"validEmail{i}@gmail.com", "valid_password", "Jason", "Henry")
+
+    body = users_all_json(user['token'])
+    assert json.loads(body) == users_all(user['token'])
+    assert users_all_json(user['token']) is body
+    page = users_all(user['token'], 2)
+    assert json.loads(users_all_json(user['token'], 2)) == page
+    assert json.loads(users_all_json(user['token'], 2, page['next_cursor'])) == \
+        users_all(user['token'], 2, page['next_cursor'])
+
+    user_profile_setname(user['token'], "New", "Name")
+    renamed = users_all_json(user['token'])
+    assert renamed is not body
+    assert json.loads(renamed)['users'][0]['name_first'] == "New"
+    clear()
+
+
 def test_users_all_multiple():
     '''
     Test if users_all returns expected output when multiple users.
@@ -332,4 +411,114 @@ def test_search_different_user():
     assert found == 1
 
 
+def test_search_newest_first():
+    '''
+    Test if search results are ordered from newest to oldest
+    '''
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philip", "Dickens")
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+
+    message_ids = [
+        message_send(authorised_user['token'], channel['channel_id'],
+                     f'Hello number {i}')['message_id'] for i in range(3)
+    ]
+    message_send(authorised_user['token'], channel['channel_id'], 'Goodbye')
+
+    search_test = search(authorised_user['token'], 'Hello')
+    assert [message['message_id'] for message in search_test['messages']
+            ] == list(reversed(message_ids))
+
+
+def test_search_edit_and_remove():
+    '''
+    Test if search follows edited and removed messages
+    '''
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philip", "Dickens")
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+
+    edited = message_send(authorised_user['token'], channel['channel_id'],
+                          'Old news')
+    removed = message_send(authorised_user['token'], channel['channel_id'],
+                           'Old times')
+    message_edit(authorised_user['token'], edited['message_id'], 'New news')
+    message_remove(authorised_user['token'], removed['message_id'])
+
+    assert search(authorised_user['token'], 'Old')['messages'] == []
+    found = search(authorised_user['token'], 'New news')['messages']
+    assert [message['message_id'] for message in found] == [edited['message_id']]
+
+
+def test_search_short_query_and_other_channels():
+    '''
+    Test if short queries still match, and messages in other channels are not returned
+    '''
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philip", "Dickens")
+    authorised_user2 = auth_register("validEmail2@gmail.com", "valid_password",
+                                     "Tara", "Simons")
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+    channel2 = channels_create(authorised_user2['token'], "other_channel", False)
+
+    message_sent = message_send(authorised_user['token'], channel['channel_id'],
+                                'Hi all')
+    message_send(authorised_user2['token'], channel2['channel_id'], 'Hi all')
+
+    # user 2 is not part of the first channel
+    found = search(authorised_user2['token'], 'Hi')['messages']
+    assert message_sent['message_id'] not in [message['message_id'] for message in found]
+    found = search(authorised_user2['token'], 'Hi all')['messages']
+    assert message_sent['message_id'] not in [message['message_id'] for message in found]
+    assert len(found) == 1
 
+
+def test_search_limit_and_cursor():
+    '''
+    Test if search pages through results newest first using limit and cursor
+    '''
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philip", "Dickens")
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+    channel2 = channels_create(authorised_user['token'], "new_channel2", True)
+
+    message_ids = []
+    for i in range(5):
+        for channel_id in [channel['channel_id'], channel2['channel_id']]:
+            message_ids.append(
+                message_send(authorised_user['token'], channel_id,
+                             f'Page me {i}')['message_id'])
+    newest_first = list(reversed(message_ids))
+
+    found = []
+    cursor = None
+    while True:
+        page = search(authorised_user['token'], 'Page', 3, cursor)
+        assert len(page['messages']) <= 3
+        found += [message['message_id'] for message in page['messages']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert found == newest_first
+
+    # without a limit every match is returned
+    everything = search(authorised_user['token'], 'Page')
+    assert [message['message_id'] for message in everything['messages']] == newest_first
+    assert everything['next_cursor'] is None
+
+
+def test_search_invalid_limit_and_cursor():
+    '''
+    InputError if limit is below 1 or cursor is not a valid cursor
+    '''
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philip", "Dickens")
+    with pytest.raises(InputError):
+        search(authorised_user['token'], 'Old', 0)
+    with pytest.raises(InputError):
+        search(authorised_user['token'], 'Old', 5, 'not a cursor')
@@ -0,0 +1,395 @@
+'''
+Persistence
+Every function that changes users, channels or messages records the new
+state of what it changed here. Records are upserts, so replaying them in
+order on top of the latest snapshot rebuilds the data the server had.
+
+Records go to the SQLite database if config.SQLITE_PATH is set, otherwise
+to the journal if config.JOURNAL_PATH is set. Nothing is recorded if
+neither is set.
+'''
+import atexit
+import gc
+import traceback
+from threading import Event, Thread
+from binary_snapshot import Segment
+import config
+from concurrency import channel_lock
+from global_dic import data
+from history import ChannelHistory
+from journal import Journal
+from message_record import Message
+import session
+from sqlite_backend import SQLiteBackend, TableSegment
+import store
+import versions
+
+# where records are written, None while persistence is off
+_backend = None
+# background thread taking snapshots, woken by _snapshot_wanted
+_snapshotter = None
+_snapshot_wanted = Event()
+
+
+def start():
+    '''
+    Load the saved state and start recording changes, if a backend is configured
+    '''
+    global _backend, _snapshotter
+    if _backend is not None:
+        return
+    if config.SQLITE_PATH is not None:
+        backend = SQLiteBackend(config.SQLITE_PATH, config.JOURNAL_FSYNC)
+    elif config.JOURNAL_PATH is not None:
+        backend = Journal(config.JOURNAL_PATH, config.JOURNAL_FSYNC,
+                          config.JOURNAL_FLUSH_INTERVAL)
+    else:
+        return
+    # loading makes a lot of objects that live as long as the server, so the
+    # garbage collector is kept from scanning them over and over while they
+    # are made, and afterwards they are left out of future collections
+    gc.disable()
+    try:
+        state, records = backend.load()
+        if state is not None:
+            restore_state(state)
+        for record in records:
+            apply(record)
+    finally:
+        gc.enable()
+    gc.freeze()
+    backend.open()
+    _backend = backend
+    _snapshotter = Thread(target=_snapshot_loop, args=(backend,), daemon=True)
+    _snapshotter.start()
+
+
+def snapshot():
+    '''
+    Take a snapshot now and empty the journal
+    '''
+    if _backend is not None:
+        _backend.snapshot(dump_state)
+
+
+def stop():
+    '''
+    Write out anything pending and stop recording changes
+    '''
+    global _backend, _snapshotter
+    if _backend is not None:
+        backend = _backend
+        _backend = None
+        # lets a snapshot that is due finish first
+        _snapshot_wanted.set()
+        _snapshotter.join()
+        _snapshotter = None
+        backend.close()
+
+
+# make sure pending records are written when the server exits
+atexit.register(stop)
+
+
+def _write(record):
+    '''
+    Send a record to the backend, waking the snapshot thread once the journal is long enough
+    '''
+    backend = _backend
+    if backend is None:
+        return
+    backend.append(record)
+    if backend.length >= config.SNAPSHOT_EVERY:
+        _snapshot_wanted.set()
+
+
+def _snapshot_loop(backend):
+    '''
+    Background thread taking a snapshot whenever the journal gets long, so
+    the request that makes it long doesn't wait for one. Stops when
+    persistence does
+    '''
+    while True:
+        _snapshot_wanted.wait()
+        _snapshot_wanted.clear()
+        stopping = _backend is not backend
+        if backend.length >= config.SNAPSHOT_EVERY:
+            # the state is freed as soon as it is written, so a full collection
+            # set off by making it would only stall every other thread
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                backend.snapshot(dump_state)
+            except Exception:  # pylint: disable=broad-except
+                # the journal still has every record, the next one can try again
+                traceback.print_exc()
+            finally:
+                if collecting:
+                    gc.enable()
+        if stopping:
+            return
+
+
+def channel_meta(channel):
+    '''
+    Everything about a channel except its messages and id sets
+    '''
+    return {
+        'name': channel['name'],
+        'channel_id': channel['channel_id'],
+        'is_public': channel['is_public'],
+        'owner_members': channel['owner_members'],
+        'all_members': channel['all_members'],
+    }
+
+
+###################
+# recording changes
+###################
+def record_user(user):
+    '''
+    Record the current state of a user
+    '''
+    if _backend is not None:
+        _write({'op': 'user', 'user': dict(user)})
+
+
+def record_channel(channel):
+    '''
+    Record the current name, privacy and members of a channel
+    '''
+    if _backend is not None:
+        _write({'op': 'channel', 'channel': channel_meta(channel)})
+
+
+def record_message(channel, message):
+    '''
+    Record the current state of a message in a channel
+    '''
+    if _backend is not None:
+        _write({
+            'op': 'message',
+            'channel_id': channel['channel_id'],
+            'message': message.to_dict(),
+            'message_count': data['message_count'],
+        })
+
+
+def record_message_removed(message_id):
+    '''
+    Record that a message was removed
+    '''
+    if _backend is not None:
+        _write({'op': 'message_removed', 'message_id': message_id})
+
+
+def record_message_count():
+    '''
+    Record that a message_id was handed out before its message was added
+    '''
+    if _backend is not None:
+        _write({'op': 'message_count', 'message_count': data['message_count']})
+
+
+def record_job(job):
+    '''
+    Record a job that was scheduled
+    '''
+    if _backend is not None:
+        _write({'op': 'job', 'job': job})
+
+
+def record_job_done(job_id):
+    '''
+    Record that a scheduled job was run
+    '''
+    if _backend is not None:
+        _write({'op': 'job_done', 'job_id': job_id})
+
+
+def record_standup(channel_id):
+    '''
+    Record the standup running in a channel, or that there is none
+    '''
+    if _backend is not None:
+        _write({'op': 'standup', 'channel_id': channel_id, 'standup': data['standup'].get(channel_id)})
+
+
+def record_standup_line(channel_id, line):
+    '''
+    Record a line added to the standup running in a channel
+    '''
+    if _backend is not None:
+        _write({'op': 'standup_line', 'channel_id': channel_id, 'line': line})
+
+
+def record_clear():
+    '''
+    Record that everything was cleared
+    '''
+    if _backend is not None:
+        _write({'op': 'clear'})
+
+
+###################
+# replaying changes
+###################
+def _apply_user(record):
+    user = record['user']
+    existing = store.find_user(user['u_id'])
+    if existing is None:
+        store.insert_user(user)
+        existing = user
+    else:
+        store.update_user_email(existing, user['email'])
+        store.update_user_handle(existing, user['handle'])
+        store.update_flockr_owner(existing, user['is_flockr_owner'])
+        existing.update(user)
+    # tokens that were removed are not strings, and are not indexed
+    store.update_user_token(existing, user['token'], valid=isinstance(user['token'], str))
+    versions.bump(('user', user['u_id']), 'users')
+
+
+def _apply_channel(record):
+    meta = record['channel']
+    channel = store.find_channel(meta['channel_id'])
+    if channel is None:
+        channel = dict(meta, owner_ids=set(), member_ids=set(), standup=[],
+                       messages=ChannelHistory(lock=channel_lock(meta['channel_id'])))
+        store.insert_channel(channel)
+    channel.update(meta)
+    channel['owner_ids'] = {member['u_id'] for member in channel['owner_members']}
+    member_ids = {member['u_id'] for member in channel['all_members']}
+    for u_id in channel['member_ids'] - member_ids:
+        store.remove_membership(u_id, channel['channel_id'])
+    for u_id in member_ids - channel['member_ids']:
+        store.add_membership(u_id, channel['channel_id'])
+    channel['member_ids'] = member_ids
+
+
+def _apply_message(record):
+    message = Message.from_dict(record['message'])
+    if store.locate_message(message.message_id) is None:
+        store.append_message(store.find_channel(record['channel_id']), message)
+    else:
+        store.replace_message(message)
+    data['message_count'] = max(data['message_count'], record['message_count'])
+
+
+def _apply_message_removed(record):
+    if store.locate_message(record['message_id']) is not None:
+        store.delete_message(record['message_id'])
+
+
+def _apply_message_count(record):
+    data['message_count'] = max(data['message_count'], record['message_count'])
+
+
+def _apply_job(record):
+    data['jobs'][record['job']['job_id']] = record['job']
+
+
+def _apply_job_done(record):
+    data['jobs'].pop(record['job_id'], None)
+
+
+def _apply_standup(record):
+    if record['standup'] is None:
+        data['standup'].pop(record['channel_id'], None)
+    else:
+        data['standup'][record['channel_id']] = record['standup']
+
+
+def _apply_standup_line(record):
+    standup = data['standup'][record['channel_id']]
+    standup['lines'].append(record['line'])
+    standup['length'] += len(record['line']) + 1
+
+
+def _apply_clear(record):
+    store.clear()
+    session.clear()
+    versions.clear()
+    data['standup'].clear()
+    data['jobs'].clear()
+
+
+_APPLY = {
+    'user': _apply_user,
+    'channel': _apply_channel,
+    'message': _apply_message,
+    'message_removed': _apply_message_removed,
+    'message_count': _apply_message_count,
+    'job': _apply_job,
+    'job_done': _apply_job_done,
+    'standup': _apply_standup,
+    'standup_line': _apply_standup_line,
+    'clear': _apply_clear,
+}
+
+
+def apply(record):
+    '''
+    Replay a single record onto the current data
+    '''
+    _APPLY[record['op']](record)
+
+
+###################
+# snapshots
+###################
+def dump_state():
+    '''
+    Everything needed to rebuild data. Channels that were never loaded
+    keep their messages in the snapshot segment they came from.
+    '''
+    return {
+        'users': [dict(user) for user in list(data['users'])],
+        'channels': [
+            dict(channel_meta(channel), messages=_saved_messages(channel))
+            for channel in list(data['channels'])
+        ],
+        'message_count': data['message_count'],
+        'message_channels': store.message_channels(),
+        'jobs': list(data['jobs'].values()),
+        'standup': list(data['standup'].values()),
+    }
+
+
+def _saved_messages(channel):
+    '''
+    The snapshot segment of a channel that is not loaded yet, otherwise
+    its messages as tuples, copied with the channel locked since snapshots
+    are taken while messages are being sent
+    '''
+    with channel_lock(channel['channel_id']).reading():
+        saved = store.saved_history(channel)
+        if isinstance(saved, Segment):
+            return saved
+        if isinstance(saved, TableSegment):
+            saved = saved.load()
+        return [message.as_tuple() for message in saved]
+
+
+def restore_state(state):
+    '''
+    Replace data with a saved state. Each channel has either its 'messages'
+    or a snapshot 'segment' to load them from when they are first needed.
+    '''
+    _apply_clear(None)
+    for user in state['users']:
+        _apply_user({'user': user})
+    for saved in state['channels']:
+        segment = saved.pop('segment', None)
+        messages = saved.pop('messages', [])
+        _apply_channel({'channel': saved})
+        channel = store.find_channel(saved['channel_id'])
+        if segment is not None:
+            store.defer_history(channel, segment)
+        for message in messages:
+            store.append_message(channel, Message.from_dict(message))
+    if 'message_channels' in state:
+        store.restore_message_channels(state['message_channels'])
+    data['message_count'] = state['message_count']
+    data['jobs'] = {job['job_id']: job for job in state.get('jobs', [])}
+    data['standup'].update((standup['channel_id'], standup) for standup in state.get('standup', []))
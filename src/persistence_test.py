@@ -0,0 +1,275 @@
+'''
+Persistence Test
+'''
+from threading import Event, Thread
+from time import sleep
+import pytest
+from auth import auth_register
+from channel import channel_invite, channel_details, channel_messages, channel_leave
+from channels import channels_create, channels_list
+from message import message_send, message_edit, message_remove, message_react, message_pin, message_sendlater
+from standup import standup_start, standup_send
+from other import clear, users_all, search
+from user import user_profile_setname, user_profile
+from journal import Journal
+from sqlite_backend import SQLiteBackend
+from global_dic import data
+from utils import get_current_timestamp
+import config
+import persistence
+import scheduler
+import store
+import session
+
+
+@pytest.fixture
+def journal_path(tmp_path, monkeypatch):
+    '''
+    Journal to a temporary file, and make sure it is closed afterwards
+    '''
+    path = str(tmp_path / 'flockr.journal')
+    monkeypatch.setattr(config, 'JOURNAL_PATH', path)
+    monkeypatch.setattr(config, 'JOURNAL_FSYNC', 'always')
+    clear()
+    yield path
+    persistence.stop()
+    clear()
+
+
+@pytest.fixture(params=['journal', 'sqlite'])
+def backend(request, tmp_path, monkeypatch):
+    '''
+    Record to either a temporary journal or a temporary SQLite database
+    '''
+    monkeypatch.setattr(config, 'JOURNAL_FSYNC', 'always')
+    if request.param == 'journal':
+        monkeypatch.setattr(config, 'JOURNAL_PATH', str(tmp_path / 'flockr.journal'))
+    else:
+        monkeypatch.setattr(config, 'SQLITE_PATH', str(tmp_path / 'flockr.db'))
+    clear()
+    yield request.param
+    persistence.stop()
+    clear()
+
+
+def restart():
+    '''
+    Forget everything in memory, as if the server restarted, then load it back
+    '''
+    persistence.stop()
+    store.clear()
+    session.clear()
+    persistence.start()
+
+
+def populate():
+    '''
+    Make some users, channels and messages through the normal functions
+    '''
+    user_1 = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    user_2 = auth_register("validEmail2@gmail.com", "valid_password", "Tara", "Simons")
+    channel = channels_create(user_1['token'], "new_channel", True)
+    channel_invite(user_1['token'], channel['channel_id'], user_2['u_id'])
+    kept = message_send(user_1['token'], channel['channel_id'], "Hello there")
+    removed = message_send(user_2['token'], channel['channel_id'], "Remove me")
+    message_edit(user_1['token'], kept['message_id'], "Hello edited")
+    message_react(user_2['token'], kept['message_id'], 1)
+    message_pin(user_1['token'], kept['message_id'])
+    message_remove(user_2['token'], removed['message_id'])
+    user_profile_setname(user_2['token'], "Tina", "Simons")
+    return user_1, user_2, channel
+
+
+def test_persistence_replays(backend):
+    persistence.start()
+    user_1, user_2, channel = populate()
+    messages_before = channel_messages(user_1['token'], channel['channel_id'], 0)
+    details_before = channel_details(user_1['token'], channel['channel_id'])
+    users_before = users_all(user_1['token'])
+
+    restart()
+
+    assert channel_messages(user_1['token'], channel['channel_id'], 0) == messages_before
+    assert channel_details(user_1['token'], channel['channel_id']) == details_before
+    assert users_all(user_1['token']) == users_before
+    assert user_profile(user_2['token'], user_2['u_id'])['user']['name_first'] == "Tina"
+    assert [message['message'] for message in search(user_2['token'], "edited")['messages']
+            ] == ["Hello edited"]
+
+    # new message ids carry on from where they were
+    new_message = message_send(user_1['token'], channel['channel_id'], "After restart")
+    assert new_message['message_id'] == 3
+
+
+def test_persistence_snapshot_and_tail(journal_path, monkeypatch):
+    monkeypatch.setattr(config, 'SNAPSHOT_EVERY', 5)
+    persistence.start()
+    user_1, user_2, channel = populate()
+    channel_leave(user_2['token'], channel['channel_id'])
+    messages_before = channel_messages(user_1['token'], channel['channel_id'], 0)
+
+    # a snapshot has been taken and the journal only holds what came after it,
+    # stopping waits for the snapshot thread
+    persistence.stop()
+    saved = Journal(journal_path)
+    state, records = saved.load()
+    assert state is not None
+    assert len(records) < 5
+
+    restart()
+
+    assert channel_messages(user_1['token'], channel['channel_id'], 0) == messages_before
+    assert channels_list(user_2['token'])['channels'] == []
+
+
+def test_persistence_snapshot_in_background(journal_path, monkeypatch):
+    monkeypatch.setattr(config, 'SNAPSHOT_EVERY', 5)
+    persistence.start()
+    user_1, _, channel = populate()
+    taking = Event()
+    release = Event()
+    dump_state = persistence.dump_state
+
+    def slow_dump_state():
+        taking.set()
+        release.wait(5)
+        return dump_state()
+
+    monkeypatch.setattr(persistence, 'dump_state', slow_dump_state)
+    for i in range(5):
+        message_send(user_1['token'], channel['channel_id'], f"message {i}")
+    assert taking.wait(5)
+
+    # messages are sent and recorded while the snapshot is being taken
+    sent = [message_send(user_1['token'], channel['channel_id'], f"during {i}") for i in range(3)]
+    release.set()
+    messages_before = channel_messages(user_1['token'], channel['channel_id'], 0)
+
+    restart()
+
+    assert channel_messages(user_1['token'], channel['channel_id'], 0) == messages_before
+    assert messages_before['messages'][0]['message_id'] == sent[-1]['message_id']
+
+
+def test_persistence_loads_channels_lazily(backend):
+    persistence.start()
+    user_1, user_2, channel = populate()
+    other = channels_create(user_2['token'], "other_channel", True)
+    other_message = message_send(user_2['token'], other['channel_id'], "Somewhere else")
+    messages_before = channel_messages(user_1['token'], channel['channel_id'], 0)
+    other_before = channel_messages(user_2['token'], other['channel_id'], 0)
+    persistence.snapshot()
+
+    restart()
+
+    # nothing has been loaded yet
+    assert set(store.unloaded_histories) == {channel['channel_id'], other['channel_id']}
+    assert channel_messages(user_1['token'], channel['channel_id'], 0) == messages_before
+    assert set(store.unloaded_histories) == {other['channel_id']}
+
+    # a snapshot taken now copies the unloaded channel over as it is
+    persistence.snapshot()
+    restart()
+    assert channel_messages(user_2['token'], other['channel_id'], 0) == other_before
+
+    # message operations and search load the channel they need
+    restart()
+    message_edit(user_2['token'], other_message['message_id'], "Somewhere new")
+    assert store.unloaded_histories.keys() == {channel['channel_id']}
+    assert [message['message'] for message in search(user_1['token'], "edited")['messages']
+            ] == ["Hello edited"]
+    assert store.unloaded_histories == {}
+
+
+def test_persistence_clear(backend):
+    persistence.start()
+    user_1, _, channel = populate()
+    message_sendlater(user_1['token'], channel['channel_id'], "ghost", get_current_timestamp() + 60)
+    clear()
+    auth_register("validEmail3@gmail.com", "valid_password", "Nora", "Ghost")
+    restart()
+    assert store.find_user_by_email("validEmail@gmail.com") is None
+    assert store.find_user_by_email("validEmail3@gmail.com") is not None
+    assert store.find_channel(0) is None
+    assert data['jobs'] == {}
+
+
+def test_persistence_resumes_scheduled_jobs(backend):
+    persistence.start()
+    user_1, _, channel = populate()
+    now = get_current_timestamp()
+    later_1 = message_sendlater(user_1['token'], channel['channel_id'], "first later", now + 2)
+    later_2 = message_sendlater(user_1['token'], channel['channel_id'], "second later", now + 3)
+    standup_start(user_1['token'], channel['channel_id'], 1)
+    standup_send(user_1['token'], channel['channel_id'], "in standup")
+    # the server goes down before any of them are due
+    persistence.snapshot()
+    scheduler.clear()
+
+    restart()
+    assert len(data['jobs']) == 3
+    sleep(3.2)
+    # all three came due while the server was down, and are sent in order
+    assert scheduler.resume() == 3
+    messages = channel_messages(user_1['token'], channel['channel_id'], 0)['messages']
+    assert [message['message'] for message in messages[:2]] == ["second later", "first later"]
+    assert [message['message_id'] for message in messages[:2]] == [later_2['message_id'], later_1['message_id']]
+    assert messages[2]['message'].endswith("in standup\n")
+    assert data['jobs'] == {}
+
+    # and are not sent again after another restart
+    restart()
+    assert data['jobs'] == {}
+    assert scheduler.resume() == 0
+
+
+def test_journal_ignores_torn_write(tmp_path):
+    path = str(tmp_path / 'torn.journal')
+    journal = Journal(path, 'always')
+    journal.load()
+    journal.open()
+    journal.append({'op': 'clear'})
+    journal.append({'op': 'clear'})
+    journal.close()
+    with open(path, 'a') as torn:
+        torn.write('{"op": "cle')
+
+    state, records = Journal(path).load()
+    assert state is None
+    assert [record['seq'] for record in records] == [1, 2]
+
+
+def test_journal_appends_after_torn_write(tmp_path):
+    path = str(tmp_path / 'torn.journal')
+    journal = Journal(path, 'always')
+    journal.load()
+    journal.open()
+    journal.append({'op': 'clear'})
+    journal.close()
+    with open(path, 'a') as torn:
+        torn.write('{"op": "cle')
+
+    # records written after restarting from the torn journal survive the next restart
+    journal = Journal(path, 'always')
+    journal.load()
+    journal.open()
+    journal.append({'op': 'clear'})
+    journal.append({'op': 'clear'})
+    journal.close()
+
+    state, records = Journal(path).load()
+    assert state is None
+    assert [record['seq'] for record in records] == [1, 2, 3]
+
+
+def test_sqlite_connection_per_thread(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'threads.db'))
+    backend.open()
+    connections = []
+    thread = Thread(target=lambda: connections.append(backend.connection()))
+    thread.start()
+    thread.join()
+    assert backend.connection() is backend.connection()
+    assert connections[0] is not backend.connection()
+    assert backend.connection().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    backend.close()
@@ -0,0 +1,222 @@
+'''
+Scheduler
+Runs callbacks at a later time, for message_sendlater and standups.
+Scheduled jobs wait in a single heap ordered by when they are due. One
+dispatcher thread sleeps until the earliest one is due and hands it to a
+small pool of config.SCHEDULER_WORKERS threads, so waiting jobs only cost
+their heap entry rather than a sleeping thread each.
+
+Jobs scheduled with schedule_job are saved in data['jobs'] and recorded
+through persistence, by the name their callback was registered under, so
+resume can run them again after a restart.
+'''
+import heapq
+from itertools import count
+from queue import SimpleQueue
+from threading import Condition, Thread
+import time
+import traceback
+import config
+from global_dic import data
+import persistence
+
+# (due, job_id, callback, args), earliest first
+_heap = []
+# job_ids that were cancelled but are still in the heap
+_cancelled = set()
+_changed = Condition()
+# jobs that are due, waiting for a worker
+_due = SimpleQueue()
+_job_ids = count(1)
+_threads = []
+# kind -> callback, for jobs saved with schedule_job
+_kinds = {}
+
+# counts reported by stats
+_stats = {'fired': 0, 'failed': 0, 'busy': 0, 'last_lag': 0.0, 'max_lag': 0.0}
+
+
+def _start():
+    '''
+    Start the dispatcher and workers the first time a job is scheduled. Called holding _changed
+    '''
+    if _threads:
+        return
+    _threads.append(Thread(target=_dispatch, daemon=True))
+    for _ in range(max(1, config.SCHEDULER_WORKERS)):
+        _threads.append(Thread(target=_work, daemon=True))
+    for thread in _threads:
+        thread.start()
+
+
+def _dispatch():
+    '''
+    Move jobs from the heap to the workers as they become due
+    '''
+    while True:
+        with _changed:
+            while not _heap or _heap[0][0] > time.time():
+                _changed.wait(None if not _heap else _heap[0][0] - time.time())
+            job = heapq.heappop(_heap)
+            if job[1] in _cancelled:
+                _cancelled.discard(job[1])
+                continue
+            # handed over holding _changed, so clear can't miss it
+            _due.put(job)
+
+
+def _work():
+    '''
+    Run due jobs, one at a time
+    '''
+    while True:
+        due, _, callback, args = _due.get()
+        lag = max(0.0, time.time() - due)
+        with _changed:
+            _stats['busy'] += 1
+            _stats['last_lag'] = lag
+            _stats['max_lag'] = max(_stats['max_lag'], lag)
+        try:
+            callback(*args)
+        except Exception:  # pylint: disable=broad-except
+            # a failed job must not stop the worker
+            traceback.print_exc()
+            with _changed:
+                _stats['failed'] += 1
+        with _changed:
+            _stats['busy'] -= 1
+            _stats['fired'] += 1
+
+
+def _push(due, job_id, callback, args):
+    '''
+    Add a job to the heap
+    '''
+    with _changed:
+        heapq.heappush(_heap, (due, job_id, callback, args))
+        _start()
+        # only wake the dispatcher if this is now the first job due
+        if _heap[0][1] == job_id:
+            _changed.notify()
+
+
+def schedule_at(due, callback, *args):
+    '''
+    Call callback(*args) at the unix time due, returning the job_id
+    '''
+    job_id = next(_job_ids)
+    _push(due, job_id, callback, args)
+    return job_id
+
+
+def schedule(delay, callback, *args):
+    '''
+    Call callback(*args) in delay seconds, returning the job_id
+    '''
+    return schedule_at(time.time() + delay, callback, *args)
+
+
+def register(kind, callback):
+    '''
+    Let jobs of kind be saved, to be run by callback
+    '''
+    _kinds[kind] = callback
+
+
+def _run_job(job):
+    '''
+    Run a saved job and forget it
+    '''
+    try:
+        _kinds[job['kind']](*job['args'])
+    finally:
+        data['jobs'].pop(job['job_id'], None)
+        persistence.record_job_done(job['job_id'])
+
+
+def schedule_job(kind, due, *args):
+    '''
+    Call the callback registered as kind with args at the unix time due.
+    The job is saved, so args have to be JSON values. Returns the job_id
+    '''
+    if kind not in _kinds:
+        raise ValueError(f'no callback registered for {kind}')
+    job_id = next(_job_ids)
+    job = {'job_id': job_id, 'kind': kind, 'due': due, 'args': list(args)}
+    data['jobs'][job_id] = job
+    persistence.record_job(job)
+    _push(due, job_id, _run_job, (job,))
+    return job_id
+
+
+def resume():
+    '''
+    Schedule the saved jobs loaded by persistence.start. The ones that came due
+    while the server was down are run straight away, in the order they were due.
+    Returns how many were run
+    '''
+    global _job_ids
+    jobs = sorted(data['jobs'].values(), key=lambda job: (job['due'], job['job_id']))
+    if not jobs:
+        return 0
+    # carry on numbering after the saved jobs
+    _job_ids = count(max(next(_job_ids), max(job['job_id'] for job in jobs) + 1))
+    now = time.time()
+    overdue = 0
+    while overdue < len(jobs) and jobs[overdue]['due'] <= now:
+        overdue += 1
+    for job in jobs[:overdue]:
+        try:
+            _run_job(job)
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+    for job in jobs[overdue:]:
+        _push(job['due'], job['job_id'], _run_job, (job,))
+    return overdue
+
+
+def cancel(job_id):
+    '''
+    Stop a job that has not been run yet from running
+    '''
+    with _changed:
+        if any(job[1] == job_id for job in _heap):
+            _cancelled.add(job_id)
+    if data['jobs'].pop(job_id, None) is not None:
+        persistence.record_job_done(job_id)
+
+
+def clear():
+    '''
+    Drop every job that is waiting to be run, including the saved ones
+    and the ones that are due but haven't reached a worker yet
+    '''
+    with _changed:
+        _heap.clear()
+        _cancelled.clear()
+        while not _due.empty():
+            _due.get_nowait()
+        data['jobs'].clear()
+        _changed.notify()
+
+
+def stats():
+    '''
+    Number of jobs waiting and running, and how late they were run
+    '''
+    with _changed:
+        now = time.time()
+        waiting = len(_heap) - len(_cancelled)
+        overdue = sum(1 for job in _heap if job[0] <= now and job[1] not in _cancelled)
+        next_due = min((job[0] for job in _heap if job[1] not in _cancelled), default=None)
+        return {
+            'queue_depth': waiting,
+            'overdue': overdue + _due.qsize(),
+            'running': _stats['busy'],
+            'workers': max(1, config.SCHEDULER_WORKERS),
+            'fired': _stats['fired'],
+            'failed': _stats['failed'],
+            'next_due_in_ms': None if next_due is None else round(max(0.0, next_due - now) * 1000, 3),
+            'last_lag_ms': round(_stats['last_lag'] * 1000, 3),
+            'max_lag_ms': round(_stats['max_lag'] * 1000, 3),
+        }
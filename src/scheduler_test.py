@@ -0,0 +1,95 @@
+'''
+Scheduler Test
+'''
+from threading import Event, active_count
+import time
+import pytest
+from global_dic import data
+import scheduler
+
+
+@pytest.fixture
+def empty():
+    scheduler.clear()
+    yield
+    scheduler.clear()
+
+
+def wait_for(condition, timeout=5):
+    '''
+    Wait until condition() is True
+    '''
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_jobs_run_in_due_order(empty):
+    fired = []
+    now = time.time()
+    for delay in (0.3, 0.1, 0.2):
+        scheduler.schedule_at(now + delay, fired.append, delay)
+    assert wait_for(lambda: len(fired) == 3)
+    assert fired == [0.1, 0.2, 0.3]
+
+
+def test_many_jobs_few_threads(empty):
+    done = Event()
+    fired = []
+
+    def job(i):
+        fired.append(i)
+        if len(fired) == 2000:
+            done.set()
+
+    threads = active_count()
+    for i in range(2000):
+        scheduler.schedule(0.2, job, i)
+    assert scheduler.stats()['queue_depth'] == 2000
+    # waiting jobs don't each get a thread
+    assert active_count() <= threads + scheduler.stats()['workers'] + 1
+    assert done.wait(5)
+    assert sorted(fired) == list(range(2000))
+
+
+def test_cancel_and_clear(empty):
+    fired = []
+    job_id = scheduler.schedule(0.1, fired.append, 'cancelled')
+    scheduler.cancel(job_id)
+    scheduler.schedule(0.1, fired.append, 'cleared')
+    scheduler.clear()
+    scheduler.schedule(0.2, fired.append, 'kept')
+    assert wait_for(lambda: fired)
+    time.sleep(0.1)
+    assert fired == ['kept']
+
+
+def test_clear_forgets_saved_jobs(empty):
+    fired = []
+    scheduler.register('test_clear', fired.append)
+    scheduler.schedule_job('test_clear', time.time() + 0.1, 'saved')
+    assert len(data['jobs']) == 1
+    scheduler.clear()
+    assert data['jobs'] == {}
+    assert scheduler.stats()['queue_depth'] == 0
+    time.sleep(0.3)
+    assert fired == []
+
+
+def test_failing_job_is_counted(empty):
+    failed = scheduler.stats()['failed']
+    scheduler.schedule(0, lambda: 1 / 0)
+    assert wait_for(lambda: scheduler.stats()['failed'] == failed + 1)
+    fired = []
+    scheduler.schedule(0, fired.append, 1)
+    assert wait_for(lambda: fired == [1])
+
+
+def test_stats(empty):
+    scheduler.schedule(60, print)
+    stats = scheduler.stats()
+    assert stats['queue_depth'] == 1
+    assert stats['overdue'] == 0
+    assert 0 < stats['next_due_in_ms'] <= 60000
+    assert {'running', 'workers', 'fired', 'failed', 'last_lag_ms', 'max_lag_ms'} <= set(stats)
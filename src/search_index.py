@@ -0,0 +1,89 @@
+'''
+Search Index
+Trigram index over message bodies, kept up to date as messages are
+sent, edited and removed so search doesn't have to read every message.
+
+Only trigram -> message_ids is kept. A message's trigrams are worked out
+again from its old text when it is edited or removed, rather than kept
+for every message, which took more memory than the messages themselves.
+'''
+
+from threading import Lock
+
+# length of the substrings that are indexed
+GRAM_SIZE = 3
+
+# trigram -> set of message_ids whose text contains it
+grams = {}
+# held while the index is changed or read, as messages of different channels are indexed at once
+_lock = Lock()
+
+
+def split_grams(text):
+    '''
+    Every distinct trigram found in text
+    '''
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def add_message(message_id, text):
+    '''
+    Index the text of a new message
+    '''
+    found = split_grams(text)
+    with _lock:
+        for gram in found:
+            grams.setdefault(gram, set()).add(message_id)
+
+
+def remove_message(message_id, text):
+    '''
+    Stop indexing a message whose text was text
+    '''
+    found = split_grams(text)
+    with _lock:
+        for gram in found:
+            ids = grams.get(gram)
+            if ids is None:
+                continue
+            ids.discard(message_id)
+            if not ids:
+                del grams[gram]
+
+
+def update_message(message_id, old_text, text):
+    '''
+    Re-index a message after its text was edited from old_text
+    '''
+    if old_text != text:
+        remove_message(message_id, old_text)
+        add_message(message_id, text)
+
+
+def candidates(query_str):
+    '''
+    Set of message_ids that contain every trigram of query_str.
+    Every message containing query_str is in this set, but each
+    candidate still needs a substring check.
+    Returns None if the query is too short to use the index.
+    '''
+    query_grams = split_grams(query_str)
+    if not query_grams:
+        return None
+    # intersect the smallest sets first
+    with _lock:
+        posting = sorted((grams.get(gram, set()) for gram in query_grams), key=len)
+        result = set(posting[0])
+        for ids in posting[1:]:
+            if not result:
+                break
+            result &= ids
+    return result
+
+
+def clear():
+    '''
+    Empty the index
+    '''
+    with _lock:
+        grams.clear()
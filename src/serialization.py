@@ -0,0 +1,86 @@
+'''
+Serialization
+Encodes responses to JSON with the fastest encoder installed: orjson,
+then ujson, then the json module. None of them is required.
+
+Each message keeps its own encoded JSON once it has been sent in a
+response. store drops it whenever the message is edited, reacted to or
+pinned, so a page of messages is put together from the cached JSON of
+each message without encoding any of them again.
+'''
+import json
+from flask import Response
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _ujson_dumps(obj):
+    return ujson.dumps(obj, ensure_ascii=False).encode()
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+ENCODERS = {'orjson': _orjson_dumps, 'ujson': _ujson_dumps, 'json': _json_dumps}
+
+
+def pick_encoder(name=None):
+    '''
+    Name of the encoder to use: name if given and installed, else the fastest installed
+    '''
+    installed = [encoder for encoder, module in (('orjson', orjson), ('ujson', ujson), ('json', json))
+                 if module is not None]
+    return name if name in installed else installed[0]
+
+
+ENCODER = pick_encoder(config.JSON_ENCODER)
+dumps = ENCODERS[ENCODER]
+
+
+def json_response(obj, status=200):
+    '''
+    Response holding obj as JSON, in place of flask.jsonify
+    '''
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+
+def message_json(message):
+    '''
+    A Message's JSON, encoded the first time it is asked for. Only called
+    with the message's channel locked, which is how store's changes to it are kept out
+    '''
+    encoded = message.encoded
+    if encoded is None:
+        encoded = message.encoded = dumps(message.to_dict())
+    return encoded
+
+
+def list_json(key, encoded, fields):
+    '''
+    JSON of {key: [...], **fields}, joining the already encoded JSON of each item
+    '''
+    body = b'{"' + key.encode() + b'":[' + b','.join(encoded) + b']'
+    if not fields:
+        return body + b'}'
+    # the other fields' JSON without its opening brace
+    return body + b',' + dumps(fields)[1:]
+
+
+def messages_json(messages, fields):
+    '''
+    JSON of {'messages': [...], **fields}, joining the messages' cached JSON
+    '''
+    return list_json('messages', (message_json(message) for message in messages), fields)
@@ -0,0 +1,56 @@
+'''
+Serialization Test
+'''
+import json
+from auth import auth_register
+from channel import channel_messages, channel_messages_json
+from channels import channels_create
+from message import message_send, message_edit, message_react, message_pin
+from message_record import Message
+from other import clear
+import serialization
+import store
+
+
+def test_encoders_agree():
+    value = {'messages': [Message(0, 1, 100, 'héllo "quoted"').to_dict()], 'start': 0, 'end': -1, 'n': None}
+    for name in serialization.ENCODERS:
+        if serialization.pick_encoder(name) == name:
+            assert json.loads(serialization.ENCODERS[name](value)) == value
+    # an encoder that isn't installed falls back to the fastest one that is
+    assert serialization.pick_encoder('not an encoder') == serialization.pick_encoder()
+
+
+def test_messages_json_matches_channel_messages():
+    clear()
+    user = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    channel_id = channels_create(user['token'], "new_channel", True)['channel_id']
+    for i in range(5):
+        message_send(user['token'], channel_id, f"message {i}")
+    for args in ((0,), (0, None, None, 2), (0, store.history(store.find_channel(channel_id)).page(0, 5)[2].message_id)):
+        assert json.loads(channel_messages_json(user['token'], channel_id, *args)) == \
+            channel_messages(user['token'], channel_id, *args)
+    clear()
+
+
+def test_message_json_cached_until_changed():
+    clear()
+    user = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    channel_id = channels_create(user['token'], "new_channel", True)['channel_id']
+    message_id = message_send(user['token'], channel_id, "hello")['message_id']
+    message = store.find_message(message_id)
+    encoded = serialization.message_json(message)
+    assert serialization.message_json(message) is encoded
+
+    message_react(user['token'], message_id, 1)
+    reacted = json.loads(serialization.message_json(store.find_message(message_id)))
+    assert reacted['reacts'][0]['u_ids'] == [user['u_id']]
+
+    message_pin(user['token'], message_id)
+    assert json.loads(serialization.message_json(store.find_message(message_id)))['is_pinned'] is True
+
+    message_edit(user['token'], message_id, "edited")
+    page = json.loads(channel_messages_json(user['token'], channel_id))
+    assert page['messages'][0]['message'] == "edited"
+    assert page['messages'][0]['is_pinned'] is True
+    clear()
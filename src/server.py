@@ -2,17 +2,28 @@
 Importing required modules and functions to run the server
 '''
 import sys
+from functools import wraps
 from json import dumps
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 from flask_cors import CORS
 from error import InputError, AccessError
+from utils import check_token, decode_token
 from channels import channels_list, channels_listall, channels_create
-from channel import channel_invite, channel_details, channel_messages, channel_leave, channel_join, channel_addowner, channel_removeowner
+from channel import channel_invite, channel_details, channel_leave, channel_join, channel_addowner, channel_removeowner
+from channel import channel_stream, channel_stream_open, newer_events, channel_messages_json
 from auth import auth_login, auth_logout, auth_register, auth_passwordreset_request, auth_passwordreset_reset
 from user import user_profile, user_profile_setname, user_profile_setemail, user_profile_sethandle, user_profile_uploadphoto
-from other import clear, users_all, admin_userpermission_change, search
+from other import clear, users_all_json, admin_userpermission_change, search
 from message import message_send, message_remove, message_edit, message_sendlater,  message_react,  message_unreact, message_pin, message_unpin
 from standup import standup_start, standup_active, standup_send
+import persistence
+import events
+import config
+from concurrency import lock_stats
+import scheduler
+import versions
+from serialization import json_response
+from batch import run_batch
 
 
 def defaultHandler(err):
@@ -36,6 +47,29 @@ APP.config['TRAP_HTTP_EXCEPTIONS'] = True
 APP.register_error_handler(Exception, defaultHandler)
 
 
+def conditional(depends_on):
+    '''
+    Tag a GET route's responses with an ETag made of the versions its
+    response depends on, depends_on(args, u_id) gives their keys. A request
+    whose If-None-Match has the current tag gets 304 without the route running
+    '''
+    def decorator(route):
+        @wraps(route)
+        def tagged():
+            args = request.args
+            # the token is still checked, so a logged out client gets an error rather than 304
+            u_id = decode_token(args['token'])
+            tag = versions.etag(depends_on(args, u_id), u_id, args.items(multi=True))
+            if request.if_none_match.contains_weak(tag):
+                response = Response(status=304)
+            else:
+                response = APP.make_response(route())
+            response.set_etag(tag)
+            return response
+        return tagged
+    return decorator
+
+
 # Example
 @APP.route("/echo", methods=['GET'])
 def echo():
@@ -49,6 +83,7 @@ def echo():
 # channels
 ###################
 @APP.route("/channels/list", methods=["GET"])
+@conditional(lambda args, u_id: [('member', u_id)])
 def http_channels_list():
     ''' 
     Loops through the list of channels and each member in that channel,
@@ -59,10 +94,11 @@ def http_channels_list():
     '''
 
     new_data = {"token": request.args.get("token")}
-    return jsonify(channels_list(new_data["token"]))
+    return json_response(channels_list(new_data["token"]))
 
 
 @APP.route("/channels/listall", methods=["GET"])
+@conditional(lambda args, u_id: ['channels', ('member', u_id)])
 def http_channels_listall():
     ''' 
     Adds all public channels and loops through the list private 
@@ -73,7 +109,7 @@ def http_channels_listall():
     '''
 
     new_data = {"token": request.args.get("token")}
-    return jsonify(channels_listall(new_data["token"]))
+    return json_response(channels_listall(new_data["token"]))
 
 
 @APP.route("/channels/create", methods=["POST"])
@@ -83,11 +119,23 @@ def http_channels_create():
     Return: the channel_id
     '''
     new_data = request.get_json()
-    return jsonify(
+    return json_response(
         channels_create(new_data["token"], new_data["name"],
                         new_data["is_public"]))
 
 
+@APP.route("/channels/socket", methods=["GET"])
+def http_channels_socket():
+    '''
+    WebSocket pushing the events of every channel the user is a member of.
+    This server can't take the connection over, so it only checks the token
+    and asks for the upgrade, which async_server.py answers
+    '''
+    check_token(request.args['token'])
+    return Response(dumps({'message': 'connect with a WebSocket to async_server.py'}), status=426,
+                    headers={'Upgrade': 'websocket'}, mimetype='application/json')
+
+
 ###################
 # channel
 ###################
@@ -103,30 +151,89 @@ def http_channel_invite():
     Send the correct data to the functions.
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         channel_invite(data['token'], int(data['channel_id']), int(data['u_id'])))
 
 
 @APP.route("/channel/details", methods=["GET"])
+@conditional(lambda args, u_id: [('channel', int(args['channel_id'])), ('member', u_id)])
 def http_channel_details():
     '''
     Grabs data from the URL
     Sends selected data from the URL to the function
     '''
     data = request.args
-    return jsonify(channel_details(data['token'], int(data['channel_id'])))
+    return json_response(channel_details(data['token'], int(data['channel_id'])))
 
 
 @APP.route("/channel/messages", methods=["GET"])
+@conditional(lambda args, u_id: [('messages', int(args['channel_id'])), ('member', u_id)])
 def http_channel_messages():
     '''
     Grabs data from the URL
     Sends selected data from the URL to the function
     '''
     data = request.args
-    return jsonify(
-        channel_messages(data['token'], int(data['channel_id']),
-                         int(data['start'])))
+    before_message_id = data.get('before_message_id')
+    after_message_id = data.get('after_message_id')
+    limit = data.get('limit')
+    return Response(
+        channel_messages_json(data['token'], int(data['channel_id']),
+                              int(data.get('start', 0)),
+                              int(before_message_id) if before_message_id is not None else None,
+                              int(after_message_id) if after_message_id is not None else None,
+                              int(limit) if limit is not None else None),
+        mimetype='application/json')
+
+
+def stream_since(args, headers):
+    '''
+    Event id a stream request wants the events after, from since or the Last-Event-ID header
+    '''
+    since = args.get('since', headers.get('Last-Event-ID'))
+    return int(since) if since is not None else None
+
+
+def wants_event_stream(headers):
+    '''
+    Whether a stream request asked for Server-Sent Events rather than a long-poll
+    '''
+    return 'text/event-stream' in headers.get('Accept', '')
+
+
+@APP.route("/channel/stream", methods=["GET"])
+def http_channel_stream():
+    '''
+    Message events of a channel, as a long-poll JSON response, or as
+    Server-Sent Events if the request accepts text/event-stream
+    '''
+    data = request.args
+    since = stream_since(data, request.headers)
+    if not wants_event_stream(request.headers):
+        timeout = data.get('timeout')
+        found, last_id = channel_stream(data['token'], int(data['channel_id']), since,
+                                        float(timeout) if timeout is not None else None)
+        return Response(events.encode_events(found, last_id), mimetype='application/json')
+
+    subscription, backlog = channel_stream_open(data['token'], int(data['channel_id']), since)
+
+    def stream():
+        try:
+            # the server only sends the headers with the first chunk
+            yield ': stream open\n\n'
+            found, last_id = newer_events(backlog, since or 0)
+            for event in found:
+                yield event.sse()
+            while not subscription.closed:
+                found, last_id = newer_events(subscription.wait(config.STREAM_HEARTBEAT), last_id)
+                if not found and not subscription.closed:
+                    yield ': keep-alive\n\n'
+                for event in found:
+                    yield event.sse()
+        finally:
+            events.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 
 @APP.route("/channel/leave", methods=['POST'])
@@ -136,7 +243,7 @@ def http_channel_leave():
     Send the correct data to the functions.
     '''
     data = request.get_json()
-    return jsonify(channel_leave(data['token'], int(data['channel_id'])))
+    return json_response(channel_leave(data['token'], int(data['channel_id'])))
 
 
 @APP.route("/channel/join", methods=["POST"])
@@ -146,7 +253,7 @@ def http_channel_join():
     Send the correct data to the functions.
     '''
     data = request.get_json()
-    return jsonify(channel_join(data['token'], int(data['channel_id'])))
+    return json_response(channel_join(data['token'], int(data['channel_id'])))
 
 
 @APP.route("/channel/addowner", methods=['POST'])
@@ -156,7 +263,7 @@ def http_channel_addowner():
     Send the correct data to the functions.
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         channel_addowner(data['token'], int(data['channel_id']), int(data['u_id'])))
 
 
@@ -167,7 +274,7 @@ def http_channel_removeowner():
     Send the correct data to the functions.
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         channel_removeowner(data['token'], int(data['channel_id']),
                             int(data['u_id'])))
 
@@ -182,7 +289,7 @@ def http_auth_login():
     Send the correct data to the functions.
     '''
     data = request.get_json()
-    return jsonify(auth_login(data['email'], data['password']))
+    return json_response(auth_login(data['email'], data['password']))
 
 
 @APP.route("/auth/logout", methods=['POST'])
@@ -192,7 +299,7 @@ def http_auth_logout():
     Send the correct data to the functions.
     '''
     data = request.get_json()
-    return jsonify(auth_logout(data['token']))
+    return json_response(auth_logout(data['token']))
 
 
 @APP.route("/auth/register", methods=['POST'])
@@ -202,7 +309,7 @@ def http_auth_register():
     Send the correct data to the functions.
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         auth_register(data['email'], data['password'], data['name_first'],
                       data['name_last']))
 
@@ -211,20 +318,21 @@ def http_auth_passwordreset_request():
     data = request.get_json()
     auth_passwordreset_request(data["email"])
     
-    return jsonify({})
+    return json_response({})
 
 @APP.route("/auth/passwordreset/reset", methods=['POST'])
 def http_auth_passwordreset_reset():
     data = request.get_json()
     auth_passwordreset_reset(data['reset_code'], data['new_password'])
 
-    return jsonify({})
+    return json_response({})
 
 
 ####################
 # User functions
 ####################
 @APP.route('/user/profile', methods=['GET'])
+@conditional(lambda args, u_id: [('user', int(args['u_id']))])
 def http_user_profile():
     '''
     For a valid user, returns information about their email, 
@@ -232,7 +340,7 @@ def http_user_profile():
     '''
 
     data = request.args
-    return jsonify(user_profile(data['token'], int(data['u_id'])))
+    return json_response(user_profile(data['token'], int(data['u_id'])))
 
 
 @APP.route('/user/profile/setname', methods=['PUT'])
@@ -242,7 +350,7 @@ def http_user_profile_setname():
     '''
 
     data = request.get_json()
-    return jsonify(
+    return json_response(
         user_profile_setname(data['token'], data['name_first'],
                              data['name_last']))
 
@@ -254,7 +362,7 @@ def http_user_profile_setemail():
     '''
 
     data = request.get_json()
-    return jsonify(user_profile_setemail(data['token'], data['email']))
+    return json_response(user_profile_setemail(data['token'], data['email']))
 
 
 @APP.route('/user/profile/sethandle', methods=['PUT'])
@@ -264,7 +372,7 @@ def http_user_profile_sethandle():
     '''
 
     data = request.get_json()
-    return jsonify(user_profile_sethandle(data['token'], data['handle_str']))
+    return json_response(user_profile_sethandle(data['token'], data['handle_str']))
 
 @APP.route("/images/<filename>", methods=["GET"])
 def send_js(filename):
@@ -279,7 +387,7 @@ def http_user_profile_uploadphoto():
     # print(f'this is the url {request.url_root}')
 
     data = request.get_json()
-    return jsonify(user_profile_uploadphoto(data['token'], data['img_url'], 
+    return json_response(user_profile_uploadphoto(data['token'], data['img_url'], 
         int(data['x_start']), int(data['y_start']), int(data['x_end']), int(data['y_end'])))
 
 
@@ -287,13 +395,17 @@ def http_user_profile_uploadphoto():
 # other functions
 ####################
 @APP.route('/users/all', methods=['GET'])
+@conditional(lambda args, u_id: ['users'])
 def http_users_all():
     '''
-    Returns a list of all users and their associated details
+    Returns a list of all users and their associated details.
+    Optional limit and cursor parameters page through them
     '''
 
     data = request.args
-    return jsonify(users_all(data['token']))
+    limit = data.get('limit')
+    return Response(users_all_json(data['token'], int(limit) if limit is not None else None, data.get('cursor')),
+                    mimetype='application/json')
 
 
 @APP.route('/admin/userpermission/change', methods=['POST'])
@@ -303,7 +415,7 @@ def http_admin_userpermission_change():
     '''
 
     data = request.get_json()
-    return jsonify(
+    return json_response(
         admin_userpermission_change(data['token'], int(data['u_id']),
                                     int(data['permission_id'])))
 
@@ -311,11 +423,15 @@ def http_admin_userpermission_change():
 @APP.route('/search', methods=['GET'])
 def http_search():
     '''
-    Given a query string, return a collection of messages in all of the channels that the user has joined that match the query
+    Given a query string, return a collection of messages in all of the channels that the user has joined that match the query.
+    Optional limit and cursor parameters page through the results newest first
     '''
 
     data = request.args
-    return jsonify(search(data['token'], data['query_str']))
+    limit = data.get('limit')
+    return json_response(
+        search(data['token'], data['query_str'],
+               int(limit) if limit is not None else None, data.get('cursor')))
 
 
 ###################
@@ -327,7 +443,7 @@ def http_message_send():
     Send a message from authorised_user to the channel specified by channel_id
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         message_send(data['token'], int(data['channel_id']), data['message']))
 
 
@@ -337,7 +453,7 @@ def http_message_remove():
     Given a message_id for a message, this message is removed from the channel
     '''
     data = request.get_json()
-    return jsonify(message_remove(data['token'], data['message_id']))
+    return json_response(message_remove(data['token'], data['message_id']))
 
 @APP.route('/message/edit', methods=['PUT'])
 def http_message_edit():
@@ -346,7 +462,7 @@ def http_message_edit():
     new message is an empty string, the message is deleted.
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         message_edit(data['token'], data['message_id'], data['message']))
 
 
@@ -357,7 +473,7 @@ def http_message_sendlater():
     greater than the current time.
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         message_sendlater(data['token'],int(data['channel_id']), data['message'], data['time_sent']))
 
 @APP.route('/message/react', methods=['POST'])
@@ -371,7 +487,7 @@ def http_message_react():
     returns empty dictionary
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         message_react(data['token'], data['message_id'], data['react_id']))
 
 @APP.route('/message/unreact', methods=['POST'])
@@ -385,7 +501,7 @@ def http_message_unreact():
     returns empty dictionary
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         message_unreact(data['token'], data['message_id'], data['react_id']))
 
 @APP.route('/message/pin', methods=['POST'])
@@ -394,7 +510,7 @@ def http_message_pin():
     Pins a message in a channel
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         message_pin(data['token'], data['message_id']))
 
 @APP.route('/message/unpin', methods=['POST'])
@@ -403,7 +519,7 @@ def http_message_unpin():
     Unpins a message in a channel
     '''
     data = request.get_json()
-    return jsonify(
+    return json_response(
         message_unpin(data['token'], data['message_id']))
 
 @APP.route('/clear', methods=['DELETE'])
@@ -411,7 +527,7 @@ def http_clear():
     ''' 
     Resets the internal data of the application to it's initial state
     '''
-    return jsonify(clear())
+    return json_response(clear())
 
 
 ###################
@@ -426,7 +542,7 @@ def http_standup_start():
 
     data = request.get_json()
 
-    return jsonify(
+    return json_response(
         standup_start(data['token'], int(data['channel_id']), int(data['length'])))
 
 @APP.route('/standup/active', methods=['GET'])
@@ -436,7 +552,7 @@ def http_standup_active():
     '''
 
     data = request.args
-    return jsonify(standup_active(data['token'], int(data['channel_id'])))
+    return json_response(standup_active(data['token'], int(data['channel_id'])))
 
 @APP.route('/standup/send', methods=['POST'])
 def http_standup_send():
@@ -446,10 +562,51 @@ def http_standup_send():
 
     data = request.get_json()
 
-    return jsonify(
+    return json_response(
         standup_send(data['token'], int(data['channel_id']), data['message']))
 
 
+###################
+# batch
+###################
+
+@APP.route('/batch', methods=['POST'])
+def http_batch():
+    '''
+    Runs a list of operations, each {"op": "channel/details", "args": {...}},
+    for one token in order and returns each one's result or error
+    '''
+    data = request.get_json()
+    return Response(run_batch(data['token'], data['operations']), mimetype='application/json')
+
+
+###################
+# locks
+###################
+
+@APP.route('/locks/stats', methods=['GET'])
+def http_locks_stats():
+    '''
+    How often the channel and user locks were taken and waited on
+    '''
+    return json_response(lock_stats())
+
+
+###################
+# scheduler
+###################
+
+@APP.route('/scheduler/stats', methods=['GET'])
+def http_scheduler_stats():
+    '''
+    Number of sendlater messages and standups waiting, and how late they were sent
+    '''
+    return json_response(scheduler.stats())
+
 
 if __name__ == "__main__":
+    # load saved data and start journaling changes, if FLOCKR_JOURNAL is set
+    persistence.start()
+    # send the sendlater messages and end the standups that came due while the server was down
+    scheduler.resume()
     APP.run(port=0)  # Do not edit this port
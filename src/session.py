@@ -0,0 +1,96 @@
+'''
+Session
+Resolves a token to its user with one lookup in the store's token index.
+Tokens whose signature has already been checked are kept in an LRU cache,
+and tokens that were rejected are cached too so stale tokens are turned
+away without any work.
+'''
+from collections import OrderedDict
+from threading import Lock
+import jwt
+from appsecret import JWT_SECRET
+from error import AccessError
+import store
+
+# how many tokens each cache remembers before dropping the least recently used
+CACHE_SIZE = 4096
+
+# token -> u_id, for tokens with a verified signature
+_verified = OrderedDict()
+# token -> None, for tokens that do not belong to a logged in user
+_rejected = OrderedDict()
+_lock = Lock()
+
+
+def _remember(cache, token, value=None):
+    '''
+    Add token to an LRU cache, dropping the oldest entry if it is full
+    '''
+    with _lock:
+        cache[token] = value
+        cache.move_to_end(token)
+        if len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def lookup(token):
+    '''
+    Get the user holding token, or None if it is not a valid token
+    '''
+    try:
+        if token in _rejected:
+            return None
+    except TypeError:
+        # unhashable tokens can never be valid
+        return None
+
+    user = store.find_user_by_token(token)
+    if user is None:
+        _remember(_rejected, token)
+        return None
+
+    with _lock:
+        if token in _verified:
+            _verified.move_to_end(token)
+            return user
+
+    # first time this token is used, check it was signed by us for this user
+    try:
+        u_id = jwt.decode(token, JWT_SECRET, algorithms='HS256')['user_id']
+    except (jwt.InvalidTokenError, KeyError, TypeError):
+        u_id = None
+    if u_id != user['u_id']:
+        _remember(_rejected, token)
+        return None
+
+    _remember(_verified, token, u_id)
+    return user
+
+
+def resolve(token):
+    '''
+    Get the user holding token
+    :raises AccessError: If the token does not correspond to a logged in user
+    '''
+    user = lookup(token)
+    if user is None:
+        raise AccessError("Token does not exist")
+    return user
+
+
+def forget(token):
+    '''
+    Drop any cached result for token, called whenever a token is issued or revoked
+    '''
+    with _lock:
+        _verified.pop(token, None)
+        _rejected.pop(token, None)
+
+
+def clear():
+    '''
+    Empty both caches
+    '''
+    with _lock:
+        _verified.clear()
+        _rejected.clear()
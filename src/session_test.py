@@ -0,0 +1,69 @@
+'''
+Session Test
+'''
+import pytest
+from auth import auth_register
+from error import AccessError
+from other import clear
+from utils import check_token, decode_token, generate_token, remove_token, get_user_from_token
+import session
+
+
+def test_session_resolve_valid_token():
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    # resolving twice should give the same user, the second time from the cache
+    assert session.resolve(authorised_user['token'])['u_id'] == authorised_user['u_id']
+    assert decode_token(authorised_user['token']) == authorised_user['u_id']
+    assert check_token(authorised_user['token']) is True
+    clear()
+
+
+def test_session_rejects_invalid_token():
+    clear()
+    auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    with pytest.raises(AccessError):
+        check_token("not_a_token")
+    # rejection is cached, but still an AccessError
+    with pytest.raises(AccessError):
+        decode_token("not_a_token")
+    assert get_user_from_token("not_a_token") is None
+    # unhashable tokens are rejected instead of crashing
+    with pytest.raises(AccessError):
+        check_token(["not", "a", "token"])
+    clear()
+
+
+def test_session_rejects_forged_token():
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    forged = authorised_user['token'][:-2] + "xx"
+    with pytest.raises(AccessError):
+        check_token(forged)
+    clear()
+
+
+def test_session_rejected_token_becomes_valid():
+    clear()
+    # token for the first user is rejected before they register
+    token = generate_token(0)
+    with pytest.raises(AccessError):
+        check_token(token)
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    assert authorised_user['token'] == token
+    assert check_token(token) is True
+    clear()
+
+
+def test_session_removed_token():
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    check_token(authorised_user['token'])
+    remove_token(authorised_user['token'])
+    with pytest.raises(AccessError):
+        check_token(authorised_user['token'])
+    clear()
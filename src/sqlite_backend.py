@@ -0,0 +1,333 @@
+'''
+SQLite Backend
+Keeps users, channels, memberships, messages and reacts in SQLite tables,
+as an alternative to the journal file. Every record from persistence.py is
+written straight into the tables, so there is no snapshot to take.
+
+Startup reads back users, channels and memberships, but not messages:
+each channel gets a TableSegment that reads its messages with the
+messages_channel index the first time they are needed, the same way
+channels restored from a binary snapshot do.
+
+The database runs in WAL mode so readers don't block the writer, and
+each thread gets its own connection from a small pool.
+'''
+from array import array
+import json
+import sqlite3
+from threading import Lock, local
+from message_record import Message
+
+# how hard SQLite syncs each commit for each journal fsync policy
+SYNCHRONOUS = {
+    'always': 'FULL',
+    'interval': 'NORMAL',
+    'never': 'OFF',
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    u_id INTEGER PRIMARY KEY,
+    token TEXT,
+    email TEXT NOT NULL,
+    handle TEXT NOT NULL,
+    user TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    is_public INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS memberships (
+    channel_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    is_owner INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    member TEXT NOT NULL,
+    PRIMARY KEY (channel_id, is_owner, u_id)
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id INTEGER NOT NULL UNIQUE,
+    channel_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    time_created INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    is_pinned INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages(channel_id, seq);
+
+CREATE TABLE IF NOT EXISTS reacts (
+    message_id INTEGER NOT NULL,
+    react_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (message_id, react_id, u_id)
+);
+
+CREATE TABLE IF NOT EXISTS react_flags (
+    message_id INTEGER NOT NULL,
+    react_id INTEGER NOT NULL,
+    is_this_user_reacted INTEGER NOT NULL,
+    PRIMARY KEY (message_id, react_id)
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY,
+    due REAL NOT NULL,
+    job TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS standups (
+    channel_id INTEGER PRIMARY KEY,
+    time_finish INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS standup_lines (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    line TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS standup_lines_channel ON standup_lines(channel_id, seq);
+
+-- nothing looks these up, they only slowed down writes
+DROP INDEX IF EXISTS users_token;
+DROP INDEX IF EXISTS users_email;
+DROP INDEX IF EXISTS users_handle;
+DROP INDEX IF EXISTS memberships_user;
+DROP INDEX IF EXISTS messages_channel_time;
+'''
+
+
+class TableSegment:
+    '''
+    The saved messages of one channel, still sitting in the messages table
+    '''
+    __slots__ = ('backend', 'channel_id')
+
+    def __init__(self, backend, channel_id):
+        self.backend = backend
+        self.channel_id = channel_id
+
+    def load(self):
+        '''
+        Read the messages, oldest first
+        '''
+        conn = self.backend.connection()
+        reacts = {}
+        for message_id, react_id, u_id in conn.execute(
+                '''SELECT message_id, react_id, u_id FROM reacts
+                   WHERE message_id IN (SELECT message_id FROM messages WHERE channel_id = ?)
+                   ORDER BY message_id, react_id, position''', (self.channel_id,)):
+            reacts.setdefault(message_id, {}).setdefault(react_id, [[], False])[0].append(u_id)
+        for message_id, react_id, reacted in conn.execute(
+                '''SELECT message_id, react_id, is_this_user_reacted FROM react_flags
+                   WHERE message_id IN (SELECT message_id FROM messages WHERE channel_id = ?)''',
+                (self.channel_id,)):
+            reacts.setdefault(message_id, {}).setdefault(react_id, [[], False])[1] = bool(reacted)
+
+        return [Message.from_tuple((u_id, message_id, time_created, text, bool(is_pinned), reacts.get(message_id)))
+                for u_id, message_id, time_created, text, is_pinned in conn.execute(
+                    '''SELECT u_id, message_id, time_created, message, is_pinned
+                       FROM messages WHERE channel_id = ? ORDER BY seq''', (self.channel_id,))]
+
+
+class SQLiteBackend:
+    '''
+    SQLite database at path
+    '''
+
+    def __init__(self, path, fsync='interval'):
+        self.path = path
+        self.synchronous = SYNCHRONOUS[fsync]
+        # records are written straight to the tables, so there is never a snapshot to take
+        self.length = 0
+        self._local = local()
+        self._connections = []
+        self._lock = Lock()
+
+    def connection(self):
+        '''
+        This thread's connection, opening it the first time
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def load(self):
+        '''
+        Read everything back in the shape persistence.restore_state expects.
+        Returns (state or None if the database is empty, list of records to replay)
+        '''
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        if conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0:
+            return None, []
+
+        users = [json.loads(row[0]) for row in conn.execute('SELECT user FROM users ORDER BY u_id')]
+
+        channels = {}
+        for channel_id, name, is_public in conn.execute(
+                'SELECT channel_id, name, is_public FROM channels ORDER BY channel_id'):
+            channels[channel_id] = {
+                'name': name,
+                'channel_id': channel_id,
+                'is_public': bool(is_public),
+                'owner_members': [],
+                'all_members': [],
+                'segment': TableSegment(self, channel_id),
+            }
+        for channel_id, is_owner, member in conn.execute(
+                'SELECT channel_id, is_owner, member FROM memberships ORDER BY channel_id, is_owner, position'):
+            key = 'owner_members' if is_owner else 'all_members'
+            channels[channel_id][key].append(json.loads(member))
+
+        row = conn.execute("SELECT value FROM counters WHERE name = 'message_count'").fetchone()
+        message_count = row[0] if row else 0
+        # which channel each message is in, to find it without loading every channel
+        message_channels = array('q', [-1]) * (message_count + 1)
+        for message_id, channel_id in conn.execute('SELECT message_id, channel_id FROM messages'):
+            message_channels[message_id] = channel_id
+
+        return {
+            'users': users,
+            'channels': [channels[channel_id] for channel_id in sorted(channels)],
+            'message_count': message_count,
+            'message_channels': message_channels,
+            'jobs': [json.loads(row[0]) for row in conn.execute('SELECT job FROM jobs ORDER BY due, job_id')],
+            'standup': self._load_standups(conn),
+        }, []
+
+    def _load_standups(self, conn):
+        standups = {}
+        for channel_id, time_finish in conn.execute('SELECT channel_id, time_finish FROM standups'):
+            standups[channel_id] = {'channel_id': channel_id, 'time_finish': time_finish, 'lines': [], 'length': 0}
+        for channel_id, line in conn.execute('SELECT channel_id, line FROM standup_lines ORDER BY seq'):
+            standups[channel_id]['lines'].append(line)
+            standups[channel_id]['length'] += len(line) + 1
+        return list(standups.values())
+
+    def open(self):
+        '''
+        Make sure the tables exist
+        '''
+        self.connection().executescript(SCHEMA)
+
+    def append(self, record):
+        '''
+        Write a record from persistence.py into the tables, in its own transaction
+        '''
+        conn = self.connection()
+        with conn:
+            getattr(self, '_write_' + record['op'])(conn, record)
+
+    def _write_user(self, conn, record):
+        user = record['user']
+        token = user['token'] if isinstance(user['token'], str) else None
+        conn.execute(
+            'INSERT OR REPLACE INTO users (u_id, token, email, handle, user) VALUES (?, ?, ?, ?, ?)',
+            (user['u_id'], token, user['email'], user['handle'], json.dumps(user)))
+
+    def _write_channel(self, conn, record):
+        channel = record['channel']
+        channel_id = channel['channel_id']
+        conn.execute('INSERT OR REPLACE INTO channels (channel_id, name, is_public) VALUES (?, ?, ?)',
+                     (channel_id, channel['name'], bool(channel['is_public'])))
+        conn.execute('DELETE FROM memberships WHERE channel_id = ?', (channel_id,))
+        rows = []
+        for is_owner, key in ((1, 'owner_members'), (0, 'all_members')):
+            for position, member in enumerate(channel[key]):
+                rows.append((channel_id, member['u_id'], is_owner, position, json.dumps(member)))
+        conn.executemany(
+            'INSERT OR REPLACE INTO memberships (channel_id, u_id, is_owner, position, member) VALUES (?, ?, ?, ?, ?)',
+            rows)
+
+    def _write_message(self, conn, record):
+        message = record['message']
+        message_id = message['message_id']
+        conn.execute(
+            '''INSERT INTO messages (message_id, channel_id, u_id, time_created, message, is_pinned)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(message_id) DO UPDATE SET message = excluded.message,
+                                                     is_pinned = excluded.is_pinned''',
+            (message_id, record['channel_id'], message['u_id'], message['time_created'],
+             message['message'], message['is_pinned']))
+        conn.execute('DELETE FROM reacts WHERE message_id = ?', (message_id,))
+        conn.execute('DELETE FROM react_flags WHERE message_id = ?', (message_id,))
+        for react in message['reacts']:
+            conn.executemany(
+                'INSERT INTO reacts (message_id, react_id, u_id, position) VALUES (?, ?, ?, ?)',
+                [(message_id, react['react_id'], u_id, position)
+                 for position, u_id in enumerate(react['u_ids'])])
+            if react['is_this_user_reacted']:
+                conn.execute(
+                    'INSERT INTO react_flags (message_id, react_id, is_this_user_reacted) VALUES (?, ?, 1)',
+                    (message_id, react['react_id']))
+        self._write_message_count(conn, record)
+
+    def _write_message_removed(self, conn, record):
+        for table in ('messages', 'reacts', 'react_flags'):
+            conn.execute(f'DELETE FROM {table} WHERE message_id = ?', (record['message_id'],))
+
+    def _write_message_count(self, conn, record):
+        conn.execute(
+            '''INSERT INTO counters (name, value) VALUES ('message_count', ?)
+               ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)''',
+            (record['message_count'],))
+
+    def _write_job(self, conn, record):
+        job = record['job']
+        conn.execute('INSERT OR REPLACE INTO jobs (job_id, due, job) VALUES (?, ?, ?)',
+                     (job['job_id'], job['due'], json.dumps(job)))
+
+    def _write_job_done(self, conn, record):
+        conn.execute('DELETE FROM jobs WHERE job_id = ?', (record['job_id'],))
+
+    def _write_standup(self, conn, record):
+        channel_id = record['channel_id']
+        conn.execute('DELETE FROM standups WHERE channel_id = ?', (channel_id,))
+        conn.execute('DELETE FROM standup_lines WHERE channel_id = ?', (channel_id,))
+        standup = record['standup']
+        if standup is not None:
+            conn.execute('INSERT INTO standups (channel_id, time_finish) VALUES (?, ?)',
+                         (channel_id, standup['time_finish']))
+            conn.executemany('INSERT INTO standup_lines (channel_id, line) VALUES (?, ?)',
+                             [(channel_id, line) for line in standup['lines']])
+
+    def _write_standup_line(self, conn, record):
+        conn.execute('INSERT INTO standup_lines (channel_id, line) VALUES (?, ?)',
+                     (record['channel_id'], record['line']))
+
+    def _write_clear(self, conn, record):
+        for table in ('users', 'channels', 'memberships', 'messages', 'reacts', 'react_flags',
+                      'counters', 'jobs', 'standups', 'standup_lines'):
+            conn.execute(f'DELETE FROM {table}')
+
+    def snapshot(self, get_state):
+        '''
+        Nothing to do, the tables are always up to date
+        '''
+
+    def close(self):
+        '''
+        Close every pooled connection
+        '''
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = local()
@@ -2,15 +2,27 @@
 standup functionality.
 once standups are finished, all messages sent to standup/send are packaged together in a single messaged
 and posted by the user who begun the standup/
+
+data["standup"] maps each channel_id to the standup running in it, so
+every channel can have its own standup at the same time:
+    {"channel_id", "time_finish", "lines": ["handle: message", ...], "length"}
 '''
 from global_dic import data
-from threading import Timer
+import config
+import store
+import persistence
+import events
+import versions
+import scheduler
 from datetime import datetime
 from error import InputError, AccessError
-from utils import check_token, decode_token, get_current_timestamp
+from utils import check_token, decode_token, get_current_timestamp, get_user_from_token
 from channel_helper import check_channel, check_member_channel
+from message_record import Message
+from concurrency import reads_channel, writes_channel, next_message_id
 
 
+@reads_channel
 def standup_active(token, channel_id):
     '''
     Function which checks if standup is active
@@ -24,53 +36,47 @@ def standup_active(token, channel_id):
         raise InputError("Input error as channel_id is not valid")
 
     # check if standup is active already
-    # get standup from dict and check channel_id
-
-    is_active = False
-    time_finish = 0
-    for channel in data["standup"]:
-        if channel_id == channel["channel_id"]:
-            time_finish = channel["time_finish"]
-    if time_finish - get_current_timestamp() > 0:
-        is_active = True
-
-    if is_active:
-        return {'is_active': is_active, 'time_finish': time_finish}
-    else:
-        data['standup'] = []
-        return {'is_active': is_active, 'time_finish': None}
-
-def standup_end(token, channel_id):
-    '''
-    sends the messages that have been accumulated
-    '''
+    # a standup that finished stays in the map until standup_end posts it
+    standup = data["standup"].get(channel_id)
+    if standup is not None and standup["time_finish"] - get_current_timestamp() > 0:
+        return {'is_active': True, 'time_finish': standup["time_finish"]}
+    return {'is_active': False, 'time_finish': None}
 
-    new_message = ''
-    for i in range(0, len(data['standup'][0]['messages'])):
-        new_message += data['standup'][channel_id]['messages'][i]['handle'] + ': ' + data['standup'][channel_id]['messages'][i]['message'] + '\n' 
- 
-    data["message_count"] += 1
 
+def post_standup(token, standup):
+    '''
+    Remove a standup and send the messages that have been accumulated as one message
+    '''
+    # before the standup is removed, so its lines are kept if the token is no good
     u_id = decode_token(token)
+    channel_id = standup["channel_id"]
+    del data["standup"][channel_id]
+    persistence.record_standup(channel_id)
+
+    new_message = ''.join(line + '\n' for line in standup["lines"])
 
     #Append message to dictionary
-    for channel in data["channels"]:
-        if channel["channel_id"] == channel_id:
-            channel["messages"].append({
-                'u_id': u_id,
-                'message_id': data["message_count"],
-                'time_created': get_current_timestamp(),
-                'message': new_message,
-                'reacts': [{
-                    'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False
-                }],
-                'is_pinned': False
-            })
-    
-    # print(f'THIS IS GLOBAL DATA {data}')
+    channel = store.find_channel(channel_id)
+    message = Message(u_id, next_message_id(), get_current_timestamp(), new_message)
+    store.append_message(channel, message)
+    persistence.record_message(channel, message)
+    events.publish(channel_id, 'send', message=message)
+    versions.bump(('messages', channel_id))
 
+
+@writes_channel
+def standup_end(token, channel_id, time_finish=None):
+    '''
+    sends the messages that have been accumulated, if the standup finishing at
+    time_finish is still the one running in the channel
+    '''
+    standup = data["standup"].get(channel_id)
+    if standup is None or (time_finish is not None and standup["time_finish"] != time_finish):
+        # already posted, or the channel was cleared
+        return
+    post_standup(token, standup)
+
+@writes_channel
 def standup_start(token, channel_id, length):
     '''
     Function which starts standup
@@ -89,22 +95,29 @@ def standup_start(token, channel_id, length):
     if standup_active(token, channel_id)['is_active'] == True:
         raise InputError("Input error as standup is already active")
 
+    # a finished standup that hasn't been posted yet is posted first
+    finished = data["standup"].get(channel_id)
+    if finished is not None:
+        post_standup(token, finished)
+
     print(f'TIME START: {get_current_timestamp()}')
 
     time_finish = int(get_current_timestamp() + length)
-    data["standup"].append({
+    data["standup"][channel_id] = {
         "channel_id": channel_id,
-        "messages": [],
         "time_finish": time_finish,
-    })
-    standup = Timer(length, standup_end, args=[token, channel_id])
-    standup.start()
+        "lines": [],
+        "length": 0,
+    }
+    persistence.record_standup(channel_id)
+    scheduler.schedule_job('standup_end', datetime.now().timestamp() + length, token, channel_id, time_finish)
 
     
     print(f'TIME FINISH: {time_finish}')
     return {'time_finish': time_finish}
 
 
+@writes_channel
 def standup_send(token, channel_id, message):
     '''
     Function which sends message during standup
@@ -130,12 +143,18 @@ def standup_send(token, channel_id, message):
     if check_standup['is_active'] == False:
         raise InputError("Input error as standup is not active")
 
-    for user in data['users']:
-        if user['token'] == token:
-            handle = user['handle']
+    handle = get_user_from_token(token)['handle']
+    line = f'{handle}: {message}'
+
+    # the collated message is kept under config.STANDUP_MAX_LENGTH characters
+    standup = data["standup"][channel_id]
+    if standup["length"] + len(line) + 1 > config.STANDUP_MAX_LENGTH:
+        raise InputError("Input error as the standup is full")
+    standup["lines"].append(line)
+    standup["length"] += len(line) + 1
+    persistence.record_standup_line(channel_id, line)
+
+    return {}
 
-    for channel in data["standup"]:
-        if channel["channel_id"] == channel_id:
-            channel["messages"].append({'message': message, 'handle': handle})
 
-    return {}
\ No newline at end of file
+scheduler.register('standup_end', standup_end)
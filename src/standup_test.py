@@ -3,13 +3,14 @@ testing standup functions
 '''
 from time import sleep
 import pytest
-from standup import standup_start, standup_active, standup_send
+from standup import standup_start, standup_active, standup_send, standup_end
 from error import AccessError, InputError
 from other import clear
 from auth import auth_login, auth_register
 from channel import channel_invite, channel_messages
 from channels import channels_create
 from message import message_send
+import config
 '''
 standup_start tests
 '''
@@ -277,9 +278,73 @@ def test_send_message_expected():
     standup_send(authorised_user['token'], channel['channel_id'],
                  "testing standup")
 
-    sleep(1)
+    # the standup is only posted once it finishes
+    sleep(3)
 
     check_messages = channel_messages(authorised_user['token'],
                                       channel['channel_id'], 0)
 
-    assert len(check_messages['messages']) == 1
\ No newline at end of file
+    assert len(check_messages['messages']) == 1
+
+
+def test_standup_end_bad_token_keeps_lines():
+    '''
+    test that a standup whose token can't be used is not thrown away
+    '''
+    clear()
+
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+    standup_start(authorised_user['token'], channel['channel_id'], 60)
+    standup_send(authorised_user['token'], channel['channel_id'], "kept")
+
+    with pytest.raises(AccessError):
+        standup_end("not a token", channel['channel_id'])
+    assert standup_active(authorised_user['token'], channel['channel_id'])['is_active']
+
+    standup_end(authorised_user['token'], channel['channel_id'])
+    messages = channel_messages(authorised_user['token'], channel['channel_id'], 0)['messages']
+    assert [message['message'] for message in messages] == ["philgeevlad: kept\n"]
+
+
+def test_standups_in_many_channels():
+    '''
+    channels run their own standups, and checking one doesn't end another
+    '''
+    clear()
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    channels = [channels_create(authorised_user['token'], f"channel{i}", True)['channel_id']
+                for i in range(3)]
+    standup_start(authorised_user['token'], channels[0], 2)
+    standup_start(authorised_user['token'], channels[1], 2)
+
+    assert standup_active(authorised_user['token'], channels[2])['is_active'] == False
+    assert standup_active(authorised_user['token'], channels[0])['is_active'] == True
+    standup_send(authorised_user['token'], channels[0], "first")
+    standup_send(authorised_user['token'], channels[0], "second")
+    standup_send(authorised_user['token'], channels[1], "other")
+
+    sleep(3)
+    handle = "philgeevlad"
+    first = channel_messages(authorised_user['token'], channels[0], 0)['messages']
+    assert [message['message'] for message in first] == [f"{handle}: first\n{handle}: second\n"]
+    other = channel_messages(authorised_user['token'], channels[1], 0)['messages']
+    assert [message['message'] for message in other] == [f"{handle}: other\n"]
+    assert channel_messages(authorised_user['token'], channels[2], 0)['messages'] == []
+
+
+def test_standup_buffer_full(monkeypatch):
+    '''
+    inputerror once the collated standup message would be too long
+    '''
+    clear()
+    monkeypatch.setattr(config, 'STANDUP_MAX_LENGTH', 50)
+    authorised_user = auth_register("validEmail@gmail.com", "valid_password",
+                                    "Philgee", "Vlad")
+    channel = channels_create(authorised_user['token'], "new_channel", True)
+    standup_start(authorised_user['token'], channel['channel_id'], 1)
+    standup_send(authorised_user['token'], channel['channel_id'], "x" * 30)
+    with pytest.raises(InputError):
+        standup_send(authorised_user['token'], channel['channel_id'], "x" * 30)
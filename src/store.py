@@ -0,0 +1,394 @@
+'''
+Store
+Secondary indexes kept next to the lists in global_dic.data,
+so that users and channels can be found without looping through every entry
+'''
+from array import array
+from collections import OrderedDict
+from threading import Lock
+import config
+from global_dic import data
+import history as channel_history
+import search_index
+
+# u_id -> user
+users_by_id = {}
+# token -> user
+users_by_token = {}
+# email -> user
+users_by_email = {}
+# handle -> user
+users_by_handle = {}
+# u_id -> user, only for users that are flockr owners
+flockr_owners = {}
+# channel_id -> channel
+channels_by_id = {}
+# channel_ids of every public channel
+public_channels = set()
+# u_id -> set of channel_ids the user is a member of
+user_channels = {}
+# message_id -> (channel, segment of channel["messages"] holding it), only for loaded channels
+messages_by_id = {}
+# message_id -> (channel_id, message_id of the newest message older than it then, or None)
+# for the config.REMOVED_CURSORS most recently removed messages, oldest first,
+# so a page cursor on a removed message still has a place
+removed_messages = OrderedDict()
+# channel_id -> snapshot segment holding the messages of a channel not loaded yet
+unloaded_histories = {}
+# channel_id of every message_id saved in the last snapshot, -1 for none.
+# Only used to find messages in channels that are not loaded yet
+saved_message_channels = array('q')
+# held while a channel's messages are loaded
+_history_lock = Lock()
+# held while the public channel and membership sets are changed or read
+_membership_lock = Lock()
+# held while removed_messages is changed or read, messages are removed from
+# different channels at once
+_removed_lock = Lock()
+
+
+def _lookup(index, key):
+    '''
+    Look up key in index, returning None for missing or unhashable keys
+    '''
+    try:
+        return index.get(key)
+    except TypeError:
+        return None
+
+
+def insert_user(user):
+    '''
+    Add a new user to data and to every user index
+    '''
+    data["users"].append(user)
+    users_by_id[user["u_id"]] = user
+    users_by_token[user["token"]] = user
+    users_by_email[user["email"]] = user
+    users_by_handle[user["handle"]] = user
+    if user["is_flockr_owner"]:
+        flockr_owners[user["u_id"]] = user
+
+
+def find_user(u_id):
+    '''
+    Get the user with the given u_id, or None
+    '''
+    return _lookup(users_by_id, u_id)
+
+
+def find_user_by_token(token):
+    '''
+    Get the user currently holding token, or None
+    '''
+    return _lookup(users_by_token, token)
+
+
+def find_user_by_email(email):
+    '''
+    Get the user registered with email, or None
+    '''
+    return _lookup(users_by_email, email)
+
+
+def find_user_by_handle(handle):
+    '''
+    Get the user using handle, or None
+    '''
+    return _lookup(users_by_handle, handle)
+
+
+def update_user_token(user, token, valid=True):
+    '''
+    Change a user's token. Tokens which are no longer valid are not indexed
+    '''
+    if users_by_token.get(user["token"]) is user:
+        del users_by_token[user["token"]]
+    user["token"] = token
+    if valid:
+        users_by_token[token] = user
+
+
+def update_user_email(user, email):
+    '''
+    Change a user's email and keep the email index in sync
+    '''
+    if users_by_email.get(user["email"]) is user:
+        del users_by_email[user["email"]]
+    user["email"] = email
+    users_by_email[email] = user
+
+
+def update_user_handle(user, handle):
+    '''
+    Change a user's handle and keep the handle index in sync
+    '''
+    if users_by_handle.get(user["handle"]) is user:
+        del users_by_handle[user["handle"]]
+    user["handle"] = handle
+    users_by_handle[handle] = user
+
+
+def update_flockr_owner(user, is_flockr_owner):
+    '''
+    Change a user's global permission and keep the owner index in sync
+    '''
+    user["is_flockr_owner"] = is_flockr_owner
+    if is_flockr_owner:
+        flockr_owners[user["u_id"]] = user
+    else:
+        flockr_owners.pop(user["u_id"], None)
+
+
+def list_flockr_owners():
+    '''
+    List every flockr owner ordered by u_id
+    '''
+    return [flockr_owners[u_id] for u_id in sorted(flockr_owners)]
+
+
+def insert_channel(channel):
+    '''
+    Add a new channel to data and to the channel index
+    '''
+    data["channels"].append(channel)
+    channels_by_id[channel["channel_id"]] = channel
+    if channel["is_public"] == True:
+        with _membership_lock:
+            public_channels.add(channel["channel_id"])
+    for u_id in channel["member_ids"]:
+        add_membership(u_id, channel["channel_id"])
+
+
+def find_channel(channel_id):
+    '''
+    Get the channel with the given channel_id, or None
+    '''
+    return _lookup(channels_by_id, channel_id)
+
+
+def add_membership(u_id, channel_id):
+    '''
+    Record that a user is a member of a channel
+    '''
+    with _membership_lock:
+        user_channels.setdefault(u_id, set()).add(channel_id)
+
+
+def remove_membership(u_id, channel_id):
+    '''
+    Record that a user is no longer a member of a channel
+    '''
+    with _membership_lock:
+        user_channels.get(u_id, set()).discard(channel_id)
+
+
+def list_user_channels(u_id):
+    '''
+    List the channels a user is a member of, ordered by channel_id
+    '''
+    with _membership_lock:
+        channel_ids = sorted(user_channels.get(u_id, ()))
+    return [channels_by_id[channel_id] for channel_id in channel_ids]
+
+
+def list_visible_channels(u_id):
+    '''
+    List every public channel and every private channel the user is a member of,
+    ordered by channel_id
+    '''
+    with _membership_lock:
+        visible = sorted(public_channels.union(user_channels.get(u_id, ())))
+    return [channels_by_id[channel_id] for channel_id in visible]
+
+
+def defer_history(channel, segment):
+    '''
+    Leave a channel's messages in a snapshot segment until they are first needed
+    '''
+    unloaded_histories[channel["channel_id"]] = segment
+
+
+def restore_message_channels(message_channels):
+    '''
+    Use the channel_id of every message_id saved in a snapshot to find
+    messages in channels that are not loaded yet
+    '''
+    global saved_message_channels
+    saved_message_channels = message_channels
+
+
+def history(channel):
+    '''
+    Get the ChannelHistory of a channel, oldest message first,
+    loading them from the snapshot the first time they are needed
+    '''
+    if channel["channel_id"] in unloaded_histories:
+        with _history_lock:
+            segment = unloaded_histories.get(channel["channel_id"])
+            if segment is not None:
+                loaded = segment.load()
+                # built on its own and then swapped in, as the caller may be
+                # holding the channel's lock for reading
+                messages = channel_history.ChannelHistory(loaded, channel["messages"].lock)
+                for message_id, located in messages.locations():
+                    messages_by_id[message_id] = (channel, located)
+                for message in loaded:
+                    search_index.add_message(message.message_id, message.message)
+                channel["messages"] = messages
+                del unloaded_histories[channel["channel_id"]]
+    return channel["messages"]
+
+
+def saved_history(channel):
+    '''
+    The snapshot segment of a channel that is not loaded yet,
+    otherwise its list of messages
+    '''
+    with _history_lock:
+        return unloaded_histories.get(channel["channel_id"], channel["messages"])
+
+
+def message_channels():
+    '''
+    channel_id of every message_id up to data["message_count"], -1 for none,
+    without loading any channel
+    '''
+    # copied in one go, messages can be sent while this runs, and before
+    # reading message_count, which has already counted them
+    located = messages_by_id.copy().items()
+    result = array('q', saved_message_channels)
+    result.extend([-1] * (data["message_count"] + 1 - len(result)))
+    for message_id, (channel, _) in located:
+        result[message_id] = channel["channel_id"]
+    return result
+
+
+def append_message(channel, message):
+    '''
+    Add a message to the end of a channel and index where it was put
+    '''
+    messages_by_id[message.message_id] = (channel, history(channel).append(message))
+    search_index.add_message(message.message_id, message.message)
+
+
+def locate_message(message_id):
+    '''
+    Get (channel, history segment) of the message with message_id, or None.
+    Loads the message's channel if it has not been loaded yet.
+    '''
+    location = _lookup(messages_by_id, message_id)
+    if location is None and isinstance(message_id, int) and 0 <= message_id < len(saved_message_channels):
+        channel = channels_by_id.get(saved_message_channels[message_id])
+        if channel is not None and channel["channel_id"] in unloaded_histories:
+            history(channel)
+            location = messages_by_id.get(message_id)
+    return location
+
+
+def find_message(message_id):
+    '''
+    Get the message with message_id, or None
+    '''
+    location = locate_message(message_id)
+    if location is None:
+        return None
+    channel, segment = location
+    return channel["messages"].get(segment, message_id)
+
+
+def delete_message(message_id):
+    '''
+    Remove a message from its channel, leaving a tombstone in its history
+    '''
+    channel, segment = locate_message(message_id)
+    text = channel["messages"].get(segment, message_id).message
+    older = channel["messages"].previous_id(segment, message_id)
+    with _removed_lock:
+        removed_messages[message_id] = (channel["channel_id"], older)
+        while len(removed_messages) > max(0, config.REMOVED_CURSORS):
+            removed_messages.popitem(last=False)
+    del messages_by_id[message_id]
+    channel["messages"].remove(segment, message_id)
+    search_index.remove_message(message_id, text)
+
+
+def locate_cursor(message_id):
+    '''
+    (channel_id, message_id) of the message, or if it was removed, of the
+    newest message older than it that is still there, None for that
+    message_id if there is none. None if the message was never sent, or
+    was removed too long ago to still be known
+    '''
+    location = locate_message(message_id)
+    if location is not None:
+        return location[0]["channel_id"], message_id
+    with _removed_lock:
+        removed = _lookup(removed_messages, message_id)
+        if removed is None:
+            return None
+        channel_id, older = removed
+        # the message it was after may have been removed since, and so on
+        while older is not None and locate_message(older) is None:
+            if older not in removed_messages:
+                # forgotten, there is no telling where it was
+                return None
+            older = removed_messages[older][1]
+    return channel_id, older
+
+
+def update_message_text(message_id, text):
+    '''
+    Change the text of a message and re-index it for search
+    '''
+    channel, segment = locate_message(message_id)
+    message = channel["messages"].get(segment, message_id)
+    old_text = message.message
+    message.message = text
+    message.encoded = None
+    channel["messages"].replace(segment, message)
+    search_index.update_message(message_id, old_text, text)
+
+
+def replace_message(message):
+    '''
+    Put a new version of an existing message in its place
+    '''
+    channel, segment = locate_message(message.message_id)
+    old_text = channel["messages"].get(segment, message.message_id).message
+    message.encoded = None
+    channel["messages"].replace(segment, message)
+    search_index.update_message(message.message_id, old_text, message.message)
+
+
+def message_changed(message):
+    '''
+    Store a message again after it was changed in place, such as by a react or pin
+    '''
+    channel, segment = locate_message(message.message_id)
+    # its cached JSON is out of date
+    message.encoded = None
+    channel["messages"].replace(segment, message)
+
+
+def clear():
+    '''
+    Empty the users and channels in data and every index
+    '''
+    data["users"].clear()
+    data["channels"].clear()
+    data["message_count"] = 0
+    users_by_id.clear()
+    users_by_token.clear()
+    users_by_email.clear()
+    users_by_handle.clear()
+    flockr_owners.clear()
+    channels_by_id.clear()
+    public_channels.clear()
+    user_channels.clear()
+    messages_by_id.clear()
+    removed_messages.clear()
+    unloaded_histories.clear()
+    restore_message_channels(array('q'))
+    channel_history.clear()
+    search_index.clear()
@@ -1,4 +1,7 @@
 from global_dic import data
+import store
+import persistence
+import versions
 from auth import auth_login, auth_register, auth_register
 from error import InputError
 import uuid
@@ -7,18 +10,14 @@ from utils import check_token, random_string, get_user_from_token
 import urllib.request
 from PIL import Image
 from flask import request as Flask_request
+from concurrency import writes_users, writes_everything
 
 def valid_u_id_check(u_id):
     '''
     a function to raise input errors for invalid users
     '''
-    # looping to see if u_id is a valid user, if not, input error
-    found = False
-    for user in data['users']:
-        if u_id == user['u_id']:
-            found = True
-            break
-    if found == False:
+    # looking up u_id to see if it is a valid user, if not, input error
+    if store.find_user(u_id) is None:
         raise InputError("Invalid u_id")
 
 
@@ -31,24 +30,24 @@ def user_profile(token, u_id):
     valid_u_id_check(u_id)
     check_token(token)
 
-    # looping until we match the u_id in the global data structure
-    for user in data['users']:
-        if u_id == user['u_id']:
-            # returning the required data
-            return {
-                'user': {
-                    'u_id': user['u_id'],
-                    'email': user['email'],
-                    'name_first': user['first_name'],
-                    'name_last': user['last_name'],
-                    'handle_str': user['handle'],
-                    'profile_img_url': user['profile_img_url']
-                 },
-            }
+    # matching the u_id in the global data structure
+    user = store.find_user(u_id)
+    # returning the required data
+    return {
+        'user': {
+            'u_id': user['u_id'],
+            'email': user['email'],
+            'name_first': user['first_name'],
+            'name_last': user['last_name'],
+            'handle_str': user['handle'],
+            'profile_img_url': user['profile_img_url']
+         },
+    }
 
     
 
 
+@writes_everything
 def user_profile_setname(token, name_first, name_last):
     '''
     Update the authorised user's first and last name
@@ -62,16 +61,14 @@ def user_profile_setname(token, name_first, name_last):
     if len(name_last) < 1 or len(name_last) > 50:
         raise InputError
     
-    # looping until we reach the user with corresponding token
+    # finding the user with corresponding token
     # and changing their respective first/last name
-    for user in data['users']:
-        if token == user['token']:
-            user['first_name'] = name_first
-            user['last_name'] = name_last
-            break
+    user = get_user_from_token(token)
+    user['first_name'] = name_first
+    user['last_name'] = name_last
 
     # changing user name in the channels they are part of
-    for channel in data['channels']:
+    for channel in store.list_user_channels(user['u_id']):
         for member in channel['all_members']:
             if user['u_id'] == member['u_id']:
                 member['name_first'] = name_first
@@ -80,11 +77,15 @@ def user_profile_setname(token, name_first, name_last):
             if user['u_id'] == member['u_id']:
                 member['name_first'] = name_first
                 member['name_last'] = name_last
-    
+        persistence.record_channel(channel)
+        versions.bump(('channel', channel['channel_id']))
+    persistence.record_user(user)
+    versions.bump(('user', user['u_id']), 'users')
 
     return {
     }
 
+@writes_users
 def user_profile_setemail(token, email):
     '''
     Update the authorised user's email address
@@ -102,19 +103,20 @@ def user_profile_setemail(token, email):
         raise InputError
 
     # checking if email is already being used
-    for i in range(len(data["users"])):
-        if (data["users"][i]["email"] == email):
-            raise InputError
+    if store.find_user_by_email(email) is not None:
+        raise InputError
 
-    # looping until we reach the user with corresponding token
+    # finding the user with corresponding token
     # and changing their email
-    for user in data['users']:
-        if token == user['token']:
-            user['email'] = email
+    user = get_user_from_token(token)
+    store.update_user_email(user, email)
+    persistence.record_user(user)
+    versions.bump(('user', user['u_id']), 'users')
 
     return {
     }
 
+@writes_users
 def user_profile_sethandle(token, handle_str):
     '''
     Update the authorised user's handle (i.e. display name)
@@ -126,15 +128,15 @@ def user_profile_sethandle(token, handle_str):
         raise InputError
 
     # checking if handle_str is already being used
-    for i in range(len(data["users"])):
-        if (data["users"][i]["handle"] == handle_str):
-            raise InputError
+    if store.find_user_by_handle(handle_str) is not None:
+        raise InputError
 
-    # looping until we reach the user with corresponding token
+    # finding the user with corresponding token
     # and changing their respective handle_str
-    for user in data['users']:
-        if token == user['token']:
-            user['handle'] = handle_str
+    user = get_user_from_token(token)
+    store.update_user_handle(user, handle_str)
+    persistence.record_user(user)
+    versions.bump(('user', user['u_id']), 'users')
 
     return {
     }
@@ -176,21 +178,34 @@ def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end):
     cropped_image.save(file_name) 
 
     # storing cropped image in global data variable as accesible url
+    set_profile_img_url(token, f'{Flask_request.url_root}images/{file_name}')
+
+    return {}
+
+
+@writes_everything
+def set_profile_img_url(token, img_url):
+    '''
+    Change the user's image url, and in the channels they are part of.
+    Kept apart from user_profile_uploadphoto so the image is downloaded without holding any lock
+    '''
     user = get_user_from_token(token)
 
     # changing global variable user image
-    user['profile_img_url'] = f'{Flask_request.url_root}images/{file_name}'
+    user['profile_img_url'] = img_url
 
     # changing user profile image in the channels they are part of
-    for channel in data['channels']:
+    for channel in store.list_user_channels(user['u_id']):
         for member in channel['all_members']:
             if user['u_id'] == member['u_id']:
-                member['profile_img_url'] = f'{Flask_request.url_root}images/{file_name}'
+                member['profile_img_url'] = img_url
         for member in channel['owner_members']:
             if user['u_id'] == member['u_id']:
-                member['profile_img_url'] = f'{Flask_request.url_root}images/{file_name}'
-    
-    return {}
+                member['profile_img_url'] = img_url
+        persistence.record_channel(channel)
+        versions.bump(('channel', channel['channel_id']))
+    persistence.record_user(user)
+    versions.bump(('user', user['u_id']), 'users')
 
 
   
\ No newline at end of file
@@ -2,7 +2,9 @@ from datetime import datetime
 import jwt
 from appsecret import JWT_SECRET
 from error import AccessError
-from global_dic import data
+import store
+import session
+import persistence
 import requests
 import string
 import random
@@ -30,9 +32,11 @@ def generate_token(user_id):
 
 def decode_token(token):
     '''
-    decode_token
+    Returns the user id of the user holding token.
+    The token is resolved through the session cache, so its signature
+    is only checked the first time it is used.
     '''
-    return jwt.decode(token, JWT_SECRET, algorithms='HS256')['user_id']
+    return session.resolve(token)['u_id']
 
 
 def check_token(token):
@@ -47,29 +51,23 @@ def check_token(token):
     :rtype: int
     '''
 
-    for user in data["users"]:
-        if user["token"] == token:
-            return True
-
-    #Token does not exist
-    raise AccessError("Token does not exist")
+    session.resolve(token)
+    return True
 
         
 
 def check_user_in_channel(u_id):
-    for user in data['users']:
-        if user['u_id'] == u_id:
-            return True
-    return False
+    return store.find_user(u_id) is not None
 
 
 def remove_token(token):
-    global data
-    for i in range(len(data["users"])):
-        #Find token
-        if (data["users"][i]["token"] == token):
-            data["users"][i]["token"] = INVALID_TOKEN
-            return True
+    #Find token
+    user = store.find_user_by_token(token)
+    if user is not None:
+        store.update_user_token(user, INVALID_TOKEN, valid=False)
+        session.forget(token)
+        persistence.record_user(user)
+        return True
     #Token does not exist
     raise AccessError("Token does not exist")
 
@@ -218,9 +216,7 @@ def random_string(length):
     return random_string
 
 def get_user_from_token(token):
-    for user in data['users']:
-        if user['token'] == token:
-            return user
+    return session.lookup(token)
 
 # Generate a code consisting of a mitxture upper/lower/integers
 def generate_secret_code(size=12, chars = string.ascii_uppercase + string.ascii_lowercase + string.digits):
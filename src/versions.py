@@ -0,0 +1,72 @@
+'''
+Versions
+Counters that go up whenever something a GET response is built from
+changes. A response's ETag is made of the counters it depends on, so a
+client sending that ETag back in If-None-Match can be answered with 304
+Not Modified without building the response again.
+
+The counters are
+    ('channel', channel_id)     name, members and owners of a channel
+    ('messages', channel_id)    messages of a channel
+    ('user', u_id)              a user's profile
+    ('member', u_id)            the channels a user is a member of
+    'users'                     every user's profile, and who is registered
+    'channels'                  which channels there are
+
+They start again from 0 in every process, so ETags also carry an epoch
+that changes on every start and clear.
+'''
+import secrets
+from threading import Lock
+from zlib import crc32
+
+# held while counters are bumped
+_lock = Lock()
+# key -> version
+_versions = {}
+_epoch = secrets.token_hex(4)
+
+
+def bump(*keys):
+    '''
+    Count a change to everything described by keys
+    '''
+    with _lock:
+        for key in keys:
+            _versions[key] = _versions.get(key, 0) + 1
+
+
+def version(key):
+    '''
+    Current version of key, 0 if it has never changed
+    '''
+    return _versions.get(key, 0)
+
+
+def stamp(key):
+    '''
+    (epoch, version) of key, for caches of things built from it. Differs
+    after every change and every clear
+    '''
+    return _epoch, version(key)
+
+
+def etag(keys, u_id, args=()):
+    '''
+    ETag of a response to u_id built from keys and the request's args.
+    Taken before the response is built, so a change made while it is
+    being built gives the next request a new tag
+    '''
+    query = '&'.join(f'{name}={value}' for name, value in sorted(args) if name != 'token')
+    parts = [_epoch, str(u_id)] + [str(version(key)) for key in keys]
+    return '-'.join(parts) + f'-{crc32(query.encode()):08x}'
+
+
+def clear():
+    '''
+    Forget every counter, tags handed out before no longer match
+    '''
+    global _epoch
+    with _lock:
+        _versions.clear()
+        _epoch = secrets.token_hex(4)
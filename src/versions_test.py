@@ -0,0 +1,51 @@
+'''
+Versions Test
+'''
+from auth import auth_register
+from channel import channel_join, channel_leave
+from channels import channels_create
+from message import message_send
+from other import clear
+import versions
+
+
+def test_etag_follows_versions():
+    clear()
+    tag = versions.etag(['users', ('member', 1)], 1, [('token', 'x'), ('start', '0')])
+    # the token doesn't matter, the other args and the user do
+    assert versions.etag(['users', ('member', 1)], 1, [('start', '0'), ('token', 'y')]) == tag
+    assert versions.etag(['users', ('member', 1)], 1, [('start', '50')]) != tag
+    assert versions.etag(['users', ('member', 1)], 2, [('start', '0')]) != tag
+    versions.bump(('member', 1))
+    assert versions.etag(['users', ('member', 1)], 1, [('start', '0')]) != tag
+    bumped = versions.etag(['users', ('member', 1)], 1, [('start', '0')])
+    # clearing starts a new epoch, so no old tag comes back
+    clear()
+    versions.bump(('member', 1))
+    assert versions.etag(['users', ('member', 1)], 1, [('start', '0')]) != bumped
+    clear()
+
+
+def test_changes_bump_versions():
+    clear()
+    owner = auth_register("validEmail@gmail.com", "valid_password", "Philgee", "Vlad")
+    assert versions.version('users') == 1
+    member = auth_register("validEmail2@gmail.com", "valid_password_2", "Jason", "Henry")
+    channel_id = channels_create(owner['token'], "new_channel", True)['channel_id']
+    assert versions.version('channels') == 1
+    channel = versions.version(('channel', channel_id))
+    member_channels = versions.version(('member', member['u_id']))
+
+    message_send(owner['token'], channel_id, "hello")
+    assert versions.version(('messages', channel_id)) == 1
+    assert versions.version(('channel', channel_id)) == channel
+
+    channel_join(member['token'], channel_id)
+    assert versions.version(('channel', channel_id)) == channel + 1
+    assert versions.version(('member', member['u_id'])) == member_channels + 1
+    # joining again changes nothing
+    channel_join(member['token'], channel_id)
+    assert versions.version(('channel', channel_id)) == channel + 1
+    channel_leave(member['token'], channel_id)
+    assert versions.version(('member', member['u_id'])) == member_channels + 2
+    clear()
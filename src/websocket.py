@@ -0,0 +1,146 @@
+'''
+WebSocket
+The parts of RFC 6455 the event gateway needs: the opening handshake,
+building frames and reading the frames a client sends.
+
+Frames sent by the server are not masked, so an event's frame is the same
+for every connection and is built once (see event_frame).
+'''
+import asyncio
+from base64 import b64encode
+from hashlib import sha1
+
+# appended to the client's key to make the accept key (RFC 6455 section 1.3)
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# close codes
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+# largest frame payload accepted from a client, clients only send control frames
+MAX_PAYLOAD = 64 * 1024
+
+
+class ProtocolError(Exception):
+    '''
+    Frame that breaks the protocol, the connection is closed with code
+    '''
+
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+
+
+def is_upgrade(headers):
+    '''
+    Whether a request asks to switch the connection to a WebSocket
+    '''
+    return headers.get('upgrade', '').lower() == 'websocket' and \
+        'upgrade' in headers.get('connection', '').lower()
+
+
+def accept_key(key):
+    '''
+    Sec-WebSocket-Accept for a Sec-WebSocket-Key
+    '''
+    return b64encode(sha1((key + GUID).encode()).digest()).decode()
+
+
+def handshake_response(key):
+    '''
+    Bytes of the 101 response accepting a WebSocket handshake
+    '''
+    return ('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n').encode('latin-1')
+
+
+def encode_frame(opcode, payload=b''):
+    '''
+    A whole unmasked frame
+    '''
+    length = len(payload)
+    if length < 126:
+        head = bytes((0x80 | opcode, length))
+    elif length < 1 << 16:
+        head = bytes((0x80 | opcode, 126)) + length.to_bytes(2, 'big')
+    else:
+        head = bytes((0x80 | opcode, 127)) + length.to_bytes(8, 'big')
+    return head + payload
+
+
+def close_frame(code, reason=''):
+    '''
+    A close frame with a status code
+    '''
+    return encode_frame(OP_CLOSE, code.to_bytes(2, 'big') + reason.encode()[:123])
+
+
+def event_frame(event):
+    '''
+    An events.Event as a text frame, built the first time it is sent and
+    then written as is to every other connection
+    '''
+    if event.frame is None:
+        event.frame = encode_frame(OP_TEXT, event.json.encode())
+    return event.frame
+
+
+def unmask(payload, mask):
+    '''
+    Undo the client's masking of a payload
+    '''
+    # xor the whole payload in one go rather than byte by byte
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+
+async def read_frame(reader):
+    '''
+    Read a client frame, returns (opcode, payload). Raises
+    asyncio.IncompleteReadError if the client goes away
+    '''
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    if first & 0x70:
+        raise ProtocolError(CLOSE_PROTOCOL_ERROR, 'no extensions were agreed')
+    if not second & 0x80:
+        raise ProtocolError(CLOSE_PROTOCOL_ERROR, 'client frames must be masked')
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), 'big')
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), 'big')
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(CLOSE_TOO_BIG, 'frame too big')
+    if opcode >= OP_CLOSE and (length > 125 or not first & 0x80):
+        raise ProtocolError(CLOSE_PROTOCOL_ERROR, 'bad control frame')
+    mask = await reader.readexactly(4)
+    payload = await reader.readexactly(length) if length else b''
+    return opcode, unmask(payload, mask)
+
+
+async def read_frames(reader, writer):
+    '''
+    Answer the client's pings and close until it closes the connection. Any
+    data the client sends is ignored
+    '''
+    try:
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == OP_PING:
+                writer.write(encode_frame(OP_PONG, payload))
+            elif opcode == OP_CLOSE:
+                writer.write(encode_frame(OP_CLOSE, payload[:2]))
+                return
+    except ProtocolError as err:
+        writer.write(close_frame(err.code, str(err)))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
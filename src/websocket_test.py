@@ -0,0 +1,76 @@
+'''
+WebSocket Test
+'''
+import asyncio
+import os
+import pytest
+import websocket
+from events import Event
+
+
+def masked(opcode, payload, fin=True):
+    '''
+    A frame as a client sends it
+    '''
+    mask = os.urandom(4)
+    head = bytes(((0x80 if fin else 0) | opcode,))
+    if len(payload) < 126:
+        head += bytes((0x80 | len(payload),))
+    else:
+        head += bytes((0x80 | 126,)) + len(payload).to_bytes(2, 'big')
+    return head + mask + bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+
+
+def read(frames):
+    '''
+    Read a frame from the bytes of frames
+    '''
+    async def go():
+        reader = asyncio.StreamReader()
+        reader.feed_data(frames)
+        reader.feed_eof()
+        return await websocket.read_frame(reader)
+    return asyncio.run(go())
+
+
+def test_accept_key():
+    # the example from RFC 6455
+    assert websocket.accept_key('dGhlIHNhbXBsZSBub25jZQ==') == 's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+    assert websocket.is_upgrade({'upgrade': 'websocket', 'connection': 'keep-alive, Upgrade'})
+    assert not websocket.is_upgrade({'connection': 'keep-alive'})
+
+
+def test_encode_frame():
+    assert websocket.encode_frame(websocket.OP_TEXT, b'hi') == b'\x81\x02hi'
+    medium = websocket.encode_frame(websocket.OP_TEXT, b'x' * 300)
+    assert medium[:4] == b'\x81\x7e\x01\x2c' and len(medium) == 304
+    large = websocket.encode_frame(websocket.OP_BINARY, b'x' * 70000)
+    assert large[:2] == b'\x82\x7f' and int.from_bytes(large[2:10], 'big') == 70000
+
+
+def test_event_frame_built_once():
+    event = Event(1, 'send', 5, '{"type": "send"}')
+    frame = websocket.event_frame(event)
+    assert frame == b'\x81\x10{"type": "send"}'
+    assert websocket.event_frame(event) is frame
+
+
+def test_read_frame():
+    assert read(masked(websocket.OP_TEXT, b'hello')) == (websocket.OP_TEXT, b'hello')
+    assert read(masked(websocket.OP_PING, b'')) == (websocket.OP_PING, b'')
+    payload = bytes(range(256)) * 2
+    assert read(masked(websocket.OP_BINARY, payload)) == (websocket.OP_BINARY, payload)
+
+
+def test_read_frame_errors():
+    # unmasked
+    with pytest.raises(websocket.ProtocolError):
+        read(b'\x81\x02hi')
+    # fragmented control frame
+    with pytest.raises(websocket.ProtocolError):
+        read(masked(websocket.OP_PING, b'', fin=False))
+    with pytest.raises(websocket.ProtocolError) as err:
+        read(b'\x82\xff' + (1 << 20).to_bytes(8, 'big'))
+    assert err.value.code == websocket.CLOSE_TOO_BIG
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(b'\x81')